@@ -60,6 +60,17 @@ CONSOLE_ENCODING = None
 
 # db options
 MAX_FETCH_COUNT = None
+ASYNC_SESSION_WORKERS = 10  # max number of concurrent `async with db_session` blocks, each uses its own thread
+GATHER_WORKERS = 10  # max number of queries executed in parallel by gather()
+
+# maximum sizes of internal ORM caches, None means unlimited
+TRANSLATOR_CACHE_SIZE = 5000  # per Database object
+SQL_CACHE_SIZE = 10000  # per Database object
+SQLITE_CACHED_STATEMENTS = 100  # size of sqlite3 statement cache of each connection, can be set by bind() too
+DECOMPILER_CACHE_SIZE = 5000
+EXTRACTORS_CACHE_SIZE = 5000
+RAW_SQL_CACHE_SIZE = 1000
+STRING2AST_CACHE_SIZE = 1000
 
 # used for select(...).show()
 CONSOLE_WIDTH = 80
@@ -5,7 +5,8 @@ from functools import update_wrapper
 
 from pony.thirdparty.compiler import ast
 
-from pony.utils import HashableDict, throw, copy_ast
+from pony import options
+from pony.utils import HashableDict, throw, copy_ast, LRUCache
 
 class TranslationError(Exception): pass
 
@@ -352,7 +353,7 @@ class PreTranslator(ASTTranslator):
                 if node.dstar_args is not None and not node.dstar_args.constant: return
                 node.constant = True
 
-extractors_cache = {}
+extractors_cache = LRUCache(options.EXTRACTORS_CACHE_SIZE)
 
 def create_extractors(code_key, tree, globals, locals, special_functions, const_functions, outer_names=()):
     result = extractors_cache.get(code_key)
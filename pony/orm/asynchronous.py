@@ -0,0 +1,98 @@
+from __future__ import absolute_import, print_function, division
+
+import asyncio, contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from pony import options
+from pony.orm import core
+from pony.utils import throw
+
+class SessionWorkers(object):
+    # Each `async with db_session` block exclusively uses one worker thread for all its database calls.
+    # This way the thread-local connection of the pool is never shared between concurrent sessions,
+    # and the number of workers limits the number of connections used by async code
+    def __init__(workers, max_workers=None):
+        workers.max_workers = max_workers
+        workers.lock = Lock()
+        workers.idle = []
+        workers.count = 0
+        workers.waiters = deque()
+    async def acquire(workers):
+        with workers.lock:
+            if workers.idle: return workers.idle.pop()
+            max_workers = workers.max_workers or options.ASYNC_SESSION_WORKERS
+            if workers.count < max_workers:
+                workers.count += 1
+                return ThreadPoolExecutor(1, thread_name_prefix='pony-session-worker')
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            workers.waiters.append((loop, future))
+        try: return await future
+        except asyncio.CancelledError:
+            # the task can be cancelled after hand_over() has already passed the worker to it
+            if future.done() and not future.cancelled(): workers.release(future.result())
+            raise
+    def release(workers, worker):
+        with workers.lock:
+            if not workers.waiters:
+                workers.idle.append(worker)
+                return
+            loop, future = workers.waiters.popleft()
+        def hand_over():
+            if future.cancelled(): workers.release(worker)
+            else: future.set_result(worker)
+        loop.call_soon_threadsafe(hand_over)
+
+session_workers = SessionWorkers()
+
+def run_in_worker(worker, func, *args, **kwargs):
+    context = contextvars.copy_context()  # contains the state of the current async db_session
+    local = core.local
+    debug, show_values = local.debug, local.show_values
+    def call():
+        prev_debug, prev_show_values = local.debug, local.show_values
+        local.debug, local.show_values = debug, show_values
+        local.session_worker = worker
+        try: return context.run(func, *args, **kwargs)
+        finally:
+            local.session_worker = None
+            local.debug, local.show_values = prev_debug, prev_show_values
+    return asyncio.get_event_loop().run_in_executor(worker, call)
+
+def run_async(func, *args, **kwargs):
+    worker = core.local.session_state.worker
+    if worker is None: throw(core.TransactionError, 'Async database calls require `async with db_session`')
+    return run_in_worker(worker, func, *args, **kwargs)
+
+async def enter_session(db_session):
+    local = core.local
+    if local.db_context_counter:
+        db_session._enter()  # nested db_session is ignored
+        return
+    worker = await session_workers.acquire()
+    state = core.SessionState()
+    state.worker = worker
+    state.token = core.session_state_var.set(state)
+    try: db_session._enter()
+    except:
+        core.session_state_var.reset(state.token)
+        session_workers.release(worker)
+        raise
+
+async def exit_session(db_session, exc_type=None, exc=None, tb=None):
+    local = core.local
+    state = local.session_state
+    local.db_context_counter -= 1
+    try:
+        if not local.db_context_counter:
+            assert local.db_session is db_session
+            if state.worker is None: db_session._commit_or_rollback(exc_type, exc, tb)
+            else: await run_in_worker(state.worker, db_session._commit_or_rollback, exc_type, exc, tb)
+    finally:
+        if db_session.sql_debug is not None:
+            local.pop_debug_state()
+        if not state.db_context_counter and state.token is not None:
+            core.session_state_var.reset(state.token)
+            session_workers.release(state.worker)
@@ -2,11 +2,13 @@ from __future__ import absolute_import, print_function, division
 from pony.py23compat import PY2, izip, imap, iteritems, itervalues, items_list, values_list, xrange, cmp, \
                             basestring, unicode, buffer, int_types, builtins, with_metaclass
 
-import json, re, sys, types, datetime, logging, itertools, warnings, inspect
+import json, re, sys, types, datetime, logging, itertools, warnings, inspect, base64, gc
 from operator import attrgetter, itemgetter
 from itertools import chain, starmap, repeat
 from time import time
 from decimal import Decimal
+from array import array
+from uuid import UUID
 from random import shuffle, randint, random
 from threading import Lock, RLock, currentThread as current_thread, _MainThread
 from contextlib import contextmanager
@@ -19,20 +21,21 @@ from pony.thirdparty.compiler import ast, parse
 
 import pony
 from pony import options
-from pony.orm.decompiling import decompile
+from pony.orm import decompiling, asttranslation, ormtypes
+from pony.orm.decompiling import decompile, get_loaded_names
 from pony.orm.ormtypes import (
-    LongStr, LongUnicode, numeric_types, raw_sql, RawSQL, normalize, Json, TrackedValue, QueryType,
+    LongStr, LongUnicode, numeric_types, raw_sql, RawSQL, normalize, Json, TrackedValue, QueryType, SetType,
     Array, IntArray, StrArray, FloatArray
     )
 from pony.orm.asttranslation import ast2src, create_extractors, TranslationError
 from pony.orm.dbapiprovider import (
     DBAPIProvider, DBException, Warning, Error, InterfaceError, DatabaseError, DataError,
-    OperationalError, IntegrityError, InternalError, ProgrammingError, NotSupportedError
+    OperationalError, IntegrityError, InternalError, ProgrammingError, NotSupportedError, PoolTimeoutError
     )
 from pony import utils
 from pony.utils import localbase, decorator, cut_traceback, cut_traceback_depth, throw, reraise, truncate_repr, \
      get_lambda_args, pickle_ast, unpickle_ast, deprecated, import_module, parse_expr, is_ident, tostring, strjoin, \
-     between, concat, coalesce, HashableDict, deref_proxy, deduplicate
+     between, concat, coalesce, HashableDict, deref_proxy, deduplicate, LRUCache
 
 __all__ = [
     'pony',
@@ -40,7 +43,7 @@ __all__ = [
     'DBException', 'RowNotFound', 'MultipleRowsFound', 'TooManyRowsFound',
 
     'Warning', 'Error', 'InterfaceError', 'DatabaseError', 'DataError', 'OperationalError',
-    'IntegrityError', 'InternalError', 'ProgrammingError', 'NotSupportedError',
+    'IntegrityError', 'InternalError', 'ProgrammingError', 'NotSupportedError', 'PoolTimeoutError',
 
     'OrmError', 'ERDiagramError', 'DBSchemaError', 'MappingError', 'BindingError',
     'TableDoesNotExist', 'TableIsNotEmpty', 'ConstraintError', 'CacheIndexError',
@@ -55,7 +58,7 @@ __all__ = [
 
     'PrimaryKey', 'Required', 'Optional', 'Set', 'Discriminator',
     'composite_key', 'composite_index',
-    'flush', 'commit', 'rollback', 'db_session', 'with_transaction', 'make_proxy',
+    'flush', 'commit', 'rollback', 'db_session', 'with_transaction', 'make_proxy', 'run_async', 'gather',
 
     'LongStr', 'LongUnicode', 'Json', 'IntArray', 'StrArray', 'FloatArray',
 
@@ -130,8 +133,8 @@ def args2str(args):
     elif isinstance(args, dict):
         return '{%s}' % ', '.join('%s:%s' % (repr(key), repr(val)) for key, val in sorted(iteritems(args)))
 
-adapted_sql_cache = {}
-string2ast_cache = {}
+adapted_sql_cache = LRUCache(options.RAW_SQL_CACHE_SIZE)
+string2ast_cache = LRUCache(options.STRING2AST_CACHE_SIZE)
 
 class OrmError(Exception): pass
 
@@ -292,10 +295,12 @@ class PrefetchContext(object):
         self.attrs_to_prefetch_dict = defaultdict(set)
         self.entities_to_prefetch = set()
         self.relations_to_prefetch_cache = {}
+        self.attrs_to_join = set()  # to-one relations which are loaded by LEFT JOIN in the main query
     def copy(self):
         result = PrefetchContext(self.database)
         result.attrs_to_prefetch_dict = self.attrs_to_prefetch_dict.copy()
         result.entities_to_prefetch = self.entities_to_prefetch.copy()
+        result.attrs_to_join = self.attrs_to_join.copy()
         return result
     def __enter__(self):
         local.prefetch_context_stack.append(self)
@@ -321,19 +326,56 @@ class PrefetchContext(object):
         return result
 
 
+try: from contextvars import ContextVar
+except ImportError: session_state_var = None
+else: session_state_var = ContextVar('pony_session_state')
+
+class SessionState(object):
+    # State of db_session. Usually it belongs to the thread, but each `async with db_session`
+    # keeps its own state in context variable, so asyncio tasks do not see sessions of each other
+    __slots__ = 'db2cache', 'db_context_counter', 'db_session', 'prefetch_context_stack', \
+                'user_groups_cache', 'user_roles_cache', 'worker', 'token'
+    def __init__(state):
+        state.db2cache = {}
+        state.db_context_counter = 0
+        state.db_session = None
+        state.prefetch_context_stack = []
+        state.user_groups_cache = {}
+        state.user_roles_cache = defaultdict(dict)
+        state.worker = state.token = None
+
+def _session_state_property(name):
+    getter = attrgetter(name)
+    def fget(local):
+        return getter(local.session_state)
+    def fset(local, value):
+        setattr(local.session_state, name, value)
+    return property(fget, fset)
+
 class Local(localbase):
     def __init__(local):
         local.debug = False
         local.show_values = None
         local.debug_stack = []
-        local.db2cache = {}
-        local.db_context_counter = 0
-        local.db_session = None
-        local.prefetch_context_stack = []
+        local.thread_session_state = SessionState()
+        local.session_worker = None  # worker of `async with db_session` which is running in the current thread
         local.current_user = None
         local.perms_context = None
-        local.user_groups_cache = {}
-        local.user_roles_cache = defaultdict(dict)
+    if session_state_var is None:
+        @property
+        def session_state(local):
+            return local.thread_session_state
+    else:
+        @property
+        def session_state(local):
+            state = session_state_var.get(None)
+            return state if state is not None else local.thread_session_state
+    db2cache = _session_state_property('db2cache')
+    db_context_counter = _session_state_property('db_context_counter')
+    db_session = _session_state_property('db_session')
+    prefetch_context_stack = _session_state_property('prefetch_context_stack')
+    user_groups_cache = _session_state_property('user_groups_cache')
+    user_roles_cache = _session_state_property('user_roles_cache')
     @property
     def prefetch_context(local):
         if local.prefetch_context_stack:
@@ -418,20 +460,130 @@ def rollback():
     finally:
         del exceptions
 
+def _get_asynchronous_module():
+    if session_state_var is None: throw(NotImplementedError, 'Async API requires Python 3.7 or newer')
+    from pony.orm import asynchronous
+    return asynchronous
+
+def run_async(func, *args, **kwargs):
+    # returns awaitable which calls func in the worker thread of the current `async with db_session` block
+    return _get_asynchronous_module().run_async(func, *args, **kwargs)
+
+def check_session_thread():
+    # Connection of `async with db_session` belongs to its worker thread. Database access made directly
+    # on the event loop thread would use the connection of the loop thread, and could block the loop
+    # forever on a lock which is held by another task across an `await`
+    worker = local.session_state.worker
+    if worker is not None and local.session_worker is not worker: throw(TransactionError,
+        'Database access inside `async with db_session` should be performed in the worker of the session. '
+        'Use `await query.fetch_async()`, `await obj.flush_async()` or `await run_async(func)`')
+
+class GatheredObject(object):
+    # loaded state of an object fetched by gather() worker, it is merged into the identity map of the caller
+    __slots__ = 'entity', 'raw_pkval', 'dbvals'
+    def __init__(self, entity, raw_pkval, dbvals):
+        self.entity = entity
+        self.raw_pkval = raw_pkval
+        self.dbvals = dbvals  # None for referenced objects whose state is not transferred
+
+def _export_gathered(value, with_state=True):
+    if isinstance(value, Entity):
+        obj = value
+        if not with_state: return GatheredObject(obj.__class__, obj._get_raw_pkval_(), None)
+        dbvals = {}
+        for attr in obj._vals_:
+            if attr.pk_offset is not None or attr.is_collection: continue
+            dbval = obj._get_dbval_(attr)
+            if dbval is NOT_LOADED: continue
+            if attr.reverse and dbval is not None: dbval = _export_gathered(dbval, False)
+            dbvals[attr.name] = dbval
+        return GatheredObject(obj.__class__, obj._get_raw_pkval_(), dbvals)
+    if isinstance(value, QueryResult):
+        result = QueryResult.__new__(QueryResult)
+        items = [ _export_gathered(item) for item in value._get_items() ]
+        result.__setstate__((items, value._limit, value._offset, value._expr_type, value._col_names))
+        result._query = value._query
+        return result
+    if isinstance(value, list): return [ _export_gathered(item) for item in value ]
+    if type(value) is tuple: return tuple(_export_gathered(item) for item in value)
+    if type(value) is dict: return {key: _export_gathered(val) for key, val in iteritems(value)}
+    return value
+
+def _import_gathered(value):
+    if isinstance(value, GatheredObject):
+        entity = value.entity
+        obj = entity._get_by_raw_pkval_(value.raw_pkval)
+        if value.dbvals is None or obj._status_ in created_or_deleted_statuses: return obj
+        avdict = {}
+        for attrname, dbval in iteritems(value.dbvals):
+            if isinstance(dbval, GatheredObject): dbval = _import_gathered(dbval)
+            avdict[entity._adict_[attrname]] = dbval
+        obj._db_set_(avdict)
+        return obj
+    if isinstance(value, QueryResult):
+        value._items = [ _import_gathered(item) for item in value._items ]
+        return value
+    if isinstance(value, list): return [ _import_gathered(item) for item in value ]
+    if type(value) is tuple: return tuple(_import_gathered(item) for item in value)
+    if type(value) is dict: return {key: _import_gathered(val) for key, val in iteritems(value)}
+    return value
+
+def _gather_call(func, debug, show_values):
+    prev_debug, prev_show_values = local.debug, local.show_values
+    local.debug, local.show_values = debug, show_values
+    try:
+        with db_session(readonly=True):
+            return _export_gathered(func())
+    finally: local.debug, local.show_values = prev_debug, prev_show_values
+
+gather_executor = None
+gather_lock = Lock()
+
+def _get_gather_executor():
+    global gather_executor
+    with gather_lock:
+        if gather_executor is None:
+            try: from concurrent.futures import ThreadPoolExecutor
+            except ImportError: throw(NotImplementedError, 'gather() requires concurrent.futures module')
+            # worker threads are reused, so their thread-local pooled connections are reused too
+            gather_executor = ThreadPoolExecutor(options.GATHER_WORKERS)
+        return gather_executor
+
+@cut_traceback
+def gather(*funcs):
+    # runs independent read-only queries in parallel, each in a separate thread with its own connection
+    # and db_session, and returns their results with all objects merged into the current db_session
+    if not funcs: return []
+    if local.db_session is None: throw(TransactionError, 'gather() can be called inside db_session only')
+    for cache in itervalues(local.db2cache):
+        if cache.modified: throw(TransactionError,
+            'gather() cannot be called when db_session has unsaved changes, because they are not visible '
+            'to queries executed on other connections. Call commit() before gather()')
+    for func in funcs:
+        if not callable(func): throw(TypeError, 'Callable expected, got: %r' % func)
+    executor = _get_gather_executor()
+    futures = [ executor.submit(_gather_call, func, local.debug, local.show_values) for func in funcs ]
+    results = [ future.result() for future in futures ]
+    return [ _import_gathered(result) for result in results ]
+
 select_re = re.compile(r'\s*select\b', re.IGNORECASE)
 
 class DBSessionContextManager(object):
     __slots__ = 'retry', 'retry_exceptions', 'allowed_exceptions', \
-                'immediate', 'ddl', 'serializable', 'strict', 'optimistic', \
+                'immediate', 'ddl', 'serializable', 'strict', 'optimistic', 'readonly', \
                 'sql_debug', 'show_values'
     def __init__(db_session, retry=0, immediate=False, ddl=False, serializable=False, strict=False, optimistic=True,
-                 retry_exceptions=(TransactionError,), allowed_exceptions=(), sql_debug=None, show_values=None):
+                 retry_exceptions=(TransactionError,), allowed_exceptions=(), sql_debug=None, show_values=None,
+                 readonly=False):
         if retry != 0:
             if type(retry) is not int: throw(TypeError,
                 "'retry' parameter of db_session must be of integer type. Got: %s" % type(retry))
             if retry < 0: throw(TypeError,
                 "'retry' parameter of db_session must not be negative. Got: %d" % retry)
             if ddl: throw(TypeError, "'ddl' and 'retry' parameters of db_session cannot be used together")
+        if readonly and (immediate or ddl or serializable or not optimistic): throw(TypeError,
+            "'readonly' parameter of db_session cannot be used together with "
+            "'immediate', 'ddl', 'serializable' or 'optimistic=False'")
         if not callable(allowed_exceptions) and not callable(retry_exceptions):
             for e in allowed_exceptions:
                 if e in retry_exceptions: throw(TypeError,
@@ -447,6 +599,7 @@ class DBSessionContextManager(object):
         db_session.allowed_exceptions = allowed_exceptions
         db_session.sql_debug = sql_debug
         db_session.show_values = show_values
+        db_session.readonly = readonly
     def __call__(db_session, *args, **kwargs):
         if not args and not kwargs: return db_session
         if len(args) > 1: throw(TypeError,
@@ -462,6 +615,12 @@ class DBSessionContextManager(object):
         if db_session.retry != 0: throw(TypeError,
             "@db_session can accept 'retry' parameter only when used as decorator and not as context manager")
         db_session._enter()
+    def __aenter__(db_session):
+        if db_session.retry != 0: throw(TypeError,
+            "db_session can accept 'retry' parameter only when used as decorator and not as context manager")
+        return _get_asynchronous_module().enter_session(db_session)
+    def __aexit__(db_session, exc_type=None, exc=None, tb=None):
+        return _get_asynchronous_module().exit_session(db_session, exc_type, exc, tb)
     def _enter(db_session):
         if local.db_session is None:
             assert not local.db_context_counter
@@ -748,8 +907,8 @@ class Database(object):
         self._insert_cache = {}
 
         # ER-diagram related stuff:
-        self._translator_cache = {}
-        self._constructed_sql_cache = {}
+        self._translator_cache = LRUCache(options.TRANSLATOR_CACHE_SIZE)
+        self._constructed_sql_cache = LRUCache(options.SQL_CACHE_SIZE)
         self.entities = {}
         self.schema = None
         self.Entity = type.__new__(EntityMeta, 'Entity', (Entity,), {})
@@ -763,6 +922,12 @@ class Database(object):
         self.on_connect = OnConnectDecorator(self, None)
         self._on_connect_funcs = []
         self.provider = self.provider_name = None
+        self.replicas = []
+        self.replica_routing = 'round_robin'  # or 'least_connections'
+        self.replica_autocommit_reads = False  # opt-in: reads of other sessions before the first write go to replicas too
+        self._replica_counter = itertools.count()
+        self._replica_lock = Lock()
+        self._replica_connections = {}  # replica provider -> number of connections in use
         if args or kwargs: self._bind(*args, **kwargs)
     def call_on_connect(database, con):
         for func, provider in database._on_connect_funcs:
@@ -794,6 +959,43 @@ class Database(object):
             provider_cls = provider_module.provider_cls
         kwargs['pony_call_on_connect'] = self.call_on_connect
         self.provider = provider_cls(*args, **kwargs)
+    @cut_traceback
+    def bind_replica(self, *args, **kwargs):
+        # argument 'self' cannot be named 'database', because 'database' can be in kwargs
+        provider = self.provider
+        if provider is None: throw(BindingError, 'Primary provider should be bound before replicas')
+        if args and isinstance(args[0], basestring) and args[0] == self.provider_name: args = args[1:]
+        elif args and args[0] is provider.__class__: args = args[1:]
+        elif 'provider' in kwargs:
+            provider_name = kwargs.pop('provider')
+            if provider_name != self.provider_name and provider_name is not provider.__class__: throw(TypeError,
+                'Replica should use the same provider as the primary database: %s' % self.provider_name)
+        kwargs['pony_call_on_connect'] = self.call_on_connect
+        replica = provider.__class__(*args, **kwargs)
+        with self._replica_lock:
+            self._replica_connections[replica] = 0
+            self.replicas.append(replica)
+        return replica
+    def _get_provider_for_connection(database, cache):
+        # writes, for_update and transactions go to the primary, reads can go to replicas
+        provider = database.provider
+        replicas = database.replicas
+        if not replicas or cache.immediate or cache.modified or cache.in_transaction: return provider
+        db_session = cache.db_session
+        readonly = db_session is not None and db_session.readonly
+        if not readonly and not database.replica_autocommit_reads: return provider
+        routing = database.replica_routing
+        with database._replica_lock:
+            if routing == 'round_robin': replica = replicas[next(database._replica_counter) % len(replicas)]
+            elif routing == 'least_connections':
+                connections = database._replica_connections
+                replica = min(replicas, key=connections.__getitem__)
+            else: throw(ValueError, 'Unknown replica routing: %r' % routing)
+            database._replica_connections[replica] += 1
+        return replica
+    def _replica_released(database, replica):
+        with database._replica_lock:
+            database._replica_connections[replica] -= 1
     @property
     def last_sql(database):
         return database._dblocal.last_sql
@@ -830,6 +1032,25 @@ class Database(object):
         with database._global_stats_lock:
             return {sql: stat.copy() for sql, stat in iteritems(database._global_stats)}
     @property
+    def cache_stats(database):
+        # all caches except translator and sql are global and shared between Database objects
+        return {
+            'translator': database._translator_cache.stats(),
+            'sql': database._constructed_sql_cache.stats(),
+            'decompiler': decompiling.ast_cache.stats(),
+            'extractors': asttranslation.extractors_cache.stats(),
+            'raw_sql': ormtypes.raw_sql_cache.stats(),
+            'adapted_sql': adapted_sql_cache.stats(),
+            'string2ast': string2ast_cache.stats()
+        }
+    @property
+    def pool_stats(database):
+        # None if the provider uses the default thread-local connection pool
+        provider = database.provider
+        if provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
+        shared = getattr(provider.pool, 'shared', None)
+        return shared.stats() if shared is not None else None
+    @property
     def global_stats_lock(database):
         deprecated(3, "global_stats_lock is deprecated, just use global_stats property without any locking")
         return database._global_stats_lock
@@ -851,6 +1072,51 @@ class Database(object):
         cache = local.db2cache.get(database)
         if cache is not None: cache.rollback()
         provider.disconnect()
+        for replica in database.replicas: replica.disconnect()
+    @cut_traceback
+    def warmup(database, *queries):
+        # Translates queries and builds their SQL without executing them, so pre-fork servers
+        # can fill translator and SQL caches in the master process. Accepts queries, functions
+        # without arguments which return a query, entities (primary key lookup) and modules
+        if database.schema is None: throw(MappingError, 'Mapping is not generated yet')
+        result = []
+        for x in queries:
+            if isinstance(x, types.ModuleType):
+                for name, value in sorted(iteritems(vars(x))):
+                    if isinstance(value, EntityMeta): value_database = value._database_
+                    elif isinstance(value, Query): value_database = value._database
+                    elif isinstance(value, QueryResult): value_database = value._query._database
+                    else: continue
+                    if value_database is database: result.append(database._warmup(value))
+            else: result.append(database._warmup(x))
+        return result
+    def _warmup(database, x):
+        if isinstance(x, types.FunctionType):
+            x = x()
+            if not isinstance(x, (Query, QueryResult)):
+                throw(TypeError, 'Warmup function should return a query. Got: %s' % truncate_repr(x))
+        if isinstance(x, EntityMeta):
+            if x._database_ is not database: throw(TypeError, 'Entity %s belongs to another database' % x.__name__)
+            query_attrs = {attr: False for attr in x._pk_attrs_}
+            sql, adapter, attr_offsets = x._construct_sql_(query_attrs)
+            return sql
+        if isinstance(x, QueryResult): query, limit, offset = x._query, x._limit, x._offset
+        elif isinstance(x, Query): query, limit, offset = x, None, None
+        else: throw(TypeError, 'Query, function, entity or module expected. Got: %s' % truncate_repr(x))
+        if query._database is not database: throw(TypeError, 'Query belongs to another database')
+        with query._prefetch_context:
+            sql_key, sql, adapter, attr_offsets = query._construct_sql(limit, offset)
+        return sql
+    @cut_traceback
+    def prepare_for_fork(database, freeze=True):
+        # Should be called in the master process of pre-fork server right before forking workers
+        if local.db_context_counter: throw(TransactionError, 'prepare_for_fork() cannot be called inside of db_session')
+        database.disconnect()
+        decompiling.save_translation_cache()
+        if freeze and hasattr(gc, 'freeze'):
+            # moves all current objects to permanent generation, so GC in workers does not touch their pages
+            gc.collect()
+            gc.freeze()
     def _get_cache(database):
         if database.provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
         cache = local.db2cache.get(database)
@@ -920,6 +1186,11 @@ class Database(object):
         result = cursor.fetchone()
         return bool(result)
     @cut_traceback
+    def compile(database, func, limit=None, offset=None):
+        # func receives query parameters and returns a query, e.g. lambda x: select(p for p in Person if p.age > x)
+        if not isinstance(func, types.FunctionType): throw(TypeError, 'Function expected. Got: %r' % func)
+        return CompiledQuery(database, func, limit, offset)
+    @cut_traceback
     def insert(database, table_name, returning=None, **kwargs):
         table_name = database._get_table_name(table_name)
         if database.provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
@@ -938,21 +1209,47 @@ class Database(object):
             return database._exec_sql(sql, arguments, returning_id=True, start_transaction=True)
         cursor = database._exec_sql(sql, arguments, start_transaction=True)
         return getattr(cursor, 'lastrowid', None)
+    @cut_traceback
+    def copy_into(database, entity, rows, batch_size=10000):
+        # Bulk load using COPY ... FROM STDIN where the provider supports it, falls back to insert_many() otherwise.
+        # Rows have the same format as in Entity.insert_many()
+        if not isinstance(entity, EntityMeta) or entity._database_ is not database:
+            throw(TypeError, 'Entity of this database expected. Got: %r' % entity)
+        if database.provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
+        if not database.provider.copy_from_support: return entity.insert_many(rows, batch_size)
+        if batch_size < 1: throw(ValueError, 'batch_size must be positive. Got: %r' % batch_size)
+        batches = {}
+        count = 0
+        for avdict in entity._iter_insert_rows_(rows, 'copy_into'):
+            attrs, values, pkval, raw_vals = entity._get_insert_many_values_(avdict)
+            batch = batches.get(attrs)
+            if batch is None: batch = batches[attrs] = []
+            batch.append((values, raw_vals))
+            count += 1
+            if len(batch) >= batch_size:
+                entity._copy_many_batch_(attrs, batch)
+                del batch[:]
+        for attrs, batch in iteritems(batches):
+            if batch: entity._copy_many_batch_(attrs, batch)
+        if count: database._get_cache().query_results.clear()
+        return count
     def _ast2sql(database, sql_ast):
         sql, adapter = database.provider.ast2sql(sql_ast)
         return sql, adapter
-    def _exec_sql(database, sql, arguments=None, returning_id=False, start_transaction=False):
+    def _exec_sql(database, sql, arguments=None, returning_id=False, start_transaction=False,
+                  server_side_cursor=False, withhold=False):
         cache = database._get_cache()
         if start_transaction: cache.immediate = True
         connection = cache.prepare_connection_for_query_execution()
-        cursor = connection.cursor()
+        provider = cache.provider
+        cursor = provider.server_side_cursor(connection, withhold) if server_side_cursor else connection.cursor()
         if local.debug: log_sql(sql, arguments)
-        provider = database.provider
         t = time()
         try: new_id = provider.execute(cursor, sql, arguments, returning_id)
         except Exception as e:
             connection = cache.reconnect(e)
-            cursor = connection.cursor()
+            provider = cache.provider
+            cursor = provider.server_side_cursor(connection, withhold) if server_side_cursor else connection.cursor()
             if local.debug: log_sql(sql, arguments)
             t = time()
             new_id = provider.execute(cursor, sql, arguments, returning_id)
@@ -963,11 +1260,12 @@ class Database(object):
         if PY2 and type(new_id) is long: new_id = int(new_id)
         return new_id
     @cut_traceback
-    def generate_mapping(database, filename=None, check_tables=True, create_tables=False):
+    def generate_mapping(database, filename=None, check_tables=True, create_tables=False, translation_cache=None):
         provider = database.provider
         if provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
         if database.schema: throw(BindingError, 'Mapping was already generated')
         if filename is not None: throw(NotImplementedError)
+        if translation_cache is not None: decompiling.use_translation_cache(translation_cache)
         schema = database.schema = provider.dbschema_cls(provider)
         entities = list(sorted(database.entities.values(), key=attrgetter('_id_')))
         for entity in entities:
@@ -1747,8 +2045,10 @@ class SessionCache(object):
         cache.objects = set()
         cache.indexes = defaultdict(dict)
         cache.seeds = defaultdict(set)
+        cache.pending_objects = {}
         cache.max_id_cache = {}
         cache.collection_statistics = {}
+        cache.count_statistics = {}
         cache.for_update = set()
         cache.noflush_counter = 0
         cache.modified_collections = defaultdict(set)
@@ -1760,6 +2060,7 @@ class SessionCache(object):
         cache.db_session = db_session = local.db_session
         cache.immediate = db_session is not None and db_session.immediate
         cache.connection = None
+        cache.provider = None  # provider of the current connection, it can be one of replicas
         cache.in_transaction = False
         cache.saved_fk_state = None
         cache.perm_cache = defaultdict(lambda : defaultdict(dict))  # user -> perm -> cls_or_attr_or_obj -> bool
@@ -1770,30 +2071,47 @@ class SessionCache(object):
         if cache.in_transaction: throw(ConnectionClosedError,
             'Transaction cannot be continued because database connection failed')
         database = cache.database
-        provider = database.provider
-        connection, is_new_connection = provider.connect()
-        if is_new_connection:
-            database.call_on_connect(connection)
+        provider = database._get_provider_for_connection(cache)
         try:
-            provider.set_transaction_mode(connection, cache)  # can set cache.in_transaction
+            connection, is_new_connection = provider.connect()
+            if is_new_connection:
+                database.call_on_connect(connection)
+            try:
+                provider.set_transaction_mode(connection, cache)  # can set cache.in_transaction
+            except:
+                provider.drop(connection, cache)
+                raise
         except:
-            provider.drop(connection, cache)
+            if provider is not database.provider: database._replica_released(provider)
             raise
 
         cache.connection = connection
+        cache.provider = provider
         return connection
     def reconnect(cache, exc):
-        provider = cache.database.provider
+        provider = cache.provider
         if exc is not None:
             exc = getattr(exc, 'original_exc', exc)
             if not provider.should_reconnect(exc): reraise(*sys.exc_info())
             if local.debug: log_orm('CONNECTION FAILED: %s' % exc)
             connection = cache.connection
             assert connection is not None
-            cache.connection = None
-            provider.drop(connection, cache)
+            cache.connection = cache.provider = None
+            try: provider.drop(connection, cache)
+            finally:
+                if provider is not cache.database.provider: cache.database._replica_released(provider)
         else: assert cache.connection is None
         return cache.connect()
+    def switch_to_primary(cache):
+        # replica connection is released before the first write or for_update query of the session
+        database = cache.database
+        provider = cache.provider
+        assert provider is not database.provider and not cache.in_transaction
+        connection = cache.connection
+        cache.connection = cache.provider = None
+        if local.debug: log_orm('SWITCH FROM REPLICA TO PRIMARY')
+        try: provider.release(connection, cache)
+        finally: database._replica_released(provider)
     def prepare_connection_for_query_execution(cache):
         db_session = local.db_session
         if db_session is not None and cache.db_session is None:
@@ -1806,10 +2124,15 @@ class SessionCache(object):
             cache.db_session = db_session
             cache.immediate = cache.immediate or db_session.immediate
         else: assert cache.db_session is db_session, (cache.db_session, db_session)
+        check_session_thread()
         connection = cache.connection
+        if connection is not None and cache.provider is not cache.database.provider \
+                and (cache.immediate or cache.modified):
+            cache.switch_to_primary()
+            connection = None
         if connection is None: connection = cache.connect()
         elif cache.immediate and not cache.in_transaction:
-            provider = cache.database.provider
+            provider = cache.provider
             try: provider.set_transaction_mode(connection, cache)  # can set cache.in_transaction
             except Exception as e: connection = cache.reconnect(e)
         if not cache.noflush_counter and cache.modified: cache.flush()
@@ -1823,11 +2146,12 @@ class SessionCache(object):
         except: transact_reraise(CommitException, [sys.exc_info()])
     def commit(cache):
         assert cache.is_alive
+        if cache.connection is not None: check_session_thread()
         try:
             if cache.modified: cache.flush()
             if cache.in_transaction:
                 assert cache.connection is not None
-                cache.database.provider.commit(cache.connection, cache)
+                cache.provider.commit(cache.connection, cache)
             cache.for_update.clear()
             cache.query_results.clear()
             cache.max_id_cache.clear()
@@ -1842,21 +2166,25 @@ class SessionCache(object):
     def close(cache, rollback=True):
         assert cache.is_alive
         if not rollback: assert not cache.in_transaction
+        if cache.connection is not None: check_session_thread()
         database = cache.database
         x = local.db2cache.pop(database); assert x is cache
         cache.is_alive = False
-        provider = database.provider
+        provider = cache.provider
         connection = cache.connection
         if connection is None: return
-        cache.connection = None
+        cache.connection = cache.provider = None
 
         try:
-            if rollback:
-                try: provider.rollback(connection, cache)
-                except:
-                    provider.drop(connection, cache)
-                    raise
-            provider.release(connection, cache)
+            try:
+                if rollback:
+                    try: provider.rollback(connection, cache)
+                    except:
+                        provider.drop(connection, cache)
+                        raise
+                provider.release(connection, cache)
+            finally:
+                if provider is not database.provider: database._replica_released(provider)
         finally:
             db_session = cache.db_session or local.db_session
             if db_session and db_session.strict:
@@ -1871,8 +2199,52 @@ class SessionCache(object):
                             if not setdata.is_fully_loaded: obj._vals_[attr] = None
 
             cache.objects = cache.objects_to_save = cache.saved_objects = cache.query_results \
-                = cache.indexes = cache.seeds = cache.for_update = cache.max_id_cache \
-                = cache.modified_collections = cache.collection_statistics = cache.dbvals_deduplication_cache = None
+                = cache.indexes = cache.seeds = cache.pending_objects = cache.for_update = cache.max_id_cache \
+                = cache.modified_collections = cache.collection_statistics = cache.count_statistics \
+                = cache.dbvals_deduplication_cache = None
+    def release_objects(cache, objects):
+        # detaches unmodified objects from the session, as if the db_session was over for them
+        indexes = cache.indexes
+        modified = set()
+        for objects_with_modified_collections in itervalues(cache.modified_collections):
+            modified.update(objects_with_modified_collections)
+        for obj in objects:
+            if obj._session_cache_ is not cache or obj in cache.for_update or obj in modified: continue
+            if obj._status_ not in ('loaded', 'inserted', 'updated'): continue
+            cache.objects.discard(obj)
+            cache.seeds[obj._pk_attrs_].discard(obj)
+            for pending in itervalues(cache.pending_objects.get(obj._root_, {})): pending.discard(obj)
+            indexes[obj._pk_attrs_].pop(obj._pkval_, None)
+            vals = obj._vals_
+            for attr in obj._simple_keys_:
+                val = vals.get(attr)
+                if val is not None and indexes[attr].get(val) is obj: del indexes[attr][val]
+            for attrs in obj._composite_keys_:
+                keyval = tuple(vals.get(attr) for attr in attrs)
+                if indexes[attrs].get(keyval) is obj: del indexes[attrs][keyval]
+            for attr, val in iteritems(vals):
+                if attr.is_collection:
+                    if not val.is_fully_loaded: vals[attr] = None
+                    continue
+                reverse = attr.reverse
+                if not isinstance(reverse, Set) or val is None or val._session_cache_ is not cache: continue
+                setdata = val._vals_.get(reverse)
+                if setdata is not None and obj in setdata:
+                    setdata.remove(obj)
+                    setdata.is_fully_loaded = False
+                    setdata.count = None
+            obj._dbvals_ = obj._session_cache_ = None
+    def get_pending_objects(cache, attr):
+        # objects of the session which may need the attribute to be loaded by the next batch. Like cache.seeds,
+        # the set is filled once from the identity map, and then _get_from_identity_map_() adds new objects to it
+        root = attr.entity._root_
+        pending_by_attr = cache.pending_objects.get(root)
+        if pending_by_attr is None: pending_by_attr = cache.pending_objects[root] = {}
+        pending = pending_by_attr.get(attr)
+        if pending is None:
+            pending = pending_by_attr[attr] = set(obj for obj in itervalues(cache.indexes[root._pk_attrs_])
+                                                  if obj._status_ not in created_or_deleted_statuses)
+        return pending
     @contextmanager
     def flush_disabled(cache):
         cache.noflush_counter += 1
@@ -1882,6 +2254,9 @@ class SessionCache(object):
         if cache.noflush_counter: return
         assert cache.is_alive
         assert not cache.saved_objects
+        db_session = cache.db_session
+        if db_session is not None and db_session.readonly and cache.modified:
+            throw(TransactionError, 'Changes cannot be saved in readonly db_session')
         prev_immediate = cache.immediate
         cache.immediate = True
         try:
@@ -1897,8 +2272,7 @@ class SessionCache(object):
                     for attr, (added, removed) in iteritems(modified_m2m):
                         if not removed: continue
                         attr.remove_m2m(removed)
-                    for obj in cache.objects_to_save:
-                        if obj is not None: obj._save_()
+                    cache.save_objects()
                     for attr, (added, removed) in iteritems(modified_m2m):
                         if not added: continue
                         attr.add_m2m(added)
@@ -1915,6 +2289,105 @@ class SessionCache(object):
         finally:
             if not cache.in_transaction:
                 cache.immediate = prev_immediate
+    def save_objects(cache):
+        # Consecutive created objects with the same insert shape are collected into a batch, and each batch is sent
+        # with a single executemany() call. Principal objects are saved before dependent objects as in _save_(),
+        # and a batch ends as soon as the next object has another shape or depends on an object of the batch,
+        # so rows are inserted in the same order as without batching.
+        # Consecutive modified objects are grouped in the same way by their UPDATE statement.
+        # Inserts and updates are collected in separate runs, and any other object terminates the current run,
+        # so the relative order of inserts, updates and deletes stays the same as in the objects_to_save list.
+        # Consecutive deleted objects of the same entity which don't need optimistic checks
+        # are grouped into DELETE ... WHERE pk IN (...) statements
+        inserts = []
+        insert_attrs = {}
+        updates = []
+        update_statement = []  # entity, sql and adapter of the current update batch
+        deletes = []
+
+        def save_inserts():
+            objects = inserts[:]
+            attrs = insert_attrs[objects[0]]
+            del inserts[:]
+            insert_attrs.clear()
+            if len(objects) > 1: objects[0].__class__._save_created_many_(attrs, objects)
+            else:
+                obj = objects[0]
+                obj._save_created_()
+                obj._save_finished_()
+
+        def save_updates():
+            entity, sql, adapter = update_statement
+            batch = updates[:]
+            del updates[:], update_statement[:]
+            entity._save_updated_many_(sql, adapter, batch)
+
+        def save_deletes():
+            objects = deletes[:]
+            del deletes[:]
+            objects[0].__class__._root_._save_deleted_many_(objects)
+
+        def add_to_delete_batch(obj):
+            if inserts: save_inserts()
+            if updates: save_updates()
+            if deletes and deletes[0].__class__._root_ is not obj.__class__._root_: save_deletes()
+            deletes.append(obj)
+
+        def add_to_batch(obj, dependent_objects):
+            if obj in dependent_objects:
+                chain = ' -> '.join(obj2.__class__.__name__ for obj2 in dependent_objects)
+                throw(UnresolvableCyclicDependency, 'Cannot save cyclic chain: ' + chain)
+            dependent_objects.append(obj)
+            principals = [ val for val in imap(obj._vals_.get, obj._attrs_with_columns_)
+                           if isinstance(val, Entity) and val._status_ == 'created' ]
+            for val in principals:
+                if val in insert_attrs or val._status_ != 'created': continue
+                if val._can_be_batched_(): add_to_batch(val, dependent_objects)
+                else:
+                    if inserts: save_inserts()
+                    val._save_(list(dependent_objects))
+            dependent_objects.pop()
+            attrs = obj._get_insert_values_(obj._pkval_ is None)[0]
+            if inserts:
+                last = inserts[-1]
+                if last.__class__ is not obj.__class__ or insert_attrs[last] != attrs \
+                        or any(val in insert_attrs for val in principals): save_inserts()
+            inserts.append(obj)
+            insert_attrs[obj] = attrs
+
+        def add_to_update_batch(obj):
+            if inserts: save_inserts()
+            if updates and obj._has_unsaved_principals_(): save_updates()
+            obj._save_principal_objects_(None)
+            sql, adapter, values, new_dbvals = obj._prepare_update_()
+            if sql is None:
+                obj._set_updated_(new_dbvals)
+                obj._save_finished_()
+                return
+            if updates and (update_statement[0] is not obj.__class__ or update_statement[1] != sql): save_updates()
+            if not updates: update_statement[:] = obj.__class__, sql, adapter
+            updates.append((obj, values, new_dbvals))
+
+        for obj in cache.objects_to_save:  # can shrink during iteration
+            if obj is None or obj in insert_attrs: continue
+            status = obj._status_
+            if status == 'created' and obj._can_be_batched_():
+                if updates: save_updates()
+                if deletes: save_deletes()
+                add_to_batch(obj, [])
+            elif status == 'modified' and obj._can_be_batched_update_():
+                if deletes: save_deletes()
+                add_to_update_batch(obj)
+            elif status == 'marked_to_delete' and obj._can_be_batched_delete_():
+                add_to_delete_batch(obj)
+            else:
+                if inserts: save_inserts()
+                if updates: save_updates()
+                if deletes: save_deletes()
+                obj._save_()
+        if inserts: save_inserts()
+        if updates: save_updates()
+        if deletes: save_deletes()
     def call_after_save_hooks(cache):
         saved_objects = cache.saved_objects
         cache.saved_objects = []
@@ -2019,7 +2492,7 @@ class Attribute(object):
     __slots__ = 'nullable', 'is_required', 'is_discriminator', 'is_unique', 'is_part_of_unique_index', \
                 'is_pk', 'is_collection', 'is_relation', 'is_basic', 'is_string', 'is_volatile', 'is_implicit', \
                 'id', 'pk_offset', 'pk_columns_offset', 'py_type', 'sql_type', 'entity', 'name', \
-                'lazy', 'lazy_sql_cache', 'args', 'auto', 'default', 'reverse', 'composite_keys', \
+                'lazy', 'lazy_sql_cache', 'nplus1_threshold', 'args', 'auto', 'default', 'reverse', 'composite_keys', \
                 'column', 'columns', 'col_paths', '_columns_checked', 'converters', 'kwargs', \
                 'cascade_delete', 'index', 'reverse_index', 'original_default', 'sql_default', 'py_check', 'hidden', \
                 'optimistic', 'fk_name', 'type_has_empty_value', 'interleave'
@@ -2088,7 +2561,8 @@ class Attribute(object):
         attr._columns_checked = False
         attr.composite_keys = []
         attr.lazy = kwargs.pop('lazy', getattr(py_type, 'lazy', False))
-        attr.lazy_sql_cache = None
+        attr.lazy_sql_cache = {}
+        attr.nplus1_threshold = kwargs.pop('nplus1_threshold', 1)
         attr.is_volatile = kwargs.pop('volatile', False)
         attr.optimistic = kwargs.pop('optimistic', None)
         attr.sql_default = kwargs.pop('sql_default', None)
@@ -2252,32 +2726,72 @@ class Attribute(object):
             reverse = attr.reverse
             assert reverse is not None and reverse.columns
             dbval = reverse.entity._find_in_db_({reverse : obj})
-            if dbval is None: obj._vals_[attr] = None
+            if dbval is None:
+                obj._preserve_dbval_(attr)
+                obj._vals_[attr] = None
             else: assert obj._vals_[attr] == dbval
             return dbval
 
         if attr.lazy:
             entity = attr.entity
             database = entity._database_
-            if not attr.lazy_sql_cache:
-                select_list = [ 'ALL' ] + [ [ 'COLUMN', None, column ] for column in attr.columns ]
-                from_list = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
-                pk_columns = entity._pk_columns_
-                pk_converters = entity._pk_converters_
-                criteria_list = [ [ converter.EQ, [ 'COLUMN', None, column ], [ 'PARAM', (i, None, None), converter ] ]
-                                  for i, (column, converter) in enumerate(izip(pk_columns, pk_converters)) ]
-                sql_ast = [ 'SELECT', select_list, from_list, [ 'WHERE' ] + criteria_list ]
-                sql, adapter = database._ast2sql(sql_ast)
-                offsets = tuple(xrange(len(attr.columns)))
-                attr.lazy_sql_cache = sql, adapter, offsets
-            else: sql, adapter, offsets = attr.lazy_sql_cache
-            arguments = adapter(obj._get_raw_pkval_())
-            cursor = database._exec_sql(sql, arguments)
-            row = cursor.fetchone()
-            dbval = attr.parse_value(row, offsets, cache.dbvals_deduplication_cache)
-            attr.db_set(obj, dbval)
+            counter = cache.collection_statistics.setdefault(attr, 0)
+            nplus1_threshold = attr.nplus1_threshold
+            objects = [ obj ]
+            if nplus1_threshold is not None and counter >= nplus1_threshold:
+                # the attribute is loaded for other objects of the session as well, to avoid N+1 queries
+                pending = cache.get_pending_objects(attr)
+                pending.discard(obj)
+                max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+                while pending and len(objects) < max_batch_size:
+                    obj2 = pending.pop()
+                    if attr in obj2._vals_ or not isinstance(obj2, entity): continue
+                    if obj2._session_cache_ is not cache or obj2._status_ in created_or_deleted_statuses: continue
+                    objects.append(obj2)
+            cache.collection_statistics[attr] = counter + 1
+            sql, adapter, offsets = attr.construct_lazy_sql(len(objects))
+            if len(objects) == 1:
+                arguments = adapter(obj._get_raw_pkval_())
+                cursor = database._exec_sql(sql, arguments)
+                row = cursor.fetchone()
+                dbval = attr.parse_value(row, offsets, cache.dbvals_deduplication_cache)
+                attr.db_set(obj, dbval)
+            else:
+                arguments = adapter(objects)
+                cursor = database._exec_sql(sql, arguments)
+                pk_len = len(entity._pk_columns_)
+                for row in cursor.fetchall():
+                    obj2 = entity._get_by_raw_pkval_(row[:pk_len])
+                    if attr in obj2._vals_: continue
+                    dbval = attr.parse_value(row, offsets, cache.dbvals_deduplication_cache)
+                    attr.db_set(obj2, dbval)
+                if attr not in obj._vals_: throw(UnrepeatableReadError,
+                                                 'Phantom object %s disappeared' % safe_repr(obj))
         else: obj._load_()
         return obj._vals_[attr]
+    def construct_lazy_sql(attr, batch_size=1):
+        cached_sql = attr.lazy_sql_cache.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        entity = attr.entity
+        database = entity._database_
+        pk_columns = entity._pk_columns_
+        pk_converters = entity._pk_converters_
+        select_list = [ 'ALL' ] + [ [ 'COLUMN', None, column ] for column in attr.columns ]
+        from_list = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
+        if batch_size == 1:
+            criteria_list = [ [ converter.EQ, [ 'COLUMN', None, column ], [ 'PARAM', (i, None, None), converter ] ]
+                              for i, (column, converter) in enumerate(izip(pk_columns, pk_converters)) ]
+            offsets = tuple(xrange(len(attr.columns)))
+        else:
+            select_list[1:1] = [ [ 'COLUMN', None, column ] for column in pk_columns ]
+            row_value_syntax = database.provider.translator_cls.row_value_syntax
+            criteria_list = construct_batchload_criteria_list(
+                None, pk_columns, pk_converters, batch_size, row_value_syntax)
+            offsets = tuple(xrange(len(pk_columns), len(pk_columns) + len(attr.columns)))
+        sql_ast = [ 'SELECT', select_list, from_list, [ 'WHERE' ] + criteria_list ]
+        sql, adapter = database._ast2sql(sql_ast)
+        cached_sql = attr.lazy_sql_cache[batch_size] = sql, adapter, offsets
+        return cached_sql
     @cut_traceback
     def __get__(attr, obj, cls=None):
         if obj is None: return attr
@@ -2331,6 +2845,7 @@ class Attribute(object):
                     objects_to_save.append(obj)
                     objects_to_save_needs_undo = True
                     cache.modified = True
+            obj._preserve_dbval_(attr)
             if not attr.reverse and not attr.is_part_of_unique_index:
                 obj._vals_[attr] = new_val
                 return
@@ -2388,7 +2903,7 @@ class Attribute(object):
         assert obj._status_ not in created_or_deleted_statuses
         assert attr.pk_offset is None
         if new_dbval is NOT_LOADED: assert is_reverse_call
-        old_dbval = obj._dbvals_.get(attr, NOT_LOADED)
+        old_dbval = obj._get_dbval_(attr)
         if old_dbval is not NOT_LOADED:
             if old_dbval == new_dbval or (
                     not attr.reverse and attr.converters[0].dbvals_equal(old_dbval, new_dbval)):
@@ -2407,8 +2922,7 @@ class Attribute(object):
                       % (attr.entity.__name__, old_dbval, attr.reverse)
             throw(UnrepeatableReadError, msg)
 
-        if new_dbval is NOT_LOADED: obj._dbvals_.pop(attr, None)
-        else: obj._dbvals_[attr] = new_dbval
+        obj._dbvals_[attr] = new_dbval
 
         wbit = bool(obj._wbits_ & bit)
         if not wbit:
@@ -2430,6 +2944,7 @@ class Attribute(object):
             else:
                 assert len(attr.converters) == 1
                 obj._vals_[attr] = attr.converters[0].dbval2val(new_dbval, obj)
+            obj._set_dbval_(attr, new_dbval)
 
         reverse = attr.reverse
         if not reverse: pass
@@ -2699,7 +3214,7 @@ class PrimaryKey(Required):
 
 class Collection(Attribute):
     __slots__ = 'table', 'wrapper_class', 'symmetric', 'reverse_column', 'reverse_columns', \
-                'nplus1_threshold', 'cached_load_sql', 'cached_add_m2m_sql', 'cached_remove_m2m_sql', \
+                'cached_load_sql', 'cached_add_m2m_sql', 'cached_remove_m2m_sql', \
                 'cached_count_sql', 'cached_empty_sql', 'reverse_fk_name'
     def __init__(attr, py_type, *args, **kwargs):
         if attr.__class__ is Collection: throw(TypeError, "'Collection' is abstract type")
@@ -2735,11 +3250,10 @@ class Collection(Attribute):
 
         attr.reverse_fk_name = kwargs.pop('reverse_fk_name', None)
 
-        attr.nplus1_threshold = kwargs.pop('nplus1_threshold', 1)
         attr.cached_load_sql = {}
         attr.cached_add_m2m_sql = None
         attr.cached_remove_m2m_sql = None
-        attr.cached_count_sql = None
+        attr.cached_count_sql = {}
         attr.cached_empty_sql = None
     def _init_(attr, entity, name):
         Attribute._init_(attr, entity, name)
@@ -2990,6 +3504,64 @@ class Set(Collection):
             setdata2.count = len(setdata2)
         cache.collection_statistics[attr] = counter + 1
         return setdata
+    def load_count(attr, obj, setdata):
+        cache = obj._session_cache_
+        entity = attr.entity
+        database = entity._database_
+        counter = cache.count_statistics.setdefault(attr, 0)
+        nplus1_threshold = attr.nplus1_threshold
+        objects = [ obj ]
+        if nplus1_threshold is not None and counter >= nplus1_threshold:
+            # counts of the collection are loaded for other objects of the session by a single GROUP BY query
+            pending = cache.get_pending_objects(attr)
+            pending.discard(obj)
+            max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+            while pending and len(objects) < max_batch_size:
+                obj2 = pending.pop()
+                if not isinstance(obj2, entity): continue
+                if obj2._session_cache_ is not cache or obj2._status_ in created_or_deleted_statuses: continue
+                setdata2 = obj2._vals_.get(attr)
+                if setdata2 is not None and setdata2.count is not None: continue
+                objects.append(obj2)
+        cache.count_statistics[attr] = counter + 1
+        sql, adapter = attr.construct_sql_count(len(objects))
+        with cache.flush_disabled():
+            if len(objects) == 1:
+                cursor = database._exec_sql(sql, adapter(obj._get_raw_pkval_()))
+                counts = { obj: cursor.fetchone()[0] }
+            else:
+                cursor = database._exec_sql(sql, adapter(objects))
+                pk_len = len(entity._pk_columns_)
+                counts = { entity._get_by_raw_pkval_(row[:pk_len]): row[pk_len] for row in cursor.fetchall() }
+        for obj2 in objects:
+            setdata2 = setdata if obj2 is obj else obj2._vals_.get(attr)
+            if setdata2 is None: setdata2 = obj2._vals_[attr] = SetData()
+            setdata2.count = counts.get(obj2, 0)
+            if setdata2.added: setdata2.count += len(setdata2.added)
+            if setdata2.removed: setdata2.count -= len(setdata2.removed)
+    def construct_sql_count(attr, batch_size=1):
+        cached_sql = attr.cached_count_sql.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        reverse = attr.reverse
+        database = attr.entity._database_
+        if not reverse.is_collection: table_name = reverse.entity._table_
+        else: table_name = attr.table
+        from_list = [ 'FROM', [ None, 'TABLE', table_name ] ]
+        if batch_size == 1:
+            where_list = [ 'WHERE' ]
+            for i, (column, converter) in enumerate(izip(reverse.columns, reverse.converters)):
+                where_list.append([ converter.EQ, [ 'COLUMN', None, column ], [ 'PARAM', (i, None, None), converter ] ])
+            sql_ast = [ 'SELECT', [ 'AGGREGATES', [ 'COUNT', None ] ], from_list, where_list ]
+        else:
+            columns = [ [ 'COLUMN', None, column ] for column in reverse.columns ]
+            row_value_syntax = database.provider.translator_cls.row_value_syntax
+            criteria_list = construct_batchload_criteria_list(
+                None, reverse.columns, reverse.converters, batch_size, row_value_syntax)
+            sql_ast = [ 'SELECT', [ 'AGGREGATES' ] + columns + [ [ 'COUNT', None ] ], from_list,
+                        [ 'WHERE' ] + criteria_list, [ 'GROUP_BY' ] + columns ]
+        sql, adapter = database._ast2sql(sql_ast)
+        cached_sql = attr.cached_count_sql[batch_size] = sql, adapter
+        return cached_sql
     def construct_sql_m2m(attr, batch_size=1, items_count=0):
         if items_count:
             assert batch_size == 1
@@ -3342,6 +3914,13 @@ class SetInstance(object):
         elif setdata.is_fully_loaded: return not setdata
         elif setdata: return False
         elif setdata.count is not None: return not setdata.count
+        cache = obj._session_cache_
+        if cache is not None and cache.is_alive:
+            counter = cache.count_statistics.get(attr, 0)
+            if attr.nplus1_threshold is not None and counter >= attr.nplus1_threshold:
+                attr.load_count(obj, setdata)
+                return not setdata.count
+            cache.count_statistics[attr] = counter + 1
         entity = attr.entity
         reverse = attr.reverse
         rentity = reverse.entity
@@ -3397,27 +3976,7 @@ class SetInstance(object):
         if setdata is None: setdata = obj._vals_[attr] = SetData()
         elif setdata.count is not None: return setdata.count
         if cache is None or not cache.is_alive: throw_db_session_is_over('read value of', obj, attr)
-        entity = attr.entity
-        reverse = attr.reverse
-        database = entity._database_
-        cached_sql = attr.cached_count_sql
-        if cached_sql is None:
-            where_list = [ 'WHERE' ]
-            for i, (column, converter) in enumerate(izip(reverse.columns, reverse.converters)):
-                where_list.append([ converter.EQ, [ 'COLUMN', None, column ], [ 'PARAM', (i, None, None), converter ] ])
-            if not reverse.is_collection: table_name = reverse.entity._table_
-            else: table_name = attr.table
-            sql_ast = [ 'SELECT', [ 'AGGREGATES', [ 'COUNT', None ] ],
-                                  [ 'FROM', [ None, 'TABLE', table_name ] ], where_list ]
-            sql, adapter = database._ast2sql(sql_ast)
-            attr.cached_count_sql = sql, adapter
-        else: sql, adapter = cached_sql
-        arguments = adapter(obj._get_raw_pkval_())
-        with cache.flush_disabled():
-            cursor = database._exec_sql(sql, arguments)
-        setdata.count = cursor.fetchone()[0]
-        if setdata.added: setdata.count += len(setdata.added)
-        if setdata.removed: setdata.count -= len(setdata.removed)
+        attr.load_count(obj, setdata)
         return setdata.count
     @cut_traceback
     def __iter__(wrapper):
@@ -3857,8 +4416,10 @@ class EntityMeta(type):
         entity._load_sql_cache_ = {}
         entity._batchload_sql_cache_ = {}
         entity._insert_sql_cache_ = {}
+        entity._upsert_sql_cache_ = {}
         entity._update_sql_cache_ = {}
         entity._delete_sql_cache_ = {}
+        entity._delete_many_sql_cache_ = {}
 
         entity._propagation_mixin_ = None
         entity._set_wrapper_subclass_ = None
@@ -4098,6 +4659,280 @@ class EntityMeta(type):
                     if obj in seeds: obj._load_()
         if found_in_cache: shuffle(result)
         return result
+    @cut_traceback
+    def insert_many(entity, rows, batch_size=1000, return_pks=False):
+        # Rows are sent to the database directly: objects are not created and hooks are not called.
+        # Each row is a dict or a tuple with values of all non-collection attributes in order of declaration,
+        # except the discriminator and the auto-generated primary key
+        if batch_size < 1: throw(ValueError, 'batch_size must be positive. Got: %r' % batch_size)
+        batches = {}
+        result = [] if return_pks else None
+        count = 0
+        for avdict in entity._iter_insert_rows_(rows, 'insert_many'):
+            attrs, values, pkval, raw_vals = entity._get_insert_many_values_(avdict)
+            batch = batches.get(attrs)
+            if batch is None: batch = batches[attrs] = []
+            batch.append((count, values, pkval, raw_vals))
+            if return_pks: result.append(pkval)
+            count += 1
+            if len(batch) >= batch_size:
+                entity._insert_many_batch_(attrs, batch, result)
+                del batch[:]
+        for attrs, batch in iteritems(batches):
+            if batch: entity._insert_many_batch_(attrs, batch, result)
+        if count: entity._database_._get_cache().query_results.clear()
+        return result if return_pks else count
+    def _iter_insert_rows_(entity, rows, method_name):
+        if entity._database_.schema is None:
+            throw(ERDiagramError, 'Mapping is not generated for entity %r' % entity.__name__)
+        cache = entity._database_._get_cache()
+        if cache.modified: cache.flush()  # rows may reference newly created objects
+        positional_attrs = [ attr for attr in entity._attrs_
+                             if not attr.is_collection and not attr.is_discriminator
+                             and not (attr.is_pk and attr.auto) ]
+        adict = entity._adict_
+        for row in rows:
+            if isinstance(row, dict):
+                for name in row:
+                    attr = adict.get(name)
+                    if attr is None: throw(TypeError, 'Unknown attribute %r' % name)
+                    if attr.is_collection: throw(TypeError,
+                        'Collection attribute %s cannot be specified in %s()' % (attr, method_name))
+                yield { adict[name]: val for name, val in iteritems(row) }
+            else:
+                row = tuple(row)
+                if len(row) != len(positional_attrs): throw(TypeError,
+                    'Row for %s should contain %d values. Got: %d'
+                    % (entity.__name__, len(positional_attrs), len(row)))
+                yield dict(izip(positional_attrs, row))
+    def _get_insert_many_values_(entity, avdict, keep_nones=False):
+        # with keep_nones=True explicitly specified None values are not replaced by column defaults
+        attrs = []
+        values = []
+        pkval = []
+        raw_vals_dict = {}
+        for attr in entity._attrs_with_columns_:
+            val = avdict.get(attr, DEFAULT)
+            reverse = attr.reverse
+            if reverse and val is not None and val is not DEFAULT and not isinstance(val, Entity):
+                # raw primary key of the referenced object, it is not loaded into the identity map
+                raw_vals = val if type(val) is tuple else (val,)
+                if len(raw_vals) != len(attr.converters): throw(TypeError,
+                    'Invalid number of columns were specified for attribute %s. Expected: %d, got: %d'
+                    % (attr, len(attr.converters), len(raw_vals)))
+                raw_vals = tuple(converter.val2dbval(converter.validate(raw_val))
+                                 for converter, raw_val in izip(attr.converters, raw_vals))
+                val = raw_vals if len(raw_vals) > 1 else raw_vals[0]
+            else:
+                val = attr.validate(val, None, entity, from_db=False)
+                if not reverse:
+                    assert len(attr.converters) == 1
+                    if val is not None: val = attr.converters[0].val2dbval(val)
+                    raw_vals = (val,)
+                else: raw_vals = attr.get_raw_values(val)
+            if attr.pk_offset is not None: pkval.append(val)
+            if val is not None or keep_nones and attr in avdict:
+                attrs.append(attr)
+                values.extend(raw_vals)
+                raw_vals_dict[attr] = raw_vals
+        pkval = tuple(pkval) if entity._pk_is_composite_ else pkval[0]
+        return tuple(attrs), values, pkval, raw_vals_dict
+    def _insert_many_batch_(entity, attrs, batch, result):
+        database = entity._database_
+        auto_pk = entity._pk_attrs_[0] not in attrs
+        try:
+            if auto_pk and result is not None:
+                # order of rows returned by multi-row INSERT ... RETURNING is not guaranteed,
+                # so each row is inserted separately to get its id
+                sql, adapter = entity._get_insert_sql_(attrs, True)
+                for row_num, values, pkval, raw_vals in batch:
+                    new_id = database._exec_sql(sql, adapter(values), True, start_transaction=True)
+                    if PY2 and type(new_id) is long: new_id = int(new_id)
+                    result[row_num] = new_id
+            else:
+                sql, adapter = entity._get_insert_sql_(attrs, False)
+                arguments = [ adapter(values) for row_num, values, pkval, raw_vals in batch ]
+                database._exec_sql(sql, arguments, start_transaction=True)
+        except IntegrityError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(TransactionIntegrityError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                             % (entity.__name__, e.__class__.__name__, msg), e)
+        except DatabaseError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(UnexpectedError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                   % (entity.__name__, e.__class__.__name__, msg), e)
+        entity._reset_reverse_collections_(attrs, [ raw_vals for row_num, values, pkval, raw_vals in batch ])
+    def _copy_many_batch_(entity, attrs, batch):
+        database = entity._database_
+        provider = database.provider
+        columns = [ column for attr in attrs for column in attr.columns ]
+        converters = [ converter for attr in attrs for converter in attr.converters ]
+        rows = [ [ converter.py2sql(value) if value is not None else None
+                   for converter, value in izip(converters, values) ] for values, raw_vals in batch ]
+        cache = database._get_cache()
+        cache.immediate = True
+        connection = cache.prepare_connection_for_query_execution()
+        cursor = connection.cursor()
+        t = time()
+        try: sql = provider.copy_from(cursor, entity._table_, columns, rows)
+        except IntegrityError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(TransactionIntegrityError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                             % (entity.__name__, e.__class__.__name__, msg), e)
+        except DatabaseError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(UnexpectedError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                   % (entity.__name__, e.__class__.__name__, msg), e)
+        cache.in_transaction = True
+        if local.debug: log_sql(sql)
+        database._update_local_stat(sql, t)
+        entity._reset_reverse_collections_(attrs, [ raw_vals for values, raw_vals in batch ])
+    @cut_traceback
+    def upsert(entity, rows, conflict=None, update=None, batch_size=1000):
+        # Rows which conflict with existing rows by the primary key or the unique key specified in the conflict
+        # argument update attributes from the update list (by default all non-key attributes specified in the row)
+        if batch_size < 1: throw(ValueError, 'batch_size must be positive. Got: %r' % batch_size)
+        key_attrs = entity._get_upsert_key_(conflict)
+        if update is not None:
+            if not isinstance(update, (tuple, list, set, frozenset)): update = (update,)
+            update_attrs = set()
+            for attr in update:
+                if isinstance(attr, basestring):
+                    name = attr
+                    attr = entity._adict_.get(name)
+                    if attr is None: throw(TypeError, 'Unknown attribute %r' % name)
+                elif not isinstance(attr, Attribute) or not issubclass(entity, attr.entity):
+                    throw(TypeError, 'Attribute of %s expected. Got: %r' % (entity.__name__, attr))
+                if attr.is_collection or attr.pk_offset is not None or attr in key_attrs: throw(TypeError,
+                    'Attribute %s cannot be updated by upsert' % attr)
+                update_attrs.add(attr)
+        batches = {}
+        count = 0
+        for avdict in entity._iter_insert_rows_(rows, 'upsert'):
+            attrs, values, pkval, raw_vals = entity._get_insert_many_values_(avdict, keep_nones=True)
+            batch = batches.get(attrs)
+            if batch is None:
+                for attr in key_attrs:
+                    if attr not in attrs: throw(TypeError,
+                        'Value of key attribute %s must be specified for upsert' % attr)
+                batch = batches[attrs] = []
+            batch.append((values, raw_vals))
+            count += 1
+            if len(batch) >= batch_size:
+                entity._upsert_batch_(attrs, key_attrs, update_attrs if update is not None else None, batch)
+                del batch[:]
+        for attrs, batch in iteritems(batches):
+            if batch: entity._upsert_batch_(attrs, key_attrs, update_attrs if update is not None else None, batch)
+        if count: entity._database_._get_cache().query_results.clear()
+        return count
+    def _get_upsert_key_(entity, conflict):
+        if conflict is None: return entity._pk_attrs_
+        if not isinstance(conflict, (tuple, list)): conflict = (conflict,)
+        key_attrs = []
+        for attr in conflict:
+            if isinstance(attr, basestring):
+                name = attr
+                attr = entity._adict_.get(name)
+                if attr is None: throw(TypeError, 'Unknown attribute %r' % name)
+            key_attrs.append(attr)
+        key_attrs = tuple(key_attrs)
+        if set(key_attrs) == set(entity._pk_attrs_): return entity._pk_attrs_
+        for key in entity._keys_:
+            if set(key_attrs) == set(key): return key
+        throw(TypeError, 'Attributes %s are not a primary key or a unique key of %s'
+                         % (', '.join(attr.name for attr in key_attrs), entity.__name__))
+    def _upsert_batch_(entity, attrs, key_attrs, update_attrs, batch):
+        if update_attrs is None: update_attrs = [ attr for attr in attrs
+                                                  if attr.pk_offset is None and attr not in key_attrs ]
+        else: update_attrs = [ attr for attr in attrs if attr in update_attrs ]
+        rows = {}
+        for values, raw_vals in batch:  # the same row cannot be affected twice by one statement
+            key = tuple(raw_val for attr in key_attrs for raw_val in raw_vals[attr])
+            rows.pop(key, None)
+            rows[key] = values, raw_vals
+        rows = values_list(rows)
+        database = entity._database_
+        max_batch_size = builtins.max(database.provider.max_params_count // len(rows[0][0]), 1)
+        try:
+            for i in xrange(0, len(rows), max_batch_size):
+                chunk = rows[i:i+max_batch_size]
+                sql, adapter = entity._get_upsert_sql_(attrs, key_attrs, tuple(update_attrs), len(chunk))
+                arguments = adapter([ value for values, raw_vals in chunk for value in values ])
+                database._exec_sql(sql, arguments, start_transaction=True)
+        except IntegrityError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(TransactionIntegrityError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                             % (entity.__name__, e.__class__.__name__, msg), e)
+        except DatabaseError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(UnexpectedError, 'Rows of %s cannot be stored in the database. %s: %s'
+                                   % (entity.__name__, e.__class__.__name__, msg), e)
+        entity._reset_reverse_collections_(attrs, [ raw_vals for values, raw_vals in rows ])
+        if update_attrs: entity._update_cached_objects_(key_attrs, update_attrs, rows)
+    def _get_upsert_sql_(entity, attrs, key_attrs, update_attrs, batch_size):
+        query_key = attrs, key_attrs, update_attrs, batch_size
+        cached_sql = entity._upsert_sql_cache_.get(query_key)
+        if cached_sql is not None: return cached_sql
+        columns = []
+        converters = []
+        for attr in attrs:
+            columns.extend(attr.columns)
+            converters.extend(attr.converters)
+        rows = [ [ [ 'PARAM', (i * len(columns) + j, None, None), converter ]
+                   for j, converter in enumerate(converters) ] for i in xrange(batch_size) ]
+        conflict_columns = [ column for attr in key_attrs for column in attr.columns ]
+        update_columns = [ column for attr in update_attrs for column in attr.columns ]
+        sql_ast = [ 'UPSERT', entity._table_, columns, rows, conflict_columns, update_columns ]
+        cached_sql = entity._upsert_sql_cache_[query_key] = entity._database_._ast2sql(sql_ast)
+        return cached_sql
+    def _reset_reverse_collections_(entity, attrs, rows):
+        # rows were stored bypassing the identity map, so loaded collections of referenced objects may be incomplete.
+        # rows is a list of dicts with raw values of attributes, referenced objects are looked up by them
+        cache = entity._database_._get_cache()
+        for attr in attrs:
+            reverse = attr.reverse
+            if not isinstance(reverse, Set): continue
+            rentity = reverse.entity
+            if not cache.indexes.get(rentity._pk_attrs_): continue
+            for raw_pkval in set(raw_vals[attr] for raw_vals in rows):
+                obj = rentity._get_cached_by_raw_key_(cache, rentity._pk_attrs_, raw_pkval)
+                if obj is None: continue
+                setdata = obj._vals_.get(reverse)
+                if setdata is not None:
+                    setdata.is_fully_loaded = False
+                    setdata.absent = setdata.count = None
+    def _update_cached_objects_(entity, key_attrs, update_attrs, rows):
+        cache = entity._database_._get_cache()
+        for values, raw_vals in rows:
+            raw_key = tuple(raw_val for attr in key_attrs for raw_val in raw_vals[attr])
+            obj = entity._get_cached_by_raw_key_(cache, key_attrs, raw_key)
+            if obj is None or not isinstance(obj, entity) or obj._status_ in ('deleted', 'cancelled'): continue
+            for attr in update_attrs:
+                new_raw_vals = raw_vals[attr]
+                if not attr.reverse: new_dbval = new_raw_vals[0]
+                elif None in new_raw_vals: new_dbval = None
+                else: new_dbval = attr.py_type._get_by_raw_pkval_(new_raw_vals, from_db=False)
+                obj._rbits_ &= ~obj._bits_except_volatile_[attr]
+                attr.db_set(obj, new_dbval)
+    def _get_cached_by_raw_key_(entity, cache, key_attrs, raw_key):
+        # finds object by raw column values of primary or unique key in the identity map only
+        vals = []
+        i = 0
+        for attr in key_attrs:
+            raw_vals = raw_key[i:i+len(attr.columns)]
+            i += len(attr.columns)
+            if None in raw_vals: return None
+            if not attr.reverse: val = attr.converters[0].dbval2val(raw_vals[0])
+            else:
+                rentity = attr.py_type
+                val = rentity._get_cached_by_raw_key_(cache, rentity._pk_attrs_, raw_vals)
+                if val is None: return None
+            vals.append(val)
+        if key_attrs == entity._pk_attrs_: index_key, key = key_attrs, tuple(vals) if entity._pk_is_composite_ else vals[0]
+        elif len(key_attrs) == 1: index_key, key = key_attrs[0], vals[0]
+        else: index_key, key = key_attrs, tuple(vals)
+        index = cache.indexes.get(index_key)
+        return index.get(key) if index else None
     def _find_one_(entity, kwargs, for_update=False, nowait=False, skip_locked=False):
         if entity._database_.schema is None:
             throw(ERDiagramError, 'Mapping is not generated for entity %r' % entity.__name__)
@@ -4300,17 +5135,21 @@ class EntityMeta(type):
                 throw(TooManyObjectsFoundError,
                     'Found more then pony.options.MAX_FETCH_COUNT=%d objects' % options.MAX_FETCH_COUNT)
         else: rows = cursor.fetchall()
+        return entity._make_objects_(rows, attr_offsets, for_update, used_attrs)
+    def _make_objects_(entity, rows, attr_offsets, for_update=False, used_attrs=()):
         objects = []
         if attr_offsets is None:
             objects = [ entity._get_by_raw_pkval_(row, for_update) for row in rows ]
             entity._load_many_(objects)
         else:
+            prefetch_joins = attr_offsets.get('prefetch_joins')
             for row in rows:
                 real_entity_subclass, pkval, avdict = entity._parse_row_(row, attr_offsets)
                 obj = real_entity_subclass._get_from_identity_map_(pkval, 'loaded', for_update)
                 if obj._status_ in del_statuses: continue
                 obj._db_set_(avdict)
                 objects.append(obj)
+                if prefetch_joins: obj._load_joined_(row, prefetch_joins)
         if used_attrs: entity._set_rbits(objects, used_attrs)
         return objects
     def _set_rbits(entity, objects, attrs):
@@ -4447,6 +5286,9 @@ class EntityMeta(type):
                         obj._vals_[attr] = val
                         if attr.reverse: attr.db_update_reverse(obj, NOT_LOADED, val)
                     cache.seeds[pk_attrs].add(obj)
+                    pending_by_attr = cache.pending_objects.get(entity._root_)
+                    if pending_by_attr:
+                        for pending in itervalues(pending_by_attr): pending.add(obj)
                 elif status == 'created':
                     assert undo_funcs is not None
                     obj._rbits_ = obj._wbits_ = None
@@ -4753,6 +5595,20 @@ class Entity(with_metaclass(EntityMeta)):
         pkval = obj._get_raw_pkval_()
         if len(pkval) == 1: return pkval[0]
         return pkval
+    def _get_dbval_(obj, attr):
+        # _dbvals_ contains only values which are not the same objects as values in _vals_,
+        # e.g. values of modified attributes or values with different db representation
+        dbvals = obj._dbvals_
+        if attr in dbvals: return dbvals[attr]
+        if obj._status_ in ('created', 'cancelled') or attr.is_collection: return NOT_LOADED
+        return obj._vals_.get(attr, NOT_LOADED)
+    def _set_dbval_(obj, attr, dbval):
+        if obj._vals_.get(attr, NOT_LOADED) is dbval: obj._dbvals_.pop(attr, None)
+        else: obj._dbvals_[attr] = dbval
+    def _preserve_dbval_(obj, attr):
+        # copy-on-write: should be called before the value in _vals_ is changed
+        if attr not in obj._dbvals_ and obj._status_ not in ('created', 'cancelled'):
+            obj._dbvals_[attr] = obj._vals_.get(attr, NOT_LOADED)
     def _get_raw_pkval_(obj):
         pkval = obj._pkval_
         if not obj._pk_is_composite_:
@@ -4810,6 +5666,19 @@ class Entity(with_metaclass(EntityMeta)):
             arguments = adapter(batch)
             cursor = database._exec_sql(sql, arguments)
             entity._fetch_objects(cursor, attr_offsets)
+    def _load_joined_(obj, row, prefetch_joins):
+        # loads objects of to-one relations from the columns added by Query.prefetch(..., strategy='join')
+        for attr, attr_offsets in prefetch_joins:
+            rentity = attr.py_type
+            if row[attr_offsets[rentity._pk_attrs_[0]][0]] is None:
+                if not attr.columns and attr not in obj._vals_:
+                    obj._preserve_dbval_(attr)
+                    obj._vals_[attr] = None
+                continue
+            real_entity_subclass, pkval, avdict = rentity._parse_row_(row, attr_offsets)
+            obj2 = real_entity_subclass._get_from_identity_map_(pkval, 'loaded')
+            if obj2._status_ in del_statuses: continue
+            obj2._db_set_(avdict)
     def _load_(obj):
         cache = obj._session_cache_
         if cache is None or not cache.is_alive: throw_db_session_is_over('load object', obj)
@@ -4915,13 +5784,13 @@ class Entity(with_metaclass(EntityMeta)):
         if not avdict: return
 
         get_val = obj._vals_.get
-        get_dbval = obj._dbvals_.get
+        get_dbval = obj._get_dbval_
         rbits = obj._rbits_
         wbits = obj._wbits_
         for attr, new_dbval in items_list(avdict):
             assert attr.pk_offset is None
             assert new_dbval is not NOT_LOADED
-            old_dbval = get_dbval(attr, NOT_LOADED)
+            old_dbval = get_dbval(attr)
             if old_dbval is not NOT_LOADED:
                 if unpickling or old_dbval == new_dbval or (
                         not attr.reverse and attr.converters[0].dbvals_equal(old_dbval, new_dbval)):
@@ -4937,9 +5806,11 @@ class Entity(with_metaclass(EntityMeta)):
             new_vals = {attr: attr.converters[0].dbval2val(dbval, obj) if not attr.reverse else dbval
                               for attr, dbval in iteritems(avdict)}
 
+        dbvals = obj._dbvals_
+        compact = False
         for attr, new_val in items_list(new_vals):
             new_dbval = new_dbvals[attr]
-            old_dbval = get_dbval(attr, NOT_LOADED)
+            old_dbval = get_dbval(attr)
             bit = obj._bits_except_volatile_[attr]
             if rbits & bit:
                 errormsg = 'Please contact PonyORM developers so they can ' \
@@ -4950,9 +5821,14 @@ class Entity(with_metaclass(EntityMeta)):
                       % (obj.__class__.__name__, attr.name, obj, old_dbval, new_dbval))
 
             if attr.reverse: attr.db_update_reverse(obj, old_dbval, new_dbval)
-            obj._dbvals_[attr] = new_dbval
             if wbits & bit:
+                dbvals[attr] = new_dbval
                 del new_vals[attr]
+            elif attr.reverse:
+                dbvals[attr] = new_dbval  # can be read by reverse updates of other attributes before _vals_ update
+                compact = True
+            elif new_val is not new_dbval: dbvals[attr] = new_dbval
+            elif attr in dbvals: del dbvals[attr]
 
         for attr, new_val in iteritems(new_vals):
             if attr.is_unique:
@@ -4971,6 +5847,10 @@ class Entity(with_metaclass(EntityMeta)):
                     cache.db_update_composite_index(obj, attrs, prev_key_vals, new_key_vals)
 
         obj._vals_.update(new_vals)
+        if compact:
+            for attr, new_val in iteritems(new_vals):
+                if attr.reverse: del dbvals[attr]
+            if not dbvals: obj._dbvals_ = {}  # emptied dict does not release its memory
     def _delete_(obj, undo_funcs=None):
         status = obj._status_
         if status in del_statuses: return
@@ -5105,6 +5985,7 @@ class Entity(with_metaclass(EntityMeta)):
                         objects_to_save.append(obj)
                         cache.modified = True
 
+                for attr in avdict: obj._preserve_dbval_(attr)
                 if not collection_avdict:
                     if not any(attr.reverse or attr.is_part_of_unique_index for attr in avdict):
                         obj._vals_.update(avdict)
@@ -5178,13 +6059,36 @@ class Entity(with_metaclass(EntityMeta)):
             assert converters
             optimistic = attr.optimistic if attr.optimistic is not None else converters[0].optimistic
             if not optimistic: continue
-            dbval = obj._dbvals_[attr]
+            dbval = obj._get_dbval_(attr)
             optimistic_columns.extend(attr.columns)
             optimistic_converters.extend(attr.converters)
             values = attr.get_raw_values(dbval)
             optimistic_values.extend(values)
             optimistic_operations.extend('IS_NULL' if dbval is None else converter.EQ for converter in converters)
         return optimistic_operations, optimistic_columns, optimistic_converters, optimistic_values
+    def _can_be_batched_update_(obj):
+        # changes of unique columns are saved one by one, because their order may matter
+        for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._wbits_):
+            if attr.is_unique or attr.composite_keys: return False
+        return True
+    def _can_be_batched_delete_(obj):
+        cache = obj._session_cache_
+        optimistic_session = cache.db_session is None or cache.db_session.optimistic
+        if optimistic_session and obj not in cache.for_update: return False
+        return not obj.__class__._can_reference_(obj.__class__)
+    @classmethod
+    def _can_reference_(entity, entity2):
+        root = entity2._root_
+        for subclass in entity._root_._subclasses_ | {entity._root_}:
+            for attr in subclass._new_attrs_:
+                if attr.reverse and attr.columns and attr.py_type._root_ is root: return True
+        return False
+    def _has_unsaved_principals_(obj):
+        for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._wbits_):
+            if not attr.reverse: continue
+            val = obj._vals_[attr]
+            if val is not None and val._status_ == 'created': return True
+        return False
     def _save_principal_objects_(obj, dependent_objects):
         if dependent_objects is None: dependent_objects = []
         elif obj in dependent_objects:
@@ -5220,14 +6124,15 @@ class Entity(with_metaclass(EntityMeta)):
                 obj._rbits_ &= ~bits[attr]
             else:
                 if attr in new_dbvals:
-                    dbvals[attr] = new_dbvals[attr]
+                    new_dbval = new_dbvals[attr]
+                    if new_dbval is val: dbvals.pop(attr, None)
+                    else: dbvals[attr] = new_dbval
                 continue
             # Clear value of volatile attribute or null values after create, because the value may be changed in the DB
             del vals[attr]
             dbvals.pop(attr, None)
 
-    def _save_created_(obj):
-        auto_pk = (obj._pkval_ is None)
+    def _get_insert_values_(obj, auto_pk):
         attrs = []
         values = []
         new_dbvals = {}
@@ -5244,28 +6149,32 @@ class Entity(with_metaclass(EntityMeta)):
                 else:
                     new_dbvals[attr] = val
                     values.extend(attr.get_raw_values(val))
-        attrs = tuple(attrs)
-
+        return tuple(attrs), values, new_dbvals
+    @classmethod
+    def _get_insert_sql_(entity, attrs, auto_pk):
+        query_key = attrs, auto_pk
+        cached_sql = entity._insert_sql_cache_.get(query_key)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        columns = []
+        converters = []
+        for attr in attrs:
+            columns.extend(attr.columns)
+            converters.extend(attr.converters)
+        assert len(columns) == len(converters)
+        params = [ [ 'PARAM', (i, None, None),  converter ] for i, converter in enumerate(converters) ]
+        if not columns and database.provider.dialect == 'Oracle':
+            sql_ast = [ 'INSERT', entity._table_, entity._pk_columns_,
+                        [ [ 'DEFAULT' ] for column in entity._pk_columns_ ] ]
+        else: sql_ast = [ 'INSERT', entity._table_, columns, params ]
+        if auto_pk: sql_ast.append(entity._pk_columns_[0])
+        cached_sql = entity._insert_sql_cache_[query_key] = database._ast2sql(sql_ast)
+        return cached_sql
+    def _save_created_(obj):
+        auto_pk = (obj._pkval_ is None)
+        attrs, values, new_dbvals = obj._get_insert_values_(auto_pk)
+        sql, adapter = obj._get_insert_sql_(attrs, auto_pk)
         database = obj._database_
-        cached_sql = obj._insert_sql_cache_.get(attrs)
-        if cached_sql is None:
-            columns = []
-            converters = []
-            for attr in attrs:
-                columns.extend(attr.columns)
-                converters.extend(attr.converters)
-            assert len(columns) == len(converters)
-            params = [ [ 'PARAM', (i, None, None),  converter ] for i, converter in enumerate(converters) ]
-            entity = obj.__class__
-            if not columns and database.provider.dialect == 'Oracle':
-                sql_ast = [ 'INSERT', entity._table_, obj._pk_columns_,
-                            [ [ 'DEFAULT' ] for column in obj._pk_columns_ ] ]
-            else: sql_ast = [ 'INSERT', entity._table_, columns, params ]
-            if auto_pk: sql_ast.append(entity._pk_columns_[0])
-            sql, adapter = database._ast2sql(sql_ast)
-            entity._insert_sql_cache_[attrs] = sql, adapter
-        else: sql, adapter = cached_sql
-
         arguments = adapter(values)
         try:
             if auto_pk: new_id = database._exec_sql(sql, arguments, returning_id=True,
@@ -5281,20 +6190,58 @@ class Entity(with_metaclass(EntityMeta)):
             throw(UnexpectedError, 'Object %r cannot be stored in the database. %s: %s'
                                    % (obj, e.__class__.__name__, msg), e)
 
-        if auto_pk:
-            pk_attrs = obj._pk_attrs_
-            cache_index = obj._session_cache_.indexes[pk_attrs]
-            obj2 = cache_index.setdefault(new_id, obj)
-            if obj2 is not obj: throw(TransactionIntegrityError,
-                'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
-            obj._pkval_ = obj._vals_[pk_attrs[0]] = new_id
-            obj._newid_ = None
-
+        if auto_pk: obj._set_auto_pkval_(new_id)
+        obj._set_inserted_(new_dbvals)
+    def _can_be_batched_(obj):
+        # ids returned by multi-row INSERT ... RETURNING cannot be matched to objects reliably,
+        # because the order of returned rows is not guaranteed
+        return obj._pkval_ is not None
+    @classmethod
+    def _save_created_many_(entity, attrs, objects):
+        sql, adapter = entity._get_insert_sql_(attrs, False)
+        arguments = []
+        all_new_dbvals = []
+        for obj in objects:
+            attrs2, values, new_dbvals = obj._get_insert_values_(False)
+            assert attrs2 == attrs
+            arguments.append(adapter(values))
+            all_new_dbvals.append(new_dbvals)
+        database = entity._database_
+        try: database._exec_sql(sql, arguments, start_transaction=True)
+        except IntegrityError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(TransactionIntegrityError,
+                  'Objects %s cannot be stored in the database. %s: %s'
+                  % (truncate_repr(objects), e.__class__.__name__, msg), e)
+        except DatabaseError as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            throw(UnexpectedError, 'Objects %s cannot be stored in the database. %s: %s'
+                                   % (truncate_repr(objects), e.__class__.__name__, msg), e)
+        for obj, new_dbvals in izip(objects, all_new_dbvals):
+            obj._set_inserted_(new_dbvals)
+            obj._save_finished_()
+    def _set_auto_pkval_(obj, new_id):
+        pk_attrs = obj._pk_attrs_
+        cache_index = obj._session_cache_.indexes[pk_attrs]
+        obj2 = cache_index.setdefault(new_id, obj)
+        if obj2 is not obj: throw(TransactionIntegrityError,
+            'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
+        obj._pkval_ = obj._vals_[pk_attrs[0]] = new_id
+        obj._newid_ = None
+    def _set_inserted_(obj, new_dbvals):
         obj._status_ = 'inserted'
         obj._rbits_ = obj._all_bits_except_volatile_
         obj._wbits_ = 0
         obj._update_dbvals_(True, new_dbvals)
     def _save_updated_(obj):
+        sql, adapter, values, new_dbvals = obj._prepare_update_()
+        if sql is not None:
+            arguments = adapter(values)
+            cursor = obj._database_._exec_sql(sql, arguments, start_transaction=True)
+            if cursor.rowcount == 0 and obj._session_cache_.db_session.optimistic:
+                throw(OptimisticCheckError, obj.find_updated_attributes())
+        obj._set_updated_(new_dbvals)
+    def _prepare_update_(obj):
         update_columns = []
         values = []
         new_dbvals = {}
@@ -5340,10 +6287,40 @@ class Entity(with_metaclass(EntityMeta)):
                 sql, adapter = database._ast2sql(sql_ast)
                 obj._update_sql_cache_[query_key] = sql, adapter
             else: sql, adapter = cached_sql
-            arguments = adapter(values)
+        else: sql = adapter = None
+        return sql, adapter, values, new_dbvals
+    @classmethod
+    def _save_updated_many_(entity, sql, adapter, batch):
+        database = entity._database_
+        cache = database._get_cache()
+        optimistic = cache.db_session.optimistic
+        if len(batch) == 1 or optimistic and not database.provider.executemany_rowcount_support:
+            for obj, values, new_dbvals in batch:
+                cursor = database._exec_sql(sql, adapter(values), start_transaction=True)
+                if cursor.rowcount == 0 and optimistic:
+                    throw(OptimisticCheckError, obj.find_updated_attributes())
+        else:
+            arguments = [ adapter(values) for obj, values, new_dbvals in batch ]
             cursor = database._exec_sql(sql, arguments, start_transaction=True)
-            if cursor.rowcount == 0 and cache.db_session.optimistic:
-                throw(OptimisticCheckError, obj.find_updated_attributes())
+            if optimistic and cursor.rowcount != len(batch):
+                entity._find_not_updated_object_(batch)
+        for obj, values, new_dbvals in batch:
+            obj._set_updated_(new_dbvals)
+            obj._save_finished_()
+    @classmethod
+    def _find_not_updated_object_(entity, batch):
+        # Rows which were updated by executemany() already contain new values,
+        # so the object whose row differs from its new values failed the optimistic check
+        for obj, values, new_dbvals in batch:
+            avdict = obj._select_dbvals_(list(new_dbvals))
+            if avdict is None: throw(OptimisticCheckError, obj.find_updated_attributes())
+            for attr, new_dbval in iteritems(new_dbvals):
+                dbval = avdict[attr]
+                if dbval != new_dbval and (attr.reverse or not attr.converters[0].dbvals_equal(dbval, new_dbval)):
+                    throw(OptimisticCheckError, obj.find_updated_attributes())
+        throw(OptimisticCheckError, 'Some of objects %s were updated outside of current transaction'
+                                    % truncate_repr([ obj for obj, values, new_dbvals in batch ]))
+    def _set_updated_(obj, new_dbvals):
         obj._status_ = 'updated'
         obj._rbits_ |= obj._wbits_ & obj._all_bits_except_volatile_
         obj._wbits_ = 0
@@ -5378,23 +6355,71 @@ class Entity(with_metaclass(EntityMeta)):
         obj._status_ = 'deleted'
         cache.indexes[obj._pk_attrs_].pop(obj._pkval_)
 
+    @classmethod
+    def _save_deleted_many_(entity, objects):
+        if len(objects) == 1:
+            obj = objects[0]
+            obj._save_deleted_()
+            obj._save_finished_()
+            return
+        database = entity._database_
+        cache = database._get_cache()
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects), max_batch_size):
+            batch = objects[i:i+max_batch_size]
+            sql, adapter = entity._construct_delete_many_sql_(len(batch))
+            cursor = database._exec_sql(sql, adapter(batch), start_transaction=True)
+            if cursor.rowcount != len(batch) and cache.db_session.optimistic: throw(OptimisticCheckError,
+                'Some of objects %s were deleted outside of current transaction' % truncate_repr(batch))
+        index = cache.indexes[entity._pk_attrs_]
+        for obj in objects:
+            obj._status_ = 'deleted'
+            index.pop(obj._pkval_)
+            obj._save_finished_()
+    @classmethod
+    def _construct_delete_many_sql_(entity, batch_size):
+        cached_sql = entity._delete_many_sql_cache_.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batchload_criteria_list(
+            None, entity._pk_columns_, entity._pk_converters_, batch_size, row_value_syntax)
+        from_ast = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
+        sql_ast = [ 'DELETE', None, from_ast, [ 'WHERE' ] + criteria_list ]
+        cached_sql = entity._delete_many_sql_cache_[batch_size] = database._ast2sql(sql_ast)
+        return cached_sql
     def find_updated_attributes(obj):
+        optimistic_attrs = []
+        for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._rbits_):
+            optimistic = attr.optimistic if attr.optimistic is not None else attr.converters[0].optimistic
+            if optimistic:
+                optimistic_attrs.append(attr)
+        avdict = obj._select_dbvals_(optimistic_attrs)
+        if avdict is None:
+            return "Object %s was deleted outside of current transaction" % safe_repr(obj)
+
+        diff = []
+        for attr, new_dbval in avdict.items():
+            old_dbval = obj._get_dbval_(attr)
+            converter = attr.converters[0]
+            if old_dbval != new_dbval and (
+                    attr.reverse or not converter.dbvals_equal(old_dbval, new_dbval)):
+                diff.append('%s (%r -> %r)' % (attr.name, old_dbval, new_dbval))
+
+        return "Object %s was updated outside of current transaction%s" % (
+            safe_repr(obj), ('. Changes: %s' % ', '.join(diff) if diff else ''))
+    def _select_dbvals_(obj, attrs):
         entity = obj.__class__
         attrs_to_select = []
         attrs_to_select.extend(entity._pk_attrs_)
         discr = entity._discriminator_attr_
         if discr is not None and discr.pk_offset is None:
             attrs_to_select.append(discr)
-        for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._rbits_):
-            optimistic = attr.optimistic if attr.optimistic is not None else attr.converters[0].optimistic
-            if optimistic:
-                attrs_to_select.append(attr)
+        attrs_to_select.extend(attrs)
 
-        optimistic_converters = []
         attr_offsets = {}
         select_list = [ 'ALL' ]
         for attr in attrs_to_select:
-            optimistic_converters.extend(attr.converters)
             attr_offsets[attr] = offsets = []
             for columns in attr.columns:
                 select_list.append([ 'COLUMN', None, columns])
@@ -5411,20 +6436,9 @@ class Entity(with_metaclass(EntityMeta)):
         arguments = adapter(obj._get_raw_pkval_())
         cursor = database._exec_sql(sql, arguments)
         row = cursor.fetchone()
-        if row is None:
-            return "Object %s was deleted outside of current transaction" % safe_repr(obj)
-
+        if row is None: return None
         real_entity_subclass, pkval, avdict = entity._parse_row_(row, attr_offsets)
-        diff = []
-        for attr, new_dbval in avdict.items():
-            old_dbval = obj._dbvals_[attr]
-            converter = attr.converters[0]
-            if old_dbval != new_dbval and (
-                    attr.reverse or not converter.dbvals_equal(old_dbval, new_dbval)):
-                diff.append('%s (%r -> %r)' % (attr.name, old_dbval, new_dbval))
-
-        return "Object %s was updated outside of current transaction%s" % (
-            safe_repr(obj), ('. Changes: %s' % ', '.join(diff) if diff else ''))
+        return avdict
 
     def _save_(obj, dependent_objects=None):
         status = obj._status_
@@ -5435,7 +6449,8 @@ class Entity(with_metaclass(EntityMeta)):
         elif status == 'modified': obj._save_updated_()
         elif status == 'marked_to_delete': obj._save_deleted_()
         else: assert False, "_save_() called for object %r with incorrect status %s" % (obj, status)  # pragma: no cover
-
+        obj._save_finished_()
+    def _save_finished_(obj):
         assert obj._status_ in saved_statuses
         cache = obj._session_cache_
         assert cache is not None and cache.is_alive
@@ -5459,6 +6474,8 @@ class Entity(with_metaclass(EntityMeta)):
                                 # TODO: add to documentation that flush is disabled inside before_xxx hooks
             obj._save_()
         cache.call_after_save_hooks()
+    def flush_async(obj):
+        return run_async(obj.flush)
     def _before_save_(obj):
         status = obj._status_
         if status == 'created': obj.before_insert()
@@ -5677,6 +6694,41 @@ def extract_vars(code_key, filter_num, extractors, globals, locals, cells=None):
         vars[varkey] = value
     return vars, vartypes
 
+def encode_keyset_token(values):
+    items = []
+    for value in values:
+        if value is None or isinstance(value, (bool, float, basestring) + int_types): items.append(value)
+        elif isinstance(value, Decimal): items.append([ 'decimal', str(value) ])
+        elif isinstance(value, datetime.datetime) and value.tzinfo is None:
+            items.append([ 'datetime' ] + list(value.timetuple()[:6]) + [ value.microsecond ])
+        elif isinstance(value, datetime.date): items.append([ 'date', value.year, value.month, value.day ])
+        elif isinstance(value, datetime.time) and value.tzinfo is None:
+            items.append([ 'time', value.hour, value.minute, value.second, value.microsecond ])
+        elif isinstance(value, datetime.timedelta):
+            items.append([ 'timedelta', value.days, value.seconds, value.microseconds ])
+        elif isinstance(value, UUID): items.append([ 'uuid', value.hex ])
+        elif isinstance(value, buffer): items.append([ 'buffer', base64.b64encode(value).decode('ascii') ])
+        else: throw(TypeError, 'Value %r cannot be used in keyset pagination token' % value)
+    token = base64.urlsafe_b64encode(json.dumps(items, separators=(',', ':')).encode('utf-8'))
+    return token.decode('ascii')
+
+keyset_token_types = {
+    'decimal': Decimal, 'datetime': datetime.datetime, 'date': datetime.date, 'time': datetime.time,
+    'timedelta': datetime.timedelta, 'uuid': UUID, 'buffer': lambda s: buffer(base64.b64decode(s))
+}
+
+def decode_keyset_token(token):
+    try:
+        items = json.loads(base64.urlsafe_b64decode(str(token)).decode('utf-8'))
+        if type(items) is not list: raise ValueError
+        result = []
+        for item in items:
+            if type(item) is list: item = keyset_token_types[item[0]](*item[1:])
+            result.append(item)
+    except (TypeError, ValueError, KeyError, IndexError):
+        throw(ValueError, 'Invalid keyset pagination token: %r' % token)
+    return tuple(result)
+
 def unpickle_query(query_result):
     return query_result
 
@@ -5788,7 +6840,24 @@ class Query(object):
                     del database._translator_cache[query_key]
                     return None, vars.copy()
         return translator, new_vars
-    def _construct_sql_and_arguments(query, limit=None, offset=None, range=None, aggr_func_name=None, aggr_func_distinct=None, sep=None):
+    def _construct_sql_and_arguments(query, limit=None, offset=None, range=None, aggr_func_name=None, aggr_func_distinct=None, sep=None,
+                                     keyset=None, keyset_values=None):
+        sql_key, sql, adapter, attr_offsets = query._construct_sql(
+            limit, offset, aggr_func_name, aggr_func_distinct, sep, keyset)
+        if keyset_values is None: arguments = adapter(query._vars)
+        else:
+            vars = dict(query._vars)
+            vars['KEYSET'] = keyset_values
+            arguments = adapter(vars)
+        if query._translator.query_result_is_cacheable:
+            arguments_key = HashableDict(arguments) if type(arguments) is dict else arguments
+            try: hash(arguments_key)
+            except: query_key = None  # arguments are unhashable
+            else: query_key = HashableDict(sql_key, arguments_key=arguments_key)
+        else: query_key = None
+        return sql, arguments, attr_offsets, query_key
+    def _construct_sql(query, limit=None, offset=None, aggr_func_name=None, aggr_func_distinct=None, sep=None,
+                       keyset=None):
         translator = query._translator
         expr_type = translator.expr_type
         attrs_to_prefetch_dict = query._prefetch_context.attrs_to_prefetch_dict
@@ -5796,6 +6865,7 @@ class Query(object):
             attrs_to_prefetch = tuple(sorted(attrs_to_prefetch_dict.get(expr_type, ())))
         else:
             attrs_to_prefetch = ()
+        prefetch_joins = query._get_prefetch_joins(aggr_func_name)
         sql_key = HashableDict(
             query._key,
             vartypes=HashableDict(query._translator.vartypes),
@@ -5808,64 +6878,112 @@ class Query(object):
             nowait=query._nowait,
             skip_locked=query._skip_locked,
             inner_join_syntax=options.INNER_JOIN_SYNTAX,
-            attrs_to_prefetch=attrs_to_prefetch
+            attrs_to_prefetch=attrs_to_prefetch,
+            prefetch_joins=prefetch_joins,
+            keyset=keyset
         )
         database = query._database
         cache_entry = database._constructed_sql_cache.get(sql_key)
         if cache_entry is None:
             sql_ast, attr_offsets = translator.construct_sql_ast(
                 limit, offset, query._distinct, aggr_func_name, aggr_func_distinct, sep,
-                query._for_update, query._nowait, query._skip_locked)
-            cache = database._get_cache()
+                query._for_update, query._nowait, query._skip_locked, keyset=keyset, prefetch_joins=prefetch_joins)
             sql, adapter = database.provider.ast2sql(sql_ast)
             cache_entry = sql, adapter, attr_offsets
             database._constructed_sql_cache[sql_key] = cache_entry
         else: sql, adapter, attr_offsets = cache_entry
-        arguments = adapter(query._vars)
-        if query._translator.query_result_is_cacheable:
-            arguments_key = HashableDict(arguments) if type(arguments) is dict else arguments
-            try: hash(arguments_key)
-            except: query_key = None  # arguments are unhashable
-            else: query_key = HashableDict(sql_key, arguments_key=arguments_key)
-        else: query_key = None
-        return sql, arguments, attr_offsets, query_key
+        return sql_key, sql, adapter, attr_offsets
+    def _get_prefetch_joins(query, aggr_func_name=None):
+        attrs_to_join = query._prefetch_context.attrs_to_join
+        entity = query._translator.expr_type
+        # FOR UPDATE cannot be applied to the nullable side of an outer join
+        if not attrs_to_join or aggr_func_name or query._for_update or not isinstance(entity, EntityMeta): return ()
+        # lazy attributes of joined entity are part of select list, so they are part of the sql key too
+        attrs_to_prefetch_dict = query._prefetch_context.attrs_to_prefetch_dict
+        return tuple((attr, tuple(sorted(attrs_to_prefetch_dict.get(attr.py_type, ()))))
+                     for attr in sorted(attrs_to_join) if issubclass(entity, attr.entity))
     def get_sql(query):
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
         return sql
     def _actual_fetch(query, limit=None, offset=None):
-        translator = query._translator
         with query._prefetch_context:
             sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(limit, offset)
-            database = query._database
-            cache = database._get_cache()
-            if query._for_update: cache.immediate = True
-            cache.prepare_connection_for_query_execution()  # may clear cache.query_results
-            items = cache.query_results.get(query_key)
-            if items is None:
-                cursor = database._exec_sql(sql, arguments)
-                if isinstance(translator.expr_type, EntityMeta):
-                    entity = translator.expr_type
-                    items = entity._fetch_objects(cursor, attr_offsets, for_update=query._for_update,
-                                                   used_attrs=translator.get_used_attrs())
-                elif len(translator.row_layout) == 1:
-                    func, slice_or_offset, src = translator.row_layout[0]
-                    items = list(starmap(func, cursor.fetchall()))
-                else:
-                    items = [ tuple(func(sql_row[slice_or_offset])
-                                     for func, slice_or_offset, src in translator.row_layout)
-                               for sql_row in cursor.fetchall() ]
-                    for i, t in enumerate(translator.expr_type):
-                        if isinstance(t, EntityMeta) and t._subclasses_: t._load_many_(row[i] for row in items)
-                if query_key is not None: cache.query_results[query_key] = items
-            else:
-                stats = database._dblocal.stats
-                stat = stats.get(sql)
-                if stat is not None: stat.cache_count += 1
-                else: stats[sql] = QueryStat(sql)
-            if query._prefetch: query._do_prefetch(items)
+            return query._fetch_items(sql, arguments, attr_offsets, query_key)
+    def _fetch_items(query, sql, arguments, attr_offsets, query_key):
+        translator = query._translator
+        database = query._database
+        cache = database._get_cache()
+        if query._for_update: cache.immediate = True
+        cache.prepare_connection_for_query_execution()  # may clear cache.query_results
+        items = cache.query_results.get(query_key)
+        if items is None:
+            cursor = database._exec_sql(sql, arguments)
+            if isinstance(translator.expr_type, EntityMeta):
+                entity = translator.expr_type
+                items = entity._fetch_objects(cursor, attr_offsets, for_update=query._for_update,
+                                               used_attrs=translator.get_used_attrs())
+            else: items = query._make_items(cursor.fetchall(), attr_offsets)
+            if query_key is not None: cache.query_results[query_key] = items
+        else:
+            stats = database._dblocal.stats
+            stat = stats.get(sql)
+            if stat is not None: stat.cache_count += 1
+            else: stats[sql] = QueryStat(sql)
+        if query._prefetch: query._do_prefetch(items)
+        return items
+    def _make_items(query, rows, attr_offsets):
+        translator = query._translator
+        if isinstance(translator.expr_type, EntityMeta):
+            entity = translator.expr_type
+            return entity._make_objects_(rows, attr_offsets, for_update=query._for_update,
+                                         used_attrs=translator.get_used_attrs())
+        if len(translator.row_layout) == 1:
+            func, slice_or_offset, src = translator.row_layout[0]
+            return list(starmap(func, rows))
+        items = [ tuple(func(sql_row[slice_or_offset]) for func, slice_or_offset, src in translator.row_layout)
+                  for sql_row in rows ]
+        for i, t in enumerate(translator.expr_type):
+            if isinstance(t, EntityMeta) and t._subclasses_: t._load_many_(row[i] for row in items)
         return items
     @cut_traceback
-    def prefetch(query, *args):
+    def iter(query, batch_size=1000, release=False, withhold=False):
+        # Rows are fetched with fetchmany() and converted batch by batch instead of materializing the whole result.
+        # With release=True unmodified objects of previous batch are detached from the session cache.
+        # Server-side cursor is closed at commit, withhold=True keeps it open after commit
+        if batch_size < 1: throw(ValueError, 'batch_size must be positive. Got: %r' % batch_size)
+        return query._iter_batches(batch_size, release, withhold)
+    def _iter_batches(query, batch_size, release, withhold):
+        with query._prefetch_context:
+            sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
+        database = query._database
+        cache = database._get_cache()
+        start_transaction = query._for_update or not withhold and database.provider.server_side_cursor_in_transaction
+        cursor = database._exec_sql(sql, arguments, start_transaction=start_transaction,
+                                    server_side_cursor=True, withhold=withhold)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows: break
+                with query._prefetch_context:
+                    items = query._make_items(rows, attr_offsets)
+                    if query._prefetch: query._do_prefetch(items)
+                for item in items: yield item
+                if release:
+                    if isinstance(query._translator.expr_type, EntityMeta): objects = items
+                    else: objects = [ x for item in items for x in (item if type(item) is tuple else (item,))
+                                      if isinstance(x, Entity) ]
+                    cache.release_objects(objects)
+                if len(rows) < batch_size: break
+        finally:
+            cursor.close()
+    @cut_traceback
+    def prefetch(query, *args, **kwargs):
+        # strategy='select' loads related objects with additional queries (default),
+        # strategy='join' adds LEFT JOIN of to-one relation to the main query
+        strategy = kwargs.pop('strategy', None)
+        if kwargs: throw(TypeError, 'Unexpected keyword argument of prefetch() query method: %s' % ', '.join(kwargs))
+        if strategy not in (None, 'select', 'join'): throw(ValueError,
+            "Prefetch strategy should be 'select' or 'join'. Got: %r" % strategy)
         query = query._clone(_prefetch_context=query._prefetch_context.copy())
         query._prefetch = True
         prefetch_context = query._prefetch_context
@@ -5874,12 +6992,19 @@ class Query(object):
                 entity = arg
                 if query._database is not entity._database_: throw(TypeError,
                     'Entity %s belongs to different database and cannot be prefetched' % entity.__name__)
+                if strategy == 'join': throw(TypeError,
+                    "Prefetch strategy 'join' can be used with to-one relation attribute only. Got: %s" % entity.__name__)
                 prefetch_context.entities_to_prefetch.add(entity)
             elif isinstance(arg, Attribute):
                 attr = arg
                 entity = attr.entity
                 if query._database is not entity._database_: throw(TypeError,
                     'Entity of attribute %s belongs to different database and cannot be prefetched' % attr)
+                if strategy == 'join':
+                    if not attr.is_relation or attr.is_collection: throw(TypeError,
+                        "Prefetch strategy 'join' can be used with to-one relation attribute only. Got: %s" % attr)
+                    prefetch_context.attrs_to_join.add(attr)
+                elif strategy == 'select': prefetch_context.attrs_to_join.discard(attr)
                 if isinstance(attr.py_type, EntityMeta) or attr.lazy:
                     prefetch_context.attrs_to_prefetch_dict[entity].add(attr)
             else: throw(TypeError, 'Argument of prefetch() query method must be entity class or attribute. '
@@ -5906,7 +7031,9 @@ class Query(object):
         collection_prefetch_dict = defaultdict(set)
 
         objects_to_prefetch_dict = defaultdict(set)
+        seeds = query._database._get_cache().seeds
         while objects_to_process or objects_to_prefetch:
+            next_objects_to_process = set()
             for obj in objects_to_process:
                 entity = obj.__class__
                 relations_to_prefetch = prefetch_context.get_relations_to_prefetch(entity)
@@ -5917,9 +7044,10 @@ class Query(object):
                         obj2 = attr.get(obj)
                         if obj2 is not None and obj2 not in all_objects:
                             all_objects.add(obj2)
-                            objects_to_prefetch.add(obj2)
+                            if attr in prefetch_context.attrs_to_join and obj2 not in seeds[obj2._pk_attrs_]:
+                                next_objects_to_process.add(obj2)  # already loaded by LEFT JOIN
+                            else: objects_to_prefetch.add(obj2)
 
-            next_objects_to_process = set()
             for attr, objects in collection_prefetch_dict.items():
                 items = attr.prefetch_load_all(objects)
                 if attr.reverse.is_collection:
@@ -5995,6 +7123,81 @@ class Query(object):
         cache.query_results.clear()
         return cursor.rowcount
     @cut_traceback
+    def update(query, **kwargs):
+        if not kwargs: throw(TypeError, 'At least one attribute value should be specified')
+        translator = query._translator
+        entity = translator.expr_type
+        if not isinstance(entity, EntityMeta): throw(TypeError,
+            'Update query should be applied to a single entity. Got: %s' % ast2src(translator.tree.expr))
+        attrs = []
+        values = {}
+        for name in sorted(kwargs):
+            attr = entity._adict_.get(name)
+            if attr is None: throw(TypeError, 'Unknown attribute %r' % name)
+            if attr.is_collection: throw(TypeError,
+                'Collection attribute %s cannot be updated by query' % attr)
+            if attr.pk_offset is not None: throw(TypeError,
+                'Primary key attribute %s cannot be updated by query' % attr)
+            if attr.is_discriminator: throw(TypeError,
+                'Discriminator attribute %s cannot be updated by query' % attr)
+            val = attr.validate(kwargs[name], None, entity, from_db=False)
+            attrs.append(attr)
+            values[attr] = val
+        sql_key = HashableDict(query._key, sql_command='UPDATE', update_attrs=tuple(attr.name for attr in attrs))
+        database = query._database
+        cache = database._get_cache()
+        cache_entry = database._constructed_sql_cache.get(sql_key)
+        if cache_entry is None:
+            pairs = []
+            for attr in attrs:
+                for j, (column, converter) in enumerate(izip(attr.columns, attr.converters)):
+                    paramkey = ('UPDATE', attr.name), j, None
+                    pairs.append((column, [ 'PARAM', paramkey, converter ]))
+            sql_ast = translator.construct_update_sql_ast(pairs)
+            cache_entry = database.provider.ast2sql(sql_ast)
+            database._constructed_sql_cache[sql_key] = cache_entry
+        sql, adapter = cache_entry
+        cache.immediate = True
+        cache.prepare_connection_for_query_execution()  # may clear cache.query_results
+        objects = query._get_objects_to_update(cache, attrs)
+        arguments = dict(query._vars)
+        new_dbvals = {}
+        for attr, val in iteritems(values):
+            if not attr.reverse:
+                assert len(attr.converters) == 1
+                new_dbvals[attr] = dbval = attr.converters[0].val2dbval(val)
+                arguments['UPDATE', attr.name] = (dbval,)
+            else:
+                new_dbvals[attr] = val
+                arguments['UPDATE', attr.name] = attr.get_raw_values(val)
+        cursor = database._exec_sql(sql, adapter(arguments))
+        cache.query_results.clear()
+        entity._reset_reverse_collections_(attrs, [ dict((attr, attr.get_raw_values(values[attr])) for attr in attrs) ])
+        for obj in objects:
+            for attr in attrs:
+                obj._rbits_ &= ~obj._bits_except_volatile_[attr]
+                attr.db_set(obj, new_dbvals[attr])
+        return cursor.rowcount
+    def _get_objects_to_update(query, cache, attrs):
+        # objects already loaded into the identity map which match the query should get new values.
+        # The SELECT which checks them is restricted to their primary keys, other rows are not read
+        translator = query._translator
+        entity = translator.expr_type
+        objects = [ obj for obj in itervalues(cache.indexes[entity._pk_attrs_])
+                    if isinstance(obj, entity) and obj._status_ not in ('deleted', 'cancelled')
+                    and any(obj._get_dbval_(attr) is not NOT_LOADED for attr in attrs) ]
+        if not objects: return objects
+        from_ast = translator.sqlquery.from_ast
+        if not translator.conditions and from_ast[0] == 'FROM' and len(from_ast) == 2:
+            return objects  # all rows of the table are updated
+        result = []
+        max_params_count = query._database.provider.max_params_count - len(query._vars)
+        max_batch_size = builtins.max(max_params_count // len(entity._pk_columns_), 1)
+        for i in xrange(0, len(objects), max_batch_size):
+            batch = objects[i:i+max_batch_size]
+            result.extend(query.filter(lambda obj: obj in batch)._actual_fetch())
+        return result
+    @cut_traceback
     def __len__(query):
         return len(query._actual_fetch())
     @cut_traceback
@@ -6206,6 +7409,81 @@ class Query(object):
     @cut_traceback
     def fetch(query, limit=None, offset=None):
         return query._fetch(limit, offset)
+    def fetch_async(query, limit=None, offset=None):
+        return run_async(query._fetch, limit, offset)
+    @cut_traceback
+    def raw(query, limit=None, offset=None):
+        # rows are returned as plain tuples, objects are not created and not tracked by db_session.
+        # Entities and references are represented by their primary key values
+        names, rows = query._fetch_raw(limit, offset)
+        return rows
+    @cut_traceback
+    def values(query, limit=None, offset=None):
+        names, rows = query._fetch_raw(limit, offset)
+        return [ dict(izip(names, row)) for row in rows ]
+    def _fetch_raw(query, limit, offset):
+        cursor, layout = query._execute_raw(limit, offset)
+        names = [ name for name, offset, convert, py_type in layout ]
+        getters = [ _make_raw_getter(offset, convert) for name, offset, convert, py_type in layout ]
+        return names, [ tuple(getter(row) for getter in getters) for row in cursor.fetchall() ]
+    def _execute_raw(query, limit=None, offset=None):
+        sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(limit, offset)
+        database = query._database
+        cache = database._get_cache()
+        if query._for_update: cache.immediate = True
+        cache.prepare_connection_for_query_execution()
+        cursor = database._exec_sql(sql, arguments)
+        return cursor, query._get_raw_layout(attr_offsets)
+    def _get_raw_layout(query, attr_offsets):
+        # returns list of (name, offset, convert, py_type) items, where offset is a tuple
+        # for multi-column values, and convert accepts a single value or a list of values accordingly
+        translator = query._translator
+        expr_type = translator.expr_type
+        layout = []
+        if isinstance(expr_type, EntityMeta):
+            entity = expr_type
+            if attr_offsets is None:
+                name = entity._pk_attrs_[0].name if not entity._pk_is_composite_ else 'pk'
+                return [ _make_raw_pkval_item(name, entity._pk_converters_, range(len(entity._pk_columns_))) ]
+            root = entity._root_
+            for attr in chain(root._attrs_, root._subclass_attrs_):
+                offsets = attr_offsets.get(attr)
+                if offsets is None: continue
+                if attr.reverse: layout.append(_make_raw_pkval_item(attr.name, attr.converters, offsets))
+                else: layout.append((attr.name, offsets[0], _make_raw_value_convert(attr), attr.py_type))
+            return layout
+        row_layout = translator.row_layout
+        # expr_type of one-element tuple expression is a tuple too, so len(row_layout) cannot be used here
+        expr_types = expr_type if type(expr_type) is tuple else (expr_type,)
+        for (func, slice_or_offset, src), t in izip(row_layout, expr_types):
+            if isinstance(slice_or_offset, slice):
+                if isinstance(t, SetType): t = t.item_type
+                offsets = range(slice_or_offset.start, slice_or_offset.stop)
+                layout.append(_make_raw_pkval_item(src, t._pk_converters_, offsets))
+            else: layout.append((src, slice_or_offset, func, t))
+        return layout
+    @cut_traceback
+    def to_columns(query, batch_size=1000):
+        # Returns dict of columns. Columns of int and float type are array.array objects,
+        # other columns are lists. Rows are fetched by chunks and decoded column by column
+        if batch_size < 1: throw(ValueError, 'batch_size must be positive. Got: %r' % batch_size)
+        cursor, layout = query._execute_raw()
+        native = query._database.provider.native_number_values
+        columns = [ _RawColumn(offset, convert, py_type, native) for name, offset, convert, py_type in layout ]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows: break
+            for column in columns: column.extend(rows)
+        return dict((name, column.data) for (name, offset, convert, py_type), column in izip(layout, columns))
+    @cut_traceback
+    def to_numpy(query, batch_size=1000):
+        try: import numpy
+        except ImportError: throw(ImportError, 'Query.to_numpy() requires numpy package')
+        result = query.to_columns(batch_size)
+        for name, data in items_list(result):
+            if isinstance(data, array): result[name] = numpy.frombuffer(data, dtype=data.typecode)
+            else: result[name] = numpy.array(data)
+        return result
     @cut_traceback
     def limit(query, limit=None, offset=None):
         return query._fetch(limit, offset, lazy=True)
@@ -6213,6 +7491,53 @@ class Query(object):
     def page(query, pagenum, pagesize=10):
         offset = (pagenum - 1) * pagesize
         return query._fetch(pagesize, offset, lazy=True)
+    @cut_traceback
+    def page_after(query, cursor_values=None, pagesize=10):
+        # Keyset pagination: returns rows which follow cursor_values in order of the query.
+        # cursor_values are values of order expressions of the last row of the previous page, or a continuation token
+        if pagesize < 1: throw(ValueError, 'pagesize must be positive. Got: %r' % pagesize)
+        return query._fetch_page_after(cursor_values, pagesize)
+    @cut_traceback
+    def paginate(query, pagesize=10, cursor_values=None):
+        if pagesize < 1: throw(ValueError, 'pagesize must be positive. Got: %r' % pagesize)
+        return query._iter_pages(cursor_values, pagesize)
+    def _iter_pages(query, cursor_values, pagesize):
+        while True:
+            page = query._fetch_page_after(cursor_values, pagesize)
+            if page: yield page
+            if page.next_token is None: break
+            cursor_values = page.cursor_values
+    def _fetch_page_after(query, cursor_values, pagesize):
+        translator = query._translator
+        keys = translator.get_keyset_order(query._distinct)
+        if cursor_values is None: keyset = 'FIRST'
+        else:
+            keyset = 'AFTER'
+            if isinstance(cursor_values, basestring): cursor_values = decode_keyset_token(cursor_values)
+            else:
+                if type(cursor_values) is not tuple: cursor_values = (cursor_values,)
+                provider = query._database.provider
+                cursor_values = tuple(
+                    value if value is None else provider.get_converter_by_py_type(type(value)).py2sql(value)
+                    for value in cursor_values)
+            if len(cursor_values) != len(keys): throw(TypeError,
+                'Keyset pagination of this query requires %d cursor values. Got: %d'
+                % (len(keys), len(cursor_values)))
+        with query._prefetch_context:
+            sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(
+                pagesize, keyset=keyset, keyset_values=cursor_values)
+            database = query._database
+            cache = database._get_cache()
+            if query._for_update: cache.immediate = True
+            cursor = database._exec_sql(sql, arguments)
+            rows = cursor.fetchall()
+            items = query._make_items([ row[:-len(keys)] for row in rows ], attr_offsets)
+            if query._prefetch: query._do_prefetch(items)
+        page = KeysetPage(items)
+        if rows:
+            page.cursor_values = tuple(rows[-1][-len(keys):])
+            if len(rows) == pagesize: page.next_token = encode_keyset_token(page.cursor_values)
+        return page
     def _aggregate(query, aggr_func_name, distinct=None, sep=None):
         translator = query._translator
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(
@@ -6271,6 +7596,123 @@ class Query(object):
         return query._database.to_json(query[:], include, exclude, converter, with_schema, schema_hash)
 
 
+class CompiledQuery(object):
+    # The first call with new types of parameters runs the function and remembers its query, SQL and adapter.
+    # Next calls evaluate only the query parameters and execute the remembered SQL.
+    # Arguments which are read by the function itself (not only inside of query) can change the shape
+    # of the query, e.g. `if only_even: q = q.filter(...)`, so their values are part of the entry key
+    def __init__(compiled, database, func, limit, offset):
+        compiled.database = database
+        compiled.func = func
+        compiled.limit = limit
+        compiled.offset = offset
+        compiled.compilable = True
+        compiled.params = None  # list of (varkey, code), these expressions are evaluated on each call
+        compiled.constant_vars = None
+        code = func.func_code if PY2 else func.__code__
+        compiled.shape_names = tuple(sorted(get_loaded_names(code)))
+        # (vartypes of params, shape values) -> (query, sql, adapter, attr_offsets, fixed_param_values)
+        compiled.entries = {}
+    @cut_traceback
+    def __call__(compiled, *args, **kwargs):
+        if compiled.compilable and compiled.params is not None:
+            key, vars = compiled._extract_vars(args, kwargs)
+            entry = compiled.entries.get(key) if key is not None else None
+            if entry is not None:
+                query, sql, adapter, attr_offsets, fixed_param_values = entry
+                for key, value in fixed_param_values:
+                    if vars[key] != value: break
+                else: return compiled._execute(query, vars, sql, adapter, attr_offsets)
+        query = compiled.func(*args, **kwargs)
+        if not isinstance(query, Query): throw(TypeError, 'Compiled function should return a query. Got: %r' % query)
+        if query._database is not compiled.database: throw(TypeError,
+            'Query of compiled function belongs to different database')
+        if compiled.compilable: compiled._add_entry(query, args, kwargs)
+        return query._fetch(compiled.limit, compiled.offset)
+    def _extract_vars(compiled, args, kwargs):
+        func = compiled.func
+        locals = inspect.getcallargs(func, *args, **kwargs)
+        if func.__closure__:
+            code = func.func_code if PY2 else func.__code__
+            for name, cell in izip(code.co_freevars, func.__closure__): locals[name] = cell.cell_contents
+        param_vars = {}
+        vartypes = {}
+        for varkey, code in compiled.params:
+            try: value = eval(code, func.__globals__, locals)
+            except Exception as cause: raise ExprEvalError(varkey[1], cause)
+            if isinstance(value, (Query, QueryResult, QueryResultIterator, SetIterator, types.GeneratorType)):
+                return None, None
+            try: vartypes[varkey], value = normalize(value)
+            except TypeError:
+                if isinstance(value, dict): return None, None
+                try: value = tuple(value)
+                except: return None, None
+                vartypes[varkey], value = normalize(value)
+            param_vars[varkey] = value
+        shape_values = tuple((type(locals[name]), locals[name]) for name in compiled.shape_names if name in locals)
+        try: hash(shape_values)
+        except TypeError: return None, None
+        compiled.database.provider.normalize_vars(param_vars, vartypes)
+        vars = compiled.constant_vars.copy()
+        vars.update(param_vars)
+        return (tuple(vartypes[varkey] for varkey, code in compiled.params), shape_values), vars
+    def _add_entry(compiled, query, args, kwargs):
+        params = []
+        constant_vars = {}
+        for varkey, value in iteritems(query._vars):
+            if type(varkey) is not tuple or len(varkey) != 3:  # values of keyword arguments of filter()
+                compiled.compilable = False
+                return
+            filter_num, src, code_key = varkey
+            if type(filter_num) is not int: constant_vars[varkey] = value  # globals of hybrid functions
+            elif src != '.0': params.append((varkey, src))
+            elif isinstance(value, EntityMeta): constant_vars[varkey] = value
+            else:
+                compiled.compilable = False  # iteration over another query
+                return
+        params.sort(key=itemgetter(0))
+        if compiled.params is None:
+            compiled.params = [ (varkey, compile(src, src, 'eval')) for varkey, src in params ]
+        elif [ varkey for varkey, code in compiled.params ] != [ varkey for varkey, src in params ]:
+            compiled.compilable = False
+            return
+        compiled.constant_vars = constant_vars
+        try: key, vars = compiled._extract_vars(args, kwargs)
+        except ExprEvalError:  # parameter expression depends on local variables of the function
+            compiled.compilable = False
+            return
+        if key is None: return
+        vartypes, shape_values = key
+        translator = query._translator
+        for (varkey, code), vartype in izip(compiled.params, vartypes):
+            if vars[varkey] != query._vars[varkey] or translator.vartypes.get(varkey) != vartype:
+                compiled.compilable = False
+                return
+        with query._prefetch_context:
+            sql_key, sql, adapter, attr_offsets = query._construct_sql(compiled.limit, compiled.offset)
+        fixed_param_values = tuple(iteritems(translator.fixed_param_values))
+        compiled.entries[key] = query, sql, adapter, attr_offsets, fixed_param_values
+    def _execute(compiled, query, vars, sql, adapter, attr_offsets):
+        query = query._clone(_vars=vars)
+        arguments = adapter(vars)
+        query_key = None
+        if query._translator.query_result_is_cacheable:
+            arguments_key = HashableDict(arguments) if type(arguments) is dict else arguments
+            try: hash(arguments_key)
+            except: pass
+            else: query_key = 'COMPILED', sql, arguments_key
+        with query._prefetch_context:
+            items = query._fetch_items(sql, arguments, attr_offsets, query_key)
+        result = QueryResult(query, compiled.limit, compiled.offset, lazy=True)
+        result._items = items
+        return result
+
+
+class KeysetPage(list):
+    cursor_values = None  # values of order expressions of the last row
+    next_token = None  # continuation token, None if it is the last page
+
+
 class QueryResultIterator(object):
     __slots__ = '_query_result', '_position'
     def __init__(self, query_result):
@@ -6302,6 +7744,56 @@ def make_query_result_method_error_stub(name, title=None):
         throw(TypeError, 'In order to do %s, cast QueryResult to list first' % (title or name))
     return func
 
+def _make_raw_getter(offset, convert):
+    if type(offset) is int: return lambda row: convert(row[offset])
+    return lambda row: convert([ row[i] for i in offset ])
+
+def _make_raw_value_convert(attr):
+    entity = attr.entity
+    converter = attr.converters[0]
+    def convert(val):
+        return converter.dbval2val(attr.validate(val, None, entity, from_db=True))
+    return convert
+
+def _make_raw_pkval_item(name, converters, offsets):
+    if len(converters) == 1:
+        converter = converters[0]
+        convert = lambda val: None if val is None else converter.sql2py(val)
+        return name, offsets[0], convert, converter.py_type
+    def convert(vals):
+        if None in vals: return None
+        return tuple(converter.sql2py(val) for converter, val in izip(converters, vals))
+    return name, tuple(offsets), convert, None
+
+raw_array_typecodes = {int: 'l' if PY2 else 'q', float: 'd'}
+
+class _RawColumn(object):
+    __slots__ = 'offset', 'convert', 'typecode', 'native', 'data'
+    def __init__(column, offset, convert, py_type, native):
+        column.offset = offset
+        column.convert = convert
+        column.typecode = raw_array_typecodes.get(py_type) if type(offset) is int else None
+        column.native = native and column.typecode is not None
+        column.data = array(column.typecode) if column.typecode is not None else []
+    def extend(column, rows):
+        offset = column.offset
+        if type(offset) is int: values = [ row[offset] for row in rows ]
+        else: values = [ [ row[i] for i in offset ] for row in rows ]
+        if column.native:
+            # If the driver returns native int and float objects (see provider.native_number_values),
+            # the chunk is packed as is, and convert() which does validate() and sql2py() is skipped.
+            # This gives the same values, because conversion of such numbers does not change them
+            try: column.data.extend(array(column.typecode, values)); return
+            except (TypeError, OverflowError): pass
+        values = [ column.convert(value) for value in values ]
+        if column.typecode is not None:
+            try: column.data.extend(array(column.typecode, values)); return
+            except (TypeError, OverflowError):  # column contains NULLs
+                column.data = list(column.data)
+                column.typecode = None
+                column.native = False
+        column.data.extend(values)
+
 class QueryResult(object):
     __slots__ = '_query', '_limit', '_offset', '_items', '_expr_type', '_col_names'
     def __init__(self, query, limit, offset, lazy):
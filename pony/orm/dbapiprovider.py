@@ -2,6 +2,9 @@ from __future__ import absolute_import, print_function, division
 from pony.py23compat import PY2, basestring, unicode, buffer, int_types, iteritems
 
 import os, re, json
+from collections import deque
+from threading import Lock, Condition
+from time import time as current_time
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, date, time, timedelta
 from uuid import uuid4, UUID
@@ -41,6 +44,7 @@ class     IntegrityError(DatabaseError): pass
 class     InternalError(DatabaseError): pass
 class     ProgrammingError(DatabaseError): pass
 class     NotSupportedError(DatabaseError): pass
+class       PoolTimeoutError(OperationalError): pass
 
 @decorator
 def wrap_dbapi_exceptions(func, provider, *args, **kwargs):
@@ -104,6 +108,12 @@ class DBAPIProvider(object):
     max_name_len = 128
     table_if_not_exists_syntax = True
     index_if_not_exists_syntax = True
+    executemany_rowcount_support = True
+    copy_from_support = False
+    prepared_statements_support = False
+    shared_pool_support = True
+    native_number_values = False  # driver returns int and float objects for columns of int and float attributes
+    server_side_cursor_in_transaction = False  # server-side cursor lives only until the end of transaction
     max_time_precision = default_time_precision = 6
     uint64_support = False
 
@@ -125,6 +135,18 @@ class DBAPIProvider(object):
     def __init__(provider, *args, **kwargs):
         pool_mockup = kwargs.pop('pony_pool_mockup', None)
         call_on_connect = kwargs.pop('pony_call_on_connect', None)
+        provider.prepared_statements_cache_size = kwargs.pop('prepared_statements', None)
+        if provider.prepared_statements_cache_size and not provider.prepared_statements_support: throw(TypeError,
+            'Server-side prepared statements are not supported by %s provider' % provider.dialect)
+        pool_options = {}
+        for name in shared_pool_options:
+            if name in kwargs: pool_options[name] = kwargs.pop(name)
+        if pool_options:
+            if not provider.shared_pool_support: throw(TypeError,
+                'Shared connection pool is not supported by %s provider' % provider.dialect)
+            if pool_options.get('pool_size') is None: throw(TypeError,
+                'pool_size should be specified in order to use shared connection pool')
+            kwargs['pony_shared_pool'] = SharedPool(**pool_options)
         if pool_mockup: provider.pool = pool_mockup
         else: provider.pool = provider.get_pool(*args, **kwargs)
         connection, is_new_connection = provider.connect()
@@ -269,6 +291,11 @@ class DBAPIProvider(object):
         if core.local.debug: core.log_orm('DISCONNECT')
         provider.pool.disconnect()
 
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, withhold=False):
+        # cursor for streaming of big result sets, rows are fetched from it with fetchmany()
+        return connection.cursor()
+
     @wrap_dbapi_exceptions
     def execute(provider, cursor, sql, arguments=None, returning_id=False):
         if type(arguments) is list:
@@ -331,21 +358,134 @@ class DBAPIProvider(object):
         sql = 'DROP TABLE %s' % provider.quote_name(table_name)
         cursor.execute(sql)
 
+shared_pool_options = 'pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_pre_ping'
+
+class PooledConnection(object):
+    __slots__ = 'con', 'pid', 'prepared_statements', 'released_at'
+    def __init__(entry, con, pid, prepared_statements):
+        entry.con = con
+        entry.pid = pid
+        entry.prepared_statements = prepared_statements
+        entry.released_at = None
+
+class SharedPool(object):
+    # Connections shared by all threads of the process. Each thread checks out a connection
+    # when db_session needs it and returns it back when db_session is over
+    def __init__(shared, pool_size, max_overflow=0, pool_timeout=30, pool_recycle=None, pool_pre_ping=False):
+        if pool_size < 1: throw(ValueError, 'pool_size must be positive. Got: %r' % pool_size)
+        if max_overflow < 0: throw(ValueError, 'max_overflow must not be negative. Got: %r' % max_overflow)
+        shared.pool_size = pool_size
+        shared.max_overflow = max_overflow
+        shared.timeout = pool_timeout  # None means wait forever
+        shared.recycle = pool_recycle  # connections idle for more than pool_recycle seconds are closed
+        shared.pre_ping = pool_pre_ping
+        shared._init_state()
+        shared.checkouts = shared.waits = shared.timeouts = shared.connects = shared.recycled = shared.failed_pings = 0
+        shared.wait_time = 0.0
+    def _init_state(shared):
+        shared.pid = os.getpid()
+        shared.lock = Lock()
+        shared.condition = Condition(shared.lock)
+        shared.idle = deque()
+        shared.opened = 0
+    def _check_fork(shared):
+        if shared.pid == os.getpid(): return
+        # connections opened in the parent process should not be used in the child process;
+        # the lock could be acquired by another thread of the parent at the moment of fork
+        Pool.forked_connections.extend((entry.con, entry.pid) for entry in shared.idle)
+        shared._init_state()
+    def checkout(shared):
+        # returns idle connection or None if the caller should open a new one
+        shared._check_fork()
+        expired = []
+        start = None
+        try:
+            with shared.lock:
+                shared.checkouts += 1
+                while True:
+                    idle = shared.idle
+                    if shared.recycle is not None:
+                        threshold = current_time() - shared.recycle
+                        while idle and idle[0].released_at < threshold:
+                            expired.append(idle.popleft().con)
+                            shared.opened -= 1
+                            shared.recycled += 1
+                    if idle: return idle.pop()
+                    if shared.opened < shared.pool_size + shared.max_overflow:
+                        shared.opened += 1
+                        shared.connects += 1
+                        return None
+                    now = current_time()
+                    if start is None:
+                        start = now
+                        shared.waits += 1
+                    if shared.timeout is None: shared.condition.wait()
+                    else:
+                        remaining = start + shared.timeout - now
+                        if remaining <= 0:
+                            shared.timeouts += 1
+                            raise PoolTimeoutError(None, 'Cannot get connection from the pool in %s seconds: '
+                                'pool_size=%d, max_overflow=%d' % (shared.timeout, shared.pool_size, shared.max_overflow))
+                        shared.condition.wait(remaining)
+        finally:
+            if start is not None:
+                with shared.lock: shared.wait_time += current_time() - start
+            for con in expired: close_quietly(con)
+    def checkin(shared, entry):
+        with shared.lock:
+            if entry.pid != shared.pid: return  # connection of the parent process returned after fork
+            overflow = len(shared.idle) >= shared.pool_size
+            if overflow: shared.opened -= 1
+            else:
+                entry.released_at = current_time()
+                shared.idle.append(entry)
+            shared.condition.notify()
+        if overflow: close_quietly(entry.con)
+    def discard(shared, pid):
+        # connection was closed or failed to open
+        with shared.lock:
+            if pid != shared.pid: return
+            shared.opened -= 1
+            shared.condition.notify()
+    def clear(shared):
+        shared._check_fork()
+        with shared.lock:
+            idle = list(shared.idle)
+            shared.idle.clear()
+            shared.opened -= len(idle)
+            shared.condition.notify_all()
+        for entry in idle: close_quietly(entry.con)
+    def stats(shared):
+        with shared.lock:
+            return dict(pool_size=shared.pool_size, max_overflow=shared.max_overflow,
+                        opened=shared.opened, idle=len(shared.idle), checked_out=shared.opened - len(shared.idle),
+                        checkouts=shared.checkouts, connects=shared.connects, waits=shared.waits,
+                        wait_time=shared.wait_time, timeouts=shared.timeouts, recycled=shared.recycled,
+                        failed_pings=shared.failed_pings)
+
+def close_quietly(con):
+    try: con.close()
+    except Exception: pass
+
 class Pool(localbase):
     forked_connections = []
     def __init__(pool, dbapi_module, *args, **kwargs): # called separately in each thread
+        pool.shared = kwargs.pop('pony_shared_pool', None)
         pool.dbapi_module = dbapi_module
         pool.args = args
         pool.kwargs = kwargs
         pool.con = pool.pid = None
+        pool.prepared_statements = None  # sql -> statement info for server-side prepared statements of pool.con
     def connect(pool):
         pid = os.getpid()
         if pool.con is not None and pool.pid != pid:
             pool.forked_connections.append((pool.con, pool.pid))
-            pool.con = pool.pid = None
+            pool.con = pool.pid = pool.prepared_statements = None
         core = pony.orm.core
         is_new_connection = False
-        if pool.con is None:
+        if pool.con is None and pool.shared is not None:
+            is_new_connection = pool._checkout(pid)
+        elif pool.con is None:
             if core.local.debug: core.log_orm('GET NEW CONNECTION')
             is_new_connection = True
             pool._connect()
@@ -353,22 +493,58 @@ class Pool(localbase):
         elif core.local.debug:
             core.log_orm('GET CONNECTION FROM THE LOCAL POOL')
         return pool.con, is_new_connection
+    def _checkout(pool, pid):
+        core = pony.orm.core
+        shared = pool.shared
+        entry = shared.checkout()
+        if entry is not None:
+            if not shared.pre_ping or pool._ping(entry.con):
+                if core.local.debug: core.log_orm('GET CONNECTION FROM THE SHARED POOL')
+                pool.con, pool.pid, pool.prepared_statements = entry.con, entry.pid, entry.prepared_statements
+                return False
+            with shared.lock: shared.failed_pings += 1
+            close_quietly(entry.con)
+        if core.local.debug: core.log_orm('GET NEW CONNECTION')
+        try: pool._connect()
+        except:
+            pool.con = None
+            shared.discard(pid)
+            raise
+        pool.pid = pid
+        return True
+    def _ping(pool, con):
+        try:
+            cursor = con.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            con.rollback()
+        except Exception: return False
+        return True
     def _connect(pool):
         pool.con = pool.dbapi_module.connect(*pool.args, **pool.kwargs)
+    def _reset(pool, con):
+        con.rollback()
     def release(pool, con):
         assert con is pool.con
-        try: con.rollback()
+        try: pool._reset(con)
         except:
             pool.drop(con)
             raise
+        if pool.shared is not None:
+            entry = PooledConnection(con, pool.pid, pool.prepared_statements)
+            pool.con = pool.pid = pool.prepared_statements = None
+            pool.shared.checkin(entry)
     def drop(pool, con):
         assert con is pool.con, (con, pool.con)
-        pool.con = None
-        con.close()
+        pid = pool.pid
+        pool.con = pool.pid = pool.prepared_statements = None
+        try: con.close()
+        finally:
+            if pool.shared is not None: pool.shared.discard(pid)
     def disconnect(pool):
         con = pool.con
-        pool.con = None
-        if con is not None: con.close()
+        if con is not None: pool.drop(con)
+        if pool.shared is not None: pool.shared.clear()
 
 class Converter(object):
     EQ = 'EQ'
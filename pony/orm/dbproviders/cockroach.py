@@ -72,6 +72,9 @@ class CRProvider(PGProvider):
     array_converter_cls = CRArrayConverter
 
     default_schema_name = 'public'
+    copy_from_support = False
+    prepared_statements_support = False
+    server_side_cursor_in_transaction = False
 
     fk_types = { 'SERIAL' : 'INT8' }
 
@@ -93,6 +96,10 @@ class CRProvider(PGProvider):
         if db_session is not None and (db_session.serializable or db_session.ddl):
             cache.in_transaction = True
 
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, withhold=False):
+        return connection.cursor()  # CockroachDB does not support WITH HOLD cursors
+
     converter_classes = [
         (NoneType, dbapiprovider.NoneConverter),
         (bool, dbapiprovider.BoolConverter),
@@ -61,6 +61,16 @@ class MySQLValue(Value):
 class MySQLBuilder(SQLBuilder):
     dialect = 'MySQL'
     value_class = MySQLValue
+    def UPSERT(builder, table_name, columns, rows, conflict_columns, update_columns):
+        # MySQL checks all unique keys of the table, not only the specified one
+        quote_name = builder.quote_name
+        result = builder.INSERT_MANY(table_name, columns, rows)
+        if not update_columns:
+            column = quote_name(conflict_columns[0])
+            result.extend((' ON DUPLICATE KEY UPDATE ', column, ' = ', column))
+        else: result.extend((' ON DUPLICATE KEY UPDATE ', join(', ', [
+            (quote_name(column), ' = VALUES(', quote_name(column), ')') for column in update_columns ])))
+        return result
     def CONCAT(builder, *args):
         return 'concat(',  join(', ', imap(builder, args)), ')'
     def TRIM(builder, expr, chars=None):
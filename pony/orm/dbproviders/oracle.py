@@ -1,5 +1,5 @@
 from __future__ import absolute_import
-from pony.py23compat import PY2, iteritems, basestring, unicode, buffer, int_types
+from pony.py23compat import PY2, izip, imap, iteritems, basestring, unicode, buffer, int_types
 
 import os
 os.environ["NLS_LANG"] = "AMERICAN_AMERICA.UTF8"
@@ -15,7 +15,7 @@ from pony.orm import core, dbapiprovider, sqltranslation
 from pony.orm.core import log_orm, log_sql, DatabaseError, TranslationError
 from pony.orm.dbschema import DBSchema, DBObject, Table, Column
 from pony.orm.ormtypes import Json
-from pony.orm.sqlbuilding import SQLBuilder
+from pony.orm.sqlbuilding import SQLBuilder, join
 from pony.orm.dbapiprovider import DBAPIProvider, wrap_dbapi_exceptions, get_version_tuple
 from pony.utils import throw, is_ident
 
@@ -118,6 +118,7 @@ class OraConstMonad(sqltranslation.ConstMonad):
 class OraTranslator(sqltranslation.SQLTranslator):
     dialect = 'Oracle'
     rowid_support = True
+    row_value_comparison_syntax = False
     json_path_wildcard_syntax = True
     json_values_are_comparable = False
     NoneMonad = OraNoneMonad
@@ -130,6 +131,19 @@ class OraBuilder(SQLBuilder):
         if returning is not None:
             result.extend((' RETURNING ', builder.quote_name(returning), ' INTO :new_id'))
         return result
+    def UPSERT(builder, table_name, columns, rows, conflict_columns, update_columns):
+        quote_name = builder.quote_name
+        source = join(' UNION ALL ', [ ('SELECT ', join(', ', [ (builder(value), ' ', quote_name(column))
+                                                             for value, column in izip(row, columns) ]), ' FROM DUAL')
+                                       for row in rows ])
+        result = [ 'MERGE INTO ', quote_name(table_name), ' t USING (', source, ') s ON (',
+                   join(' AND ', [ ('t.', quote_name(column), ' = s.', quote_name(column))
+                                   for column in conflict_columns ]), ')' ]
+        if update_columns: result.extend((' WHEN MATCHED THEN UPDATE SET ', join(', ', [
+            ('t.', quote_name(column), ' = s.', quote_name(column)) for column in update_columns ])))
+        result.extend((' WHEN NOT MATCHED THEN INSERT (', join(', ', imap(quote_name, columns)), ') VALUES (',
+                       join(', ', [ ('s.', quote_name(column)) for column in columns ]), ')'))
+        return result
     def SELECT_FOR_UPDATE(builder, nowait, skip_locked, *sections):
         assert not builder.indent
         nowait = ' NOWAIT' if nowait else ''
@@ -393,6 +407,7 @@ class OraProvider(DBAPIProvider):
     index_if_not_exists_syntax = False
     varchar_default_max_len = 1000
     uint64_support = True
+    shared_pool_support = False  # OraPool is already shared, it is based on cx_Oracle.SessionPool
 
     dbapi_module = cx_Oracle
     dbschema_cls = OraSchema
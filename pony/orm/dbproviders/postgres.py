@@ -1,6 +1,9 @@
 from __future__ import absolute_import
-from pony.py23compat import PY2, basestring, unicode, buffer, int_types
+from pony.py23compat import PY2, imap, basestring, unicode, buffer, int_types
 
+import re
+from binascii import hexlify
+from itertools import count
 from decimal import Decimal
 from datetime import datetime, date, time, timedelta
 from uuid import UUID
@@ -29,7 +32,7 @@ from pony.orm.dbapiprovider import DBAPIProvider, Pool, wrap_dbapi_exceptions
 from pony.orm.sqltranslation import SQLTranslator
 from pony.orm.sqlbuilding import Value, SQLBuilder, join
 from pony.converting import timedelta2str
-from pony.utils import is_ident
+from pony.utils import is_ident, LRUCache
 
 NoneType = type(None)
 
@@ -179,22 +182,112 @@ class PGArrayConverter(dbapiprovider.ArrayConverter):
         float: ('double precision', PGRealConverter)
     }
 
+def copy_escape(s):
+    return s.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def float_literal(value):
+    if value != value: return u'NaN'
+    if value in (float('inf'), float('-inf')): return u'Infinity' if value > 0 else u'-Infinity'
+    return repr(value)
+
+def array_item_literal(item):
+    if item is None: return u'NULL'
+    if isinstance(item, basestring):
+        if PY2 and isinstance(item, str): item = item.decode('utf-8')
+        return u'"%s"' % item.replace('\\', '\\\\').replace('"', '\\"')
+    if isinstance(item, float): return float_literal(item)
+    return unicode(item)
+
+def copy_text_value(value):
+    # encodes value returned by converter.py2sql() for COPY ... FROM STDIN in text format
+    if value is None: return u'\\N'
+    if isinstance(value, bool): return u't' if value else u'f'
+    if isinstance(value, buffer): return u'\\\\x' + hexlify(value).decode('ascii')
+    if isinstance(value, basestring):
+        if PY2 and isinstance(value, str): value = value.decode('utf-8')
+        return copy_escape(value)
+    if isinstance(value, float): return float_literal(value)
+    if isinstance(value, timedelta):
+        return u'%d days %d seconds %d microseconds' % (value.days, value.seconds, value.microseconds)
+    if isinstance(value, (datetime, date, time)): return value.isoformat()
+    if isinstance(value, (list, tuple)): return copy_escape(u'{%s}' % u','.join(imap(array_item_literal, value)))
+    return copy_escape(unicode(value))
+
+class PGCopyStream(object):
+    # file-like object which encodes rows lazily, so COPY does not keep all rows in memory
+    def __init__(stream, rows):
+        stream.lines = (u'\t'.join(imap(copy_text_value, row)) + u'\n' for row in rows)
+        stream.buffer = b''
+    def read(stream, size=-1):
+        chunks = [ stream.buffer ]
+        length = len(stream.buffer)
+        while size < 0 or length < size:
+            line = next(stream.lines, None)
+            if line is None: break
+            chunk = line.encode('utf-8')
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        if size < 0 or length <= size: stream.buffer = b''
+        else: data, stream.buffer = data[:size], data[size:]
+        return data
+
+cursor_name_counter = count(1)
+statement_name_counter = count(1)
+
+param_re = re.compile(r'%%|%\((\w+)\)s')
+preparable_re = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b', re.IGNORECASE)
+
+def convert_to_prepared_sql(sql):
+    # '... WHERE "id" = %(p1)s' -> ('... WHERE "id" = $1', ['p1'])
+    param_names = []
+    def replace(match):
+        name = match.group(1)
+        if name is None: return '%'
+        if name not in param_names: param_names.append(name)
+        return '$%d' % (param_names.index(name) + 1)
+    return param_re.sub(replace, sql), param_names
+
+class PreparedStatement(object):
+    __slots__ = 'name', 'param_names', 'execute_sql'
+    def __init__(statement, name, param_names):
+        statement.name = name
+        statement.param_names = param_names
+        if not param_names: statement.execute_sql = 'EXECUTE ' + name
+        else:
+            params = ', '.join('%%(%s)s' % param_name for param_name in param_names)
+            statement.execute_sql = 'EXECUTE %s(%s)' % (name, params)
+
+class PreparedStatementCache(LRUCache):
+    def __init__(cache, maxsize):
+        LRUCache.__init__(cache, maxsize, cache.on_evict_statement)
+        cache.deallocated = []  # names of evicted statements which should be deallocated
+    def on_evict_statement(cache, sql, statement):
+        cache.deallocated.append(statement.name)
+
+# The same as DISCARD ALL, but keeps prepared statements of the connection
+RESET_SESSION_SQL = 'CLOSE ALL; SET SESSION AUTHORIZATION DEFAULT; RESET ALL; UNLISTEN *; ' \
+                    'SELECT pg_advisory_unlock_all(); DISCARD PLANS; DISCARD TEMP; DISCARD SEQUENCES'
+
 class PGPool(Pool):
+    def __init__(pool, dbapi_module, *args, **kwargs): # called separately in each thread
+        pool.prepared_statements_cache_size = kwargs.pop('pony_prepared_statements', None)
+        Pool.__init__(pool, dbapi_module, *args, **kwargs)
     def _connect(pool):
         pool.con = pool.dbapi_module.connect(*pool.args, **pool.kwargs)
         if 'client_encoding' not in pool.kwargs:
             pool.con.set_client_encoding('UTF8')
-    def release(pool, con):
-        assert con is pool.con
-        try:
-            con.rollback()
-            con.autocommit = True
-            cursor = con.cursor()
-            cursor.execute('DISCARD ALL')
-            con.autocommit = False
-        except:
-            pool.drop(con)
-            raise
+    def get_prepared_statements(pool):
+        statements = pool.prepared_statements
+        if statements is None:
+            statements = pool.prepared_statements = PreparedStatementCache(pool.prepared_statements_cache_size)
+        return statements
+    def _reset(pool, con):
+        con.rollback()
+        con.autocommit = True
+        cursor = con.cursor()
+        cursor.execute('DISCARD ALL' if pool.prepared_statements is None else RESET_SESSION_SQL)
+        con.autocommit = False
 
 class PGProvider(DBAPIProvider):
     dialect = 'PostgreSQL'
@@ -202,6 +295,10 @@ class PGProvider(DBAPIProvider):
     max_name_len = 63
     max_params_count = 10000
     index_if_not_exists_syntax = False
+    copy_from_support = True
+    prepared_statements_support = True
+    native_number_values = True
+    server_side_cursor_in_transaction = True
 
     dbapi_module = psycopg2
     dbschema_cls = PGSchema
@@ -225,6 +322,9 @@ class PGProvider(DBAPIProvider):
         return isinstance(exc, psycopg2.OperationalError) and exc.pgcode is None
 
     def get_pool(provider, *args, **kwargs):
+        if provider.prepared_statements_cache_size:
+            provider.unpreparable_sql = set()
+            kwargs['pony_prepared_statements'] = provider.prepared_statements_cache_size
         return PGPool(provider.dbapi_module, *args, **kwargs)
 
     @wrap_dbapi_exceptions
@@ -253,9 +353,58 @@ class PGProvider(DBAPIProvider):
             cursor.executemany(sql, arguments)
         else:
             if arguments is None: cursor.execute(sql)
+            elif provider.prepared_statements_cache_size and type(arguments) is dict and cursor.name is None \
+                    and cursor.connection is provider.pool.con:
+                provider._execute_prepared(cursor, sql, arguments)
             else: cursor.execute(sql, arguments)
             if returning_id: return cursor.fetchone()[0]
 
+    def _execute_prepared(provider, cursor, sql, arguments):
+        pool = provider.pool
+        statements = pool.get_prepared_statements()
+        statement = statements.get(sql)
+        if statement is None:
+            statement = provider._prepare(cursor, sql)
+            if statement is None: return cursor.execute(sql, arguments)
+            statements[sql] = statement
+            deallocated = statements.deallocated
+            while deallocated:
+                deallocate_sql = 'DEALLOCATE ' + deallocated.pop()
+                if core.local.debug: log_orm(deallocate_sql)
+                cursor.execute(deallocate_sql)
+        cursor.execute(statement.execute_sql, arguments)
+
+    def _prepare(provider, cursor, sql):
+        if sql in provider.unpreparable_sql or not preparable_re.match(sql): return None
+        prepared_sql, param_names = convert_to_prepared_sql(sql)
+        name = 'pony_ps_%d' % next(statement_name_counter)
+        prepare_sql = 'PREPARE %s AS %s' % (name, prepared_sql)
+        if core.local.debug: log_orm(prepare_sql)
+        in_transaction = not cursor.connection.autocommit
+        # a failed PREPARE (e.g. when the type of a parameter cannot be inferred) should not abort the transaction
+        if in_transaction: cursor.execute('SAVEPOINT pony_prepare')
+        try: cursor.execute(prepare_sql)
+        except psycopg2.ProgrammingError:
+            if in_transaction: cursor.execute('ROLLBACK TO SAVEPOINT pony_prepare')
+            provider.unpreparable_sql.add(sql)
+            return None
+        if in_transaction: cursor.execute('RELEASE SAVEPOINT pony_prepare')
+        return PreparedStatement(name, param_names)
+
+    @wrap_dbapi_exceptions
+    def server_side_cursor(provider, connection, withhold=False):
+        # named cursor keeps the result set on the server until the end of transaction,
+        # WITH HOLD cursor survives the commit, but then the whole result is materialized by the server
+        name = 'pony_cursor_%d' % next(cursor_name_counter)
+        return connection.cursor(name, withhold=withhold)
+
+    @wrap_dbapi_exceptions
+    def copy_from(provider, cursor, table_name, columns, rows):
+        quote_name = provider.quote_name
+        sql = 'COPY %s (%s) FROM STDIN' % (quote_name(table_name), ', '.join(imap(quote_name, columns)))
+        cursor.copy_expert(sql, PGCopyStream(rows))
+        return sql
+
     def table_exists(provider, connection, table_name, case_sensitive=True):
         schema_name, table_name = provider.split_table_name(table_name)
         cursor = connection.cursor()
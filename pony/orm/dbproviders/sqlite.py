@@ -12,6 +12,7 @@ from uuid import UUID
 from binascii import hexlify
 from functools import wraps
 
+from pony import options
 from pony.orm import core, dbschema, dbapiprovider
 from pony.orm.core import log_orm
 from pony.orm.ormtypes import Json, TrackedArray
@@ -81,6 +82,10 @@ class SQLiteBuilder(SQLBuilder):
     def INSERT(builder, table_name, columns, values, returning=None):
         if not values: return 'INSERT INTO %s DEFAULT VALUES' % builder.quote_name(table_name)
         return SQLBuilder.INSERT(builder, table_name, columns, values, returning)
+    def UPSERT(builder, table_name, columns, rows, conflict_columns, update_columns):
+        if sqlite.sqlite_version_info < (3, 24, 0): throw(NotImplementedError,
+            'Upsert requires SQLite 3.24.0 or newer. Got: %s' % sqlite.sqlite_version)
+        return SQLBuilder.UPSERT(builder, table_name, columns, rows, conflict_columns, update_columns)
     def STRING_SLICE(builder, expr, start, stop):
         if start is None:
             start = [ 'VALUE', None ]
@@ -297,6 +302,7 @@ class SQLiteProvider(DBAPIProvider):
     dialect = 'SQLite'
     local_exceptions = local_exceptions
     max_name_len = 1024
+    native_number_values = True
 
     dbapi_module = sqlite
     dbschema_cls = SQLiteSchema
@@ -437,6 +443,8 @@ class SQLiteProvider(DBAPIProvider):
             # 1 - SQLiteProvider.__init__()
             # 0 - pony.dbproviders.sqlite.get_pool()
             filename = absolutize_path(filename, frame_depth=cut_traceback_depth+5)
+        if filename == ':memory:' and kwargs.get('pony_shared_pool') is not None: throw(TypeError,
+            'Shared connection pool cannot be used with in-memory SQLite database')
         return SQLitePool(filename, create_db, **kwargs)
 
     def table_exists(provider, connection, table_name, case_sensitive=True):
@@ -635,13 +643,21 @@ class SQLitePool(Pool):
     def __init__(pool, filename, create_db, **kwargs): # called separately in each thread
         pool.filename = filename
         pool.create_db = create_db
+        pool.shared = kwargs.pop('pony_shared_pool', None)
         pool.kwargs = kwargs
-        pool.con = None
+        pool.con = pool.pid = pool.prepared_statements = None
+    def get_cached_statements_size(pool):
+        # sqlite3 module keeps an LRU of compiled statements per connection
+        return pool.kwargs.get('cached_statements', options.SQLITE_CACHED_STATEMENTS)
     def _connect(pool):
         filename = pool.filename
         if filename != ':memory:' and not pool.create_db and not os.path.exists(filename):
             throw(IOError, "Database file is not found: %r" % filename)
-        pool.con = con = sqlite.connect(filename, isolation_level=None, **pool.kwargs)
+        kwargs = dict(pool.kwargs, cached_statements=pool.get_cached_statements_size())
+        if pool.shared is not None:
+            # connection of the shared pool is used by different threads, but only by one thread at a time
+            kwargs = dict(kwargs, check_same_thread=False)
+        pool.con = con = sqlite.connect(filename, isolation_level=None, **kwargs)
         con.text_factory = _text_factory
 
         def create_function(name, num_params, func):
@@ -1,14 +1,19 @@
 from __future__ import absolute_import, print_function, division
-from pony.py23compat import PY2, izip, xrange, PY37, PYPY
+from pony.py23compat import PY2, izip, xrange, PY37, PYPY, unicode, int_types, iteritems
 
-import sys, types, inspect
+import os, sys, types, inspect, marshal, atexit, tempfile
+from hashlib import sha1
+from threading import Lock
+from contextlib import contextmanager
 from opcode import opname as opnames, HAVE_ARGUMENT, EXTENDED_ARG, cmp_op
 from opcode import hasconst, hasname, hasjrel, haslocal, hascompare, hasfree
 from collections import defaultdict
 
 from pony.thirdparty.compiler import ast, parse
 
-from pony.utils import throw, get_codeobject_id
+import pony
+from pony import options
+from pony.utils import throw, get_codeobject_id, LRUCache
 
 ##ast.And.__repr__ = lambda self: "And(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
 ##ast.Or.__repr__ = lambda self: "Or(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
@@ -16,7 +21,173 @@ from pony.utils import throw, get_codeobject_id
 class DecompileError(NotImplementedError):
     pass
 
-ast_cache = {}
+ast_cache = LRUCache(options.DECOMPILER_CACHE_SIZE)
+
+if PY2:
+    import imp
+    bytecode_magic = imp.get_magic()
+    replace_file = os.rename
+else:
+    from importlib.util import MAGIC_NUMBER as bytecode_magic
+    replace_file = os.replace
+
+try: import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class TranslationCache(object):
+    # Persistent cache of decompiled query ASTs keyed by the digest of marshalled code object,
+    # so new processes do not need to decompile the same generators and lambdas again.
+    # The file is written with marshal and every node is validated on load, so it never executes code
+    def __init__(cache, filename):
+        cache.filename = filename
+        cache.version = bytecode_magic, pony.__version__
+        cache.lock = Lock()
+        cache.entries = cache.load()
+        cache.modified = False
+    def load(cache):
+        try:
+            with open(cache.filename, 'rb') as f:
+                if not is_owned_by_current_user(f): return {}
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return {}
+        if type(data) is not dict or data.get('version') != cache.version: return {}
+        entries = data.get('entries')
+        if type(entries) is not dict: return {}
+        return entries
+    def get_ast(cache, codeobject):
+        encoded = cache.entries.get(get_codeobject_digest(codeobject))
+        if encoded is None: return None
+        try: return decode_ast(encoded)
+        except ValueError: return None
+    def put_ast(cache, codeobject, result):
+        try: encoded = encode_ast(result)
+        except TypeError: return
+        with cache.lock:
+            cache.entries[get_codeobject_digest(codeobject)] = encoded
+            cache.modified = True
+    def save(cache):
+        with cache.lock:
+            if not cache.modified: return
+            cache.modified = False
+        dirname, basename = os.path.split(os.path.abspath(cache.filename))
+        with file_lock(cache.filename + '.lock'):
+            entries = cache.load()  # other processes may have saved their entries already
+            with cache.lock: entries.update(cache.entries)
+            fd, tmp_filename = tempfile.mkstemp(prefix=basename + '.', suffix='.tmp', dir=dirname)
+            try:
+                with os.fdopen(fd, 'wb') as f: marshal.dump(dict(version=cache.version, entries=entries), f)
+                replace_file(tmp_filename, cache.filename)
+            except:
+                os.remove(tmp_filename)
+                raise
+
+def is_owned_by_current_user(f):
+    if not hasattr(os, 'getuid'): return True  # Windows
+    return os.fstat(f.fileno()).st_uid == os.getuid()
+
+@contextmanager
+def file_lock(filename):
+    # Serializes read-merge-write cycles of different processes which share the same cache file
+    with open(filename, 'a+b') as f:
+        if fcntl is not None: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try: yield
+        finally:
+            if fcntl is not None: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class_types = (type, types.ClassType) if PY2 else type
+
+ast_value_types = {type(None), bool, float, complex, bytes, unicode, type(Ellipsis)}
+ast_value_types.update(int_types)
+ast_sequence_types = dict((t.__name__, t) for t in (tuple, list, set, frozenset))
+
+def encode_ast(x):
+    # Converts decompiled AST into nested tuples of plain values which marshal can store
+    t = type(x)
+    if isinstance(x, ast.Node):
+        return 'node', x.__class__.__name__, dict((name, encode_ast(value)) for name, value in iteritems(x.__dict__))
+    if t in ast_value_types: return 'value', x
+    if t in (tuple, list, set, frozenset):
+        return t.__name__, tuple(encode_ast(item) for item in x)
+    if t is dict: return 'dict', tuple((encode_ast(key), encode_ast(value)) for key, value in iteritems(x))
+    throw(TypeError, 'Cannot store value of type %s in translation cache' % t.__name__)
+
+def decode_ast(x):
+    if type(x) is not tuple or not x or type(x[0]) is not str: throw(ValueError, 'Invalid translation cache entry')
+    kind = x[0]
+    if kind == 'value' and len(x) == 2 and type(x[1]) in ast_value_types: return x[1]
+    if kind == 'node' and len(x) == 3 and type(x[2]) is dict:
+        cls = getattr(ast, x[1], None) if type(x[1]) is str else None
+        if isinstance(cls, class_types) and issubclass(cls, ast.Node):
+            node = types.InstanceType(cls) if PY2 else cls.__new__(cls)
+            for name, value in iteritems(x[2]):
+                if type(name) is not str: throw(ValueError, 'Invalid translation cache entry')
+                node.__dict__[name] = decode_ast(value)
+            return node
+    elif len(x) == 2 and type(x[1]) is tuple:
+        if kind in ast_sequence_types: return ast_sequence_types[kind](decode_ast(item) for item in x[1])
+        if kind == 'dict':
+            result = {}
+            for pair in x[1]:
+                if type(pair) is not tuple or len(pair) != 2: throw(ValueError, 'Invalid translation cache entry')
+                result[decode_ast(pair[0])] = decode_ast(pair[1])
+            return result
+    throw(ValueError, 'Invalid translation cache entry')
+
+def get_codeobject_digest(codeobject):
+    return sha1(marshal.dumps(codeobject)).hexdigest()
+
+translation_cache = None
+
+def use_translation_cache(filename):
+    global translation_cache
+    if translation_cache is not None:
+        if translation_cache.filename == filename: return translation_cache
+        translation_cache.save()
+    else: atexit.register(save_translation_cache)
+    translation_cache = TranslationCache(filename)
+    return translation_cache
+
+def save_translation_cache():
+    if translation_cache is not None: translation_cache.save()
+
+def get_loaded_names(code):
+    # Names of local and free variables which are read by the code object itself, not by nested code objects.
+    # Free variables which are only passed to nested generators and lambdas are loaded by LOAD_CLOSURE instead
+    PY36 = sys.version_info >= (3, 6)
+    co_code = bytearray(code.co_code)
+    free = code.co_cellvars + code.co_freevars
+    load_opnames = ('LOAD_FAST', 'LOAD_DEREF', 'LOAD_CLASSDEREF')
+    result = set()
+    i = 0
+    extended_arg = 0
+    while i < len(co_code):
+        op = co_code[i]
+        if PY36:
+            oparg = co_code[i+1] | extended_arg
+            i += 2
+        elif op >= HAVE_ARGUMENT:
+            oparg = co_code[i+1] + co_code[i+2] * 256 + extended_arg
+            i += 3
+        else:
+            i += 1
+            continue
+        if op == EXTENDED_ARG:
+            extended_arg = oparg << (8 if PY36 else 16)
+            continue
+        extended_arg = 0
+        if opnames[op] not in load_opnames: continue
+        if op in haslocal: result.add(code.co_varnames[oparg])
+        else: result.add(free[oparg])
+    return result
 
 def decompile(x):
     cells = {}
@@ -33,8 +204,12 @@ def decompile(x):
     key = get_codeobject_id(codeobject)
     result = ast_cache.get(key)
     if result is None:
-        decompiler = Decompiler(codeobject)
-        result = decompiler.ast, decompiler.external_names
+        cache = translation_cache
+        if cache is not None: result = cache.get_ast(codeobject)
+        if result is None:
+            decompiler = Decompiler(codeobject)
+            result = decompiler.ast, decompiler.external_names
+            if cache is not None: cache.put_ast(codeobject, result)
         ast_cache[key] = result
     return result + (cells,)
 
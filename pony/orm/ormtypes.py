@@ -7,7 +7,8 @@ from datetime import date, time, datetime, timedelta
 from functools import wraps, WRAPPER_ASSIGNMENTS
 from uuid import UUID
 
-from pony.utils import throw, parse_expr, deref_proxy
+from pony import options
+from pony.utils import throw, parse_expr, deref_proxy, LRUCache
 
 NoneType = type(None)
 
@@ -66,7 +67,7 @@ class MethodType(object):
     def __hash__(self):
         return hash(self.obj) ^ hash(self.func)
 
-raw_sql_cache = {}
+raw_sql_cache = LRUCache(options.RAW_SQL_CACHE_SIZE)
 
 def parse_raw_sql(sql):
     result = raw_sql_cache.get(sql)
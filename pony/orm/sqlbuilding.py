@@ -231,9 +231,26 @@ class SQLBuilder(object):
         return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
                  join(', ', [builder.quote_name(column) for column in columns ]),
                  ') VALUES (', join(', ', [builder(value) for value in values]), ')' ]
+    def INSERT_MANY(builder, table_name, columns, rows):
+        return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
+                 join(', ', [builder.quote_name(column) for column in columns ]),
+                 ') VALUES ', join(', ', [ ('(', join(', ', [builder(value) for value in row]), ')')
+                                           for row in rows ]) ]
+    def UPSERT(builder, table_name, columns, rows, conflict_columns, update_columns):
+        quote_name = builder.quote_name
+        result = builder.INSERT_MANY(table_name, columns, rows)
+        result.extend((' ON CONFLICT (', join(', ', imap(quote_name, conflict_columns)), ')'))
+        if not update_columns: result.append(' DO NOTHING')
+        else: result.extend((' DO UPDATE SET ', join(', ', [ (quote_name(column), ' = excluded.', quote_name(column))
+                                                            for column in update_columns ])))
+        return result
     def DEFAULT(builder):
         return 'DEFAULT'
-    def UPDATE(builder, table_name, pairs, where=None):
+    def UPDATE(builder, table_name, pairs, where=None, alias=None):
+        if alias is not None:
+            # Query.update(): conditions refer to the table by alias which cannot be declared in UPDATE
+            builder.indent += 1
+            builder.suppress_aliases = True
         return [ 'UPDATE ', builder.quote_name(table_name), '\nSET ',
                  join(', ', [ (builder.quote_name(name), ' = ', builder(param)) for name, param in pairs]),
                  where and [ '\n', builder(where) ] or [] ]
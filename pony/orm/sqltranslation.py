@@ -81,6 +81,7 @@ local = Local()
 class SQLTranslator(ASTTranslator):
     dialect = None
     row_value_syntax = True
+    row_value_comparison_syntax = True
     json_path_wildcard_syntax = False
     json_values_are_comparable = True
     rowid_support = False
@@ -265,6 +266,7 @@ class SQLTranslator(ASTTranslator):
         translator.conditions = translator.sqlquery.conditions
         translator.having_conditions = []
         translator.order = []
+        translator.nullable_order = []  # order expressions which can be NULL
         translator.limit = translator.offset = None
         translator.inside_order_by = False
         translator.aggregated = False if not optimize else True
@@ -653,8 +655,11 @@ class SQLTranslator(ASTTranslator):
         return [ 'SELECT', select_ast, from_ast, where_ast ] + other_ast
     def construct_sql_ast(translator, limit=None, offset=None, distinct=None,
                           aggr_func_name=None, aggr_func_distinct=None, sep=None,
-                          for_update=False, nowait=False, skip_locked=False, is_not_null_checks=False):
+                          for_update=False, nowait=False, skip_locked=False, is_not_null_checks=False,
+                          keyset=None, prefetch_joins=()):
+        # keyset is None, 'FIRST' or 'AFTER'. Columns of the keyset order are added to the end of the select list
         attr_offsets = None
+        from_ast = translator.sqlquery.from_ast
         if distinct is None:
             if not translator.order:
                 distinct = translator.distinct
@@ -721,10 +726,18 @@ class SQLTranslator(ASTTranslator):
              and not translator.aggregated and not translator.optimize:
             select_ast, attr_offsets = translator.expr_type._construct_select_clause_(
                 translator.alias, distinct, translator.tableref.used_attrs)
+            if prefetch_joins: from_ast = translator.construct_prefetch_joins(prefetch_joins, select_ast, attr_offsets)
+        order = translator.order
+        if keyset is not None:
+            assert not aggr_func_name
+            keys = translator.get_keyset_order(distinct)
+            select_ast = select_ast + [ expr for expr, desc in keys ]
+            order = [ [ 'DESC', expr ] if desc else expr for expr, desc in keys ]
         sql_ast.append(select_ast)
-        sql_ast.append(translator.sqlquery.from_ast)
+        sql_ast.append(from_ast)
 
         conditions = translator.conditions[:]
+        if keyset == 'AFTER': conditions.append(translator.construct_keyset_condition(keys))
         having_conditions = translator.having_conditions[:]
         if is_not_null_checks:
             for monad in translator.expr_monads:
@@ -749,7 +762,7 @@ class SQLTranslator(ASTTranslator):
                 'query must have grouping columns (i.e. resulting non-aggregated values)')
             sql_ast.append([ 'HAVING' ] + having_conditions)
 
-        if translator.order and not aggr_func_name: sql_ast.append([ 'ORDER_BY' ] + translator.order)
+        if order and not aggr_func_name: sql_ast.append([ 'ORDER_BY' ] + order)
 
         limit, offset = combine_limit_and_offset(translator.limit, translator.offset, limit, offset)
         if limit is not None or offset is not None:
@@ -766,6 +779,97 @@ class SQLTranslator(ASTTranslator):
 
         sql_ast = ast_transformer(sql_ast)
         return sql_ast, attr_offsets
+    def construct_prefetch_joins(translator, prefetch_joins, select_ast, attr_offsets):
+        # Adds LEFT JOIN of each to-one relation and columns of related entity to the end of select list.
+        # prefetch_joins is a sequence of (attr, lazy attrs of related entity to select) pairs.
+        # Offsets of related entity are stored in attr_offsets['prefetch_joins'] as (attr, offsets) pairs
+        from_ast = translator.sqlquery.from_ast
+        if from_ast[0] == 'FROM':
+            # joins with condition in FROM section are inner joins and cannot be mixed with LEFT JOIN
+            if any(len(item) == 4 for item in from_ast[1:]): return from_ast
+        elif from_ast[0] != 'LEFT_JOIN': return from_ast
+        alias = translator.alias
+        for i in xrange(1, len(from_ast)):
+            if from_ast[i][0] == alias and from_ast[i][1] == 'TABLE': break
+        else: return from_ast
+        for j in xrange(i+1, len(from_ast)):
+            if len(from_ast[j]) < 4: break  # item without join condition
+        else: j = len(from_ast)
+        entity = translator.expr_type
+        used_aliases = set(translator.sqlquery.alias_counters)
+        used_aliases.update(item[0] for item in from_ast[1:])
+        joins = []
+        join_items = []
+        for attr, attrs_to_prefetch in prefetch_joins:
+            rentity = attr.py_type
+            name = attr.name[:max_alias_length-3].lower()
+            ralias, k = name, 1
+            while ralias in used_aliases or ralias == 't':
+                k += 1
+                ralias = '%s-%d' % (name, k)
+            used_aliases.add(ralias)
+            if attr.columns: join_cond = join_tables(alias, ralias, attr.columns, rentity._pk_columns_)
+            else: join_cond = join_tables(alias, ralias, entity._pk_columns_, attr.reverse.columns)
+            if rentity._discriminator_attr_ and rentity is not rentity._root_:
+                join_cond = sqland([ join_cond, rentity._construct_discriminator_criteria_(ralias) ])
+            join_items.append([ ralias, 'TABLE', rentity._table_, join_cond ])
+            rselect_ast, roffsets = rentity._construct_select_clause_(ralias, query_attrs=attrs_to_prefetch)
+            base = len(select_ast) - 1
+            for offsets in roffsets.values(): offsets[:] = [ offset + base for offset in offsets ]
+            select_ast.extend(rselect_ast[1:])
+            joins.append((attr, roffsets))
+        attr_offsets['prefetch_joins'] = tuple(joins)
+        return [ 'LEFT_JOIN' ] + from_ast[1:j] + join_items + from_ast[j:]
+    def get_keyset_order(translator, distinct=None):
+        # order of the query as list of (expr_ast, desc) pairs, completed by columns which make it unique:
+        # result columns of DISTINCT query or primary keys of all tables which can multiply rows otherwise
+        if translator.aggregated or translator.groupby_monads or translator.having_conditions: throw(TranslationError,
+            'Keyset pagination cannot be used with aggregated queries')
+        if translator.sqlquery.from_ast[0] == 'LEFT_JOIN': throw(TranslationError,
+            'Keyset pagination cannot be used with queries which use LEFT JOIN')
+        if distinct is None and not translator.order: distinct = translator.distinct
+        nullable_order = translator.nullable_order
+        keys = []
+        exprs = []
+        for item in translator.order:
+            desc = item[0] == 'DESC'
+            expr = item[1] if desc else item
+            if expr in nullable_order: throw(TranslationError,
+                'Keyset pagination cannot be used with order expressions which can be NULL')
+            if expr[0] == 'VALUE': expr = translator.expr_columns[expr[1] - 1]
+            if expr not in exprs:
+                exprs.append(expr)
+                keys.append((expr, desc))
+        if distinct: unique_exprs = translator.expr_columns
+        else:
+            unique_exprs = []
+            for name_path, tableref in sorted(items_list(translator.sqlquery.tablerefs)):
+                if isinstance(tableref, JoinedTableRef):
+                    if not tableref.attr.is_collection or not tableref.joined: continue
+                    pk_columns = tableref.pk_columns
+                elif type(tableref) in (TableRef, StarTableRef): pk_columns = tableref.entity._pk_columns_
+                else: throw(TranslationError,
+                    'Keyset pagination cannot be used with this query: rows of the query cannot be made unique')
+                unique_exprs.extend([ 'COLUMN', tableref.alias, column ] for column in pk_columns)
+        for expr in unique_exprs:
+            if expr not in exprs:
+                exprs.append(expr)
+                keys.append((expr, False))
+        return keys
+    def construct_keyset_condition(translator, keys):
+        params = [ [ 'PARAM', ('KEYSET', i, None), None ] for i in xrange(len(keys)) ]
+        directions = set(desc for expr, desc in keys)
+        if len(keys) == 1 or translator.row_value_syntax and translator.row_value_comparison_syntax \
+                             and len(directions) == 1:
+            op = 'LT' if keys[0][1] else 'GT'
+            if len(keys) == 1: return [ op, keys[0][0], params[0] ]
+            return [ op, [ 'ROW' ] + [ expr for expr, desc in keys ], [ 'ROW' ] + params ]
+        alternatives = []
+        for i, (expr, desc) in enumerate(keys):
+            conditions = [ [ 'EQ', keys[j][0], params[j] ] for j in xrange(i) ]
+            conditions.append([ 'LT' if desc else 'GT', expr, params[i] ])
+            alternatives.append([ 'AND' ] + conditions if len(conditions) > 1 else conditions[0])
+        return [ 'OR' ] + alternatives
     def construct_delete_sql_ast(translator):
         entity = translator.expr_type
         expr_monad = translator.tree.expr.monad
@@ -807,6 +911,40 @@ class SQLTranslator(ASTTranslator):
             delete_where_ast = [ 'WHERE', [ 'IN', outer_expr, subquery_ast ] ]
             sql_ast = [ 'DELETE', None, delete_from_ast, delete_where_ast ]
         return sql_ast
+    def construct_update_sql_ast(translator, pairs):
+        entity = translator.expr_type
+        expr_monad = translator.tree.expr.monad
+        if not isinstance(entity, EntityMeta): throw(TranslationError,
+            'Update query should be applied to a single entity. Got: %s' % ast2src(translator.tree.expr))
+        force_in = bool(translator.groupby_monads)
+        if not force_in: assert not translator.having_conditions
+        tableref = expr_monad.tableref
+        from_ast = translator.sqlquery.from_ast
+        if from_ast[0] != 'FROM': force_in = True
+
+        if not force_in and len(from_ast) == 2 and not translator.sqlquery.used_from_subquery:
+            where_ast = [ 'WHERE' ] + translator.conditions if translator.conditions else None
+            return [ 'UPDATE', entity._table_, pairs, where_ast, tableref.alias ]
+        if len(entity._pk_columns_) == 1:
+            inner_expr = expr_monad.getsql()
+            outer_expr = [ 'COLUMN', None, entity._pk_columns_[0] ]
+        elif translator.rowid_support:
+            inner_expr = [ [ 'COLUMN', tableref.alias, 'ROWID' ] ]
+            outer_expr = [ 'COLUMN', None, 'ROWID' ]
+        elif translator.row_value_syntax:
+            inner_expr = expr_monad.getsql()
+            outer_expr = [ 'ROW' ] + [ [ 'COLUMN', None, column_name ] for column_name in entity._pk_columns_ ]
+        else: throw(NotImplementedError)
+        subquery_ast = [ 'SELECT', [ 'ALL' ] + inner_expr, from_ast ]
+        if translator.conditions:
+            subquery_ast.append([ 'WHERE' ] + translator.conditions)
+        if translator.dialect == 'MySQL':
+            # MySQL does not allow to select from the table being updated unless it is wrapped into a derived table
+            alias = 't-1'
+            subquery_ast = [ 'SELECT', [ 'ALL' ] + [ [ 'COLUMN', alias, column_name ]
+                                                     for column_name in entity._pk_columns_ ],
+                             [ 'FROM', [ alias, 'SELECT', subquery_ast[1:] ] ] ]
+        return [ 'UPDATE', entity._table_, pairs, [ 'WHERE', [ 'IN', outer_expr, subquery_ast ] ], tableref.alias ]
     def get_used_attrs(translator):
         if isinstance(translator.expr_type, EntityMeta) and not translator.aggregated and not translator.optimize:
             return translator.tableref.used_attrs
@@ -819,6 +957,7 @@ class SQLTranslator(ASTTranslator):
         if 0 in numbers: throw(ValueError, 'Numeric arguments of order_by() method must be non-zero')
         translator = deepcopy(translator)
         order = translator.order = translator.order[:]  # only order will be changed
+        translator.nullable_order = translator.nullable_order[:]
         expr_monads = translator.expr_monads
         new_order = []
         for i in numbers:
@@ -832,6 +971,7 @@ class SQLTranslator(ASTTranslator):
                     "(query result is single list of elements and has only one 'column')" % i)
             for pos in monad.orderby_columns:
                 new_order.append(i < 0 and [ 'DESC', [ 'VALUE', pos ] ] or [ 'VALUE', pos ])
+                if monad.nullable: translator.nullable_order.append([ 'VALUE', pos ])
         order[:0] = new_order
         return translator
     def order_by_attributes(translator, attrs):
@@ -841,6 +981,7 @@ class SQLTranslator(ASTTranslator):
             'Try use other forms of ordering (by tuple element numbers or by full-blown lambda expr).')
         translator = deepcopy(translator)
         order = translator.order = translator.order[:]  # only order will be changed
+        translator.nullable_order = translator.nullable_order[:]
         alias = translator.alias
         new_order = []
         for x in attrs:
@@ -857,6 +998,7 @@ class SQLTranslator(ASTTranslator):
                 'Collection attribute %s cannot be used for ordering' % attr)
             for column in attr.columns:
                 new_order.append(desc_wrapper([ 'COLUMN', alias, column]))
+                if attr.nullable: translator.nullable_order.append([ 'COLUMN', alias, column ])
         order[:0] = new_order
         return translator
     def apply_kwfilters(translator, filterattrs, original_names=False):
@@ -914,7 +1056,9 @@ class SQLTranslator(ASTTranslator):
                             if isinstance(type(t), type): t = t.__name__
                             throw(TranslationError, 'Set of %s (%s) cannot be used for ordering'
                                                     % (t, ast2src(node)))
-                        new_order.extend(node.monad.getsql())
+                        order_sql = node.monad.getsql()
+                        new_order.extend(order_sql)
+                        if node.monad.nullable: translator.nullable_order.extend(order_sql)
                     translator.order[:0] = new_order
                     translator.inside_order_by = False
                 else:
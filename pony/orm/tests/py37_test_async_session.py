@@ -0,0 +1,162 @@
+from __future__ import absolute_import, print_function, division
+
+import asyncio, os, shutil, tempfile, threading, unittest
+
+from pony.orm.core import *
+from pony.orm.core import local
+from pony.orm.tests.testutils import *
+from pony.orm.tests import only_for
+from pony.orm import asynchronous
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+@only_for('sqlite')
+class TestAsyncSession(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = tempfile.mkdtemp()
+        db.bind('sqlite', os.path.join(cls.dirname, 'test.sqlite'), create_db=True)
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            Person(id=1, name='John', age=20)
+            Person(id=2, name='Mary', age=30)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.disconnect()
+        shutil.rmtree(cls.dirname)
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try: return loop.run_until_complete(coro)
+        finally: loop.close()
+
+    def test_fetch(self):
+        async def main():
+            async with db_session:
+                persons = await Person.select().order_by(Person.id).fetch_async()
+                return [ p.name for p in persons ]
+        self.assertEqual(self.run_async(main()), ['John', 'Mary'])
+
+    def test_loop_thread_is_not_blocked(self):
+        async def main():
+            async with db_session:
+                return await run_async(threading.current_thread)
+        self.assertIsNot(self.run_async(main()), threading.current_thread())
+
+    def test_flush(self):
+        async def main():
+            async with db_session:
+                p = Person(name='Kate', age=40)
+                await p.flush_async()
+                self.assertIsNotNone(p.id)
+                found = await run_async(lambda: Person.get(name='Kate'))
+                self.assertIs(found, p)
+                await run_async(rollback)
+        async def check():
+            async with db_session:
+                return await run_async(lambda: Person.get(name='Kate'))
+        self.run_async(main())
+        self.assertIsNone(self.run_async(check()))
+
+    def test_commit_on_exit(self):
+        async def main():
+            async with db_session:
+                p = await run_async(Person.__getitem__, 1)
+                p.age += 1
+        async def check():
+            async with db_session:
+                return (await run_async(Person.__getitem__, 1)).age
+        age = self.run_async(check())
+        self.run_async(main())
+        self.assertEqual(self.run_async(check()), age + 1)
+
+    def test_concurrent_tasks(self):
+        async def task(pid):
+            async with db_session:
+                p = await run_async(Person.__getitem__, pid)
+                await asyncio.sleep(0.01)
+                self.assertEqual(len(local.db2cache), 1)
+                return p.name, id(local.db2cache[db])
+        async def main():
+            return await asyncio.gather(task(1), task(2), task(1))
+        results = self.run_async(main())
+        self.assertEqual([ name for name, cache_id in results ], ['John', 'Mary', 'John'])
+        self.assertEqual(len(set(cache_id for name, cache_id in results)), 3)
+        self.assertFalse(local.db2cache)
+
+    def test_rollback_on_exception(self):
+        async def main():
+            async with db_session:
+                p = await run_async(Person.__getitem__, 2)
+                p.name = 'Changed'
+                raise ZeroDivisionError
+        with self.assertRaises(ZeroDivisionError): self.run_async(main())
+        async def check():
+            async with db_session:
+                return (await run_async(Person.__getitem__, 2)).name
+        self.assertEqual(self.run_async(check()), 'Mary')
+
+    def test_limited_workers(self):
+        prev_workers = asynchronous.session_workers
+        asynchronous.session_workers = asynchronous.SessionWorkers(max_workers=1)
+        active = []
+        async def task():
+            async with db_session:
+                active.append(1)
+                self.assertEqual(len(active), 1)
+                await run_async(Person.select().count)
+                await asyncio.sleep(0.01)
+                active.pop()
+        async def main():
+            await asyncio.gather(task(), task(), task())
+        try: self.run_async(main())
+        finally: asynchronous.session_workers = prev_workers
+
+    def test_cancelled_waiter(self):
+        workers = asynchronous.SessionWorkers(max_workers=1)
+        async def main():
+            worker = await workers.acquire()
+            waiter = asyncio.ensure_future(workers.acquire())
+            await asyncio.sleep(0)
+            workers.release(worker)
+            await asyncio.sleep(0)  # the worker is handed over to the waiter, but the waiter is not resumed yet
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError): await waiter
+            self.assertEqual(workers.idle, [worker])
+            worker.shutdown()
+        self.run_async(main())
+
+    def test_loop_thread_access(self):
+        async def task(name, delay):
+            async with db_session:
+                await asyncio.sleep(delay)
+                Person(name=name, age=50)
+                flush()  # would use the connection of the loop thread
+                await asyncio.sleep(0.01)
+        async def main():
+            return await asyncio.gather(task('A', 0), task('B', 0.005), return_exceptions=True)
+        results = self.run_async(main())
+        self.assertEqual([ type(result) for result in results ], [TransactionError, TransactionError])
+        self.assertIn('should be performed in the worker of the session', str(results[0]))
+
+    def test_loop_thread_load(self):
+        async def main():
+            async with db_session:
+                p = Person._get_by_raw_pkval_((1,))  # not loaded yet
+                return p.name
+        with self.assertRaises(TransactionError): self.run_async(main())
+
+    @raises_exception(TransactionError, 'Async database calls require `async with db_session`')
+    def test_no_session(self):
+        run_async(Person.select().count)
+
+
+if __name__ == '__main__':
+    unittest.main()
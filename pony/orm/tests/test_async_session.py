@@ -0,0 +1,4 @@
+from sys import version_info
+
+if version_info[:2] >= (3, 7):
+    from pony.orm.tests.py37_test_async_session import *
@@ -0,0 +1,94 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+from pony.utils import LRUCache
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), dict(size=2, maxsize=2, hits=3, misses=1, evictions=1))
+
+    def test_unlimited(self):
+        cache = LRUCache()
+        for i in range(100): cache[i] = i
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_resize(self):
+        cache = LRUCache()
+        for i in range(10): cache[i] = i
+        cache.resize(3)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 7)
+        self.assertTrue(9 in cache)
+        self.assertFalse(6 in cache)
+
+    def test_delete(self):
+        cache = LRUCache(5)
+        cache['a'] = 1
+        del cache['a']
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.pop('a'), None)
+
+    def test_on_evict(self):
+        evicted = []
+        cache = LRUCache(2, on_evict=lambda key, value: evicted.append((key, value)))
+        for i in range(4): cache[i] = str(i)
+        self.assertEqual(evicted, [(0, '0'), (1, '1')])
+
+
+class TestCacheStats(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def test_translator_cache(self):
+        with db_session:
+            for x in range(3):
+                select(p for p in Person if p.age > x)[:]
+        stats = db.cache_stats
+        self.assertEqual(sorted(stats), ['adapted_sql', 'decompiler', 'extractors', 'raw_sql', 'sql', 'string2ast',
+                                         'translator'])
+        self.assertGreaterEqual(stats['translator']['hits'], 2)
+        self.assertGreaterEqual(stats['sql']['hits'], 2)
+
+    def test_limited_translator_cache(self):
+        cache = db._translator_cache
+        maxsize = cache.maxsize
+        cache.resize(1)
+        try:
+            with db_session:
+                select(p.name for p in Person)[:]
+                select(p.age for p in Person)[:]
+                self.assertEqual(len(cache), 1)
+                self.assertEqual(select(p.name for p in Person if p.age > 100)[:], [])
+        finally:
+            cache.resize(maxsize)
+        self.assertGreaterEqual(db.cache_stats['translator']['evictions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+
+db = Database()
+
+
+class Category(db.Entity):
+    name = Required(unicode)
+    products = Set('Product')
+
+
+class Product(db.Entity):
+    name = Required(unicode)
+    price = Required(Decimal)
+    category = Optional(Category)
+
+
+class TestCompiledQuery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            c1 = Category(id=1, name='Books')
+            c2 = Category(id=2, name='Music')
+            for i in range(1, 7):
+                Product(id=i, name='P%d' % i, price=i * 10, category=c1 if i % 2 else c2)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_simple(self):
+        q = db.compile(lambda min_price: select(p.name for p in Product if p.price > min_price).order_by(1))
+        self.assertEqual(q(40), ['P5', 'P6'])
+        self.assertEqual(len(q.entries), 1)
+        self.assertEqual(q(20), ['P3', 'P4', 'P5', 'P6'])
+        self.assertEqual(q(min_price=50), ['P6'])
+        self.assertEqual(len(q.entries), 1)
+
+    def test_objects(self):
+        q = db.compile(lambda c: Product.select(lambda p: p.category == c).order_by(Product.id))
+        self.assertEqual(q(Category[1]), [Product[1], Product[3], Product[5]])
+        self.assertEqual(q(Category[2]), [Product[2], Product[4], Product[6]])
+
+    def test_expression(self):
+        q = db.compile(lambda x, y=1: select(p.id for p in Product if p.price >= x * 10 and p.id != y))
+        self.assertEqual(set(q(5)), {5, 6})
+        self.assertEqual(set(q(1)), {2, 3, 4, 5, 6})
+        self.assertEqual(set(q(1, 2)), {1, 3, 4, 5, 6})
+
+    def test_new_vartypes(self):
+        q = db.compile(lambda ids: select(p.id for p in Product if p.id in ids))
+        self.assertEqual(set(q((1, 2))), {1, 2})
+        self.assertEqual(set(q((3, 4, 5))), {3, 4, 5})
+        self.assertEqual(set(q((6, 1))), {1, 6})
+        self.assertEqual(len(q.entries), 2)
+
+    def test_none(self):
+        q = db.compile(lambda c: select(p.id for p in Product if p.category == c))
+        self.assertEqual(q(None), [])
+        self.assertEqual(set(q(Category[2])), {2, 4, 6})
+        self.assertEqual(q(None), [])
+
+    def test_limit(self):
+        q = db.compile(lambda x: select(p for p in Product if p.price > x).order_by(desc(Product.price)), limit=2)
+        self.assertEqual(q(0), [Product[6], Product[5]])
+        self.assertEqual(q(0), [Product[6], Product[5]])
+
+    def test_closure(self):
+        threshold = [30]
+        q = db.compile(lambda: select(p.id for p in Product if p.price <= threshold[0]))
+        self.assertEqual(set(q()), {1, 2, 3})
+        threshold[0] = 10
+        self.assertEqual(set(q()), {1})
+
+    def test_keyword_filter(self):
+        q = db.compile(lambda n: Product.select(name=n))
+        self.assertEqual(q('P1'), [Product[1]])
+        self.assertEqual(q('P2'), [Product[2]])
+        self.assertFalse(q.compilable)
+
+    def test_value_dependent_shape(self):
+        def products(min_price, only_books, descending):
+            q = select(p for p in Product if p.price > min_price)
+            if only_books: q = q.filter(lambda p: p.category.name == 'Books')
+            return q.order_by(desc(Product.id) if descending else Product.id)
+        q = db.compile(products)
+        self.assertEqual(q(10, True, False), [Product[3], Product[5]])
+        self.assertEqual(q(10, False, False), [Product[2], Product[3], Product[4], Product[5], Product[6]])
+        self.assertEqual(q(30, False, True), [Product[6], Product[5], Product[4]])
+        self.assertEqual(q(20, True, False), [Product[3], Product[5]])
+        self.assertEqual(q(40, False, True), [Product[6], Product[5]])
+        self.assertEqual(len(q.entries), 3)
+
+    def test_no_sql_generation(self):
+        q = db.compile(lambda x: select(p for p in Product if p.price > x))
+        q(10)
+        sql_cache_misses = db.cache_stats['sql']['misses']
+        translator_cache_hits = db.cache_stats['translator']['hits']
+        q(20)
+        self.assertEqual(db.cache_stats['sql']['misses'], sql_cache_misses)
+        self.assertEqual(db.cache_stats['translator']['hits'], translator_cache_hits)
+
+    @raises_exception(TypeError, 'Compiled function should return a query. Got: 1')
+    def test_not_query(self):
+        q = db.compile(lambda: 1)
+        q()
+
+    @raises_exception(TypeError, 'Function expected. Got: 1')
+    def test_not_function(self):
+        db.compile(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
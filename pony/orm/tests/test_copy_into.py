@@ -0,0 +1,143 @@
+# coding: utf-8
+
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from datetime import date, datetime, timedelta
+from math import isnan
+
+from pony.py23compat import buffer
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database, only_for
+
+try: from pony.orm.dbproviders import postgres
+except ImportError: postgres = None
+
+db = Database()
+
+
+class Record(db.Entity):
+    text = Optional(unicode, nullable=True)
+    data = Optional(bytes)
+    flag = Optional(bool)
+    number = Optional(float)
+    delta = Optional(timedelta)
+    created = Optional(datetime)
+    day = Optional(date)
+    ints = Optional(IntArray)
+    strs = Optional(StrArray)
+    floats = Optional(FloatArray)
+
+
+@unittest.skipIf(postgres is None, 'PostgreSQL provider requires psycopg2 module')
+class TestCopyTextValue(unittest.TestCase):
+    def test_escaping(self):
+        self.assertEqual(postgres.copy_text_value(u'a\tb\nc\\d\re'), u'a\\tb\\nc\\\\d\\re')
+
+    def test_null(self):
+        self.assertEqual(postgres.copy_text_value(None), u'\\N')
+        self.assertEqual(postgres.copy_text_value(u'\\N'), u'\\\\N')
+
+    def test_bool(self):
+        self.assertEqual(postgres.copy_text_value(True), u't')
+        self.assertEqual(postgres.copy_text_value(False), u'f')
+
+    def test_bytea(self):
+        self.assertEqual(postgres.copy_text_value(buffer(b'\x00\\\xff')), u'\\\\x005cff')
+
+    def test_floats(self):
+        self.assertEqual(postgres.copy_text_value(1.5), u'1.5')
+        self.assertEqual(postgres.copy_text_value(float('nan')), u'NaN')
+        self.assertEqual(postgres.copy_text_value(float('inf')), u'Infinity')
+        self.assertEqual(postgres.copy_text_value(float('-inf')), u'-Infinity')
+
+    def test_timedelta(self):
+        self.assertEqual(postgres.copy_text_value(timedelta(days=1, seconds=2, microseconds=3)),
+                         u'1 days 2 seconds 3 microseconds')
+        self.assertEqual(postgres.copy_text_value(timedelta(seconds=-1)), u'-1 days 86399 seconds 0 microseconds')
+
+    def test_dates(self):
+        self.assertEqual(postgres.copy_text_value(date(2020, 1, 2)), u'2020-01-02')
+        self.assertEqual(postgres.copy_text_value(datetime(2020, 1, 2, 3, 4, 5, 6)), u'2020-01-02T03:04:05.000006')
+
+    def test_int_array(self):
+        self.assertEqual(postgres.copy_text_value([1, 2, 3]), u'{1,2,3}')
+        self.assertEqual(postgres.copy_text_value([]), u'{}')
+
+    def test_str_array(self):
+        self.assertEqual(postgres.copy_text_value([u'a"b', u'c\\d', None, u'NULL', u'x,y', u'\t']),
+                         u'{"a\\\\"b","c\\\\\\\\d",NULL,"NULL","x,y","\\t"}')
+
+    def test_float_array(self):
+        self.assertEqual(postgres.copy_text_value([1.5, float('nan'), float('-inf')]), u'{1.5,NaN,-Infinity}')
+
+
+@unittest.skipIf(postgres is None, 'PostgreSQL provider requires psycopg2 module')
+class TestPGCopyStream(unittest.TestCase):
+    rows = [ [u'a', None, 1], [u'b\tc', True, 2.5], [u'привет', False, None] ]
+    data = u'a\t\\N\t1\nb\\tc\tt\t2.5\nпривет\tf\t\\N\n'.encode('utf-8')
+
+    def test_read_all(self):
+        stream = postgres.PGCopyStream(self.rows)
+        self.assertEqual(stream.read(), self.data)
+        self.assertEqual(stream.read(), b'')
+
+    def test_read_chunks(self):
+        stream = postgres.PGCopyStream(self.rows)
+        chunks = []
+        while True:
+            chunk = stream.read(3)
+            if not chunk: break
+            self.assertLessEqual(len(chunk), 3)
+            chunks.append(chunk)
+        self.assertEqual(b''.join(chunks), self.data)
+
+    def test_lazy(self):
+        def rows():
+            yield [u'a']
+            raise ZeroDivisionError
+        stream = postgres.PGCopyStream(rows())
+        self.assertEqual(stream.read(2), b'a\n')
+
+
+@only_for('postgres')
+class TestPGCopyInto(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def setUp(self):
+        with db_session:
+            Record.select().delete(bulk=True)
+
+    def test_round_trip(self):
+        values = dict(text=u'tab\there\nnew line\\back slash \\N', data=b'\x00\\\t\xff', flag=True,
+                      number=1.5, delta=timedelta(days=2, seconds=3, microseconds=4),
+                      created=datetime(2020, 1, 2, 3, 4, 5, 6), day=date(2020, 1, 2),
+                      ints=[1, 2, 3], strs=[u'a"b', u'c\\d', u'x,y', u'NULL', u'\t\n'],
+                      floats=[1.5, float('inf'), float('-inf')])
+        with db_session:
+            self.assertEqual(db.copy_into(Record, [ values, dict(text=None, number=float('nan')) ]), 2)
+        with db_session:
+            r1, r2 = Record.select().order_by(Record.id)[:]
+            for name, value in values.items():
+                self.assertEqual(getattr(r1, name), value)
+            self.assertIsNone(r2.text)
+            self.assertTrue(isnan(r2.number))
+            self.assertEqual(r2.ints, [])
+
+    def test_many_batches(self):
+        with db_session:
+            self.assertEqual(db.copy_into(Record, ({'text': u'r%d' % i} for i in range(25)), batch_size=10), 25)
+        with db_session:
+            self.assertEqual(count(r for r in Record), 25)
+            self.assertEqual(select(r.text for r in Record if r.text == u'r24')[:], [u'r24'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, print_function, division
+from pony.py23compat import PY2
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.core import NOT_LOADED
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+
+db = Database()
+
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+
+class Student(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    gpa = Optional(float)
+    group = Optional(Group)
+
+
+class TestDbvals(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            g = Group(number=1)
+            Student(id=1, name='John', gpa=3.5, group=g)
+            Student(id=2, name='Mary')
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    @db_session
+    def test_loaded_object(self):
+        s = Student[1]
+        self.assertEqual(s._dbvals_, {})  # values which are the same as in _vals_ are not duplicated
+        self.assertEqual(s._get_dbval_(Student.name), 'John')
+        self.assertIs(s._get_dbval_(Student.group), Group[1])
+        self.assertIs(s._get_dbval_(Group.students), NOT_LOADED)
+
+    @db_session
+    def test_modified_object(self):
+        s = Student[1]
+        s.name = 'Johnny'
+        s.gpa = 4.0
+        self.assertEqual(s._dbvals_, {Student.name: 'John', Student.gpa: 3.5})
+        self.assertEqual(s._get_dbval_(Student.name), 'John')
+        s.flush()
+        self.assertEqual(s._dbvals_, {})
+        self.assertEqual(s._get_dbval_(Student.name), 'Johnny')
+        rollback()
+
+    @db_session
+    def test_modified_before_load(self):
+        s = Student._get_by_raw_pkval_((2,))  # seed, attributes are not loaded yet
+        s.gpa = 2.0
+        self.assertIs(s._get_dbval_(Student.gpa), NOT_LOADED)
+        self.assertEqual(s._dbvals_, {Student.gpa: NOT_LOADED})
+        s.flush()
+        self.assertEqual(s._get_dbval_(Student.gpa), 2.0)
+        rollback()
+
+    @db_session
+    def test_created_object(self):
+        s = Student(id=3, name='Kate')
+        self.assertIs(s._get_dbval_(Student.name), NOT_LOADED)
+        s.flush()
+        self.assertEqual(s._get_dbval_(Student.name), 'Kate')
+        rollback()
+
+    @raises_exception(OptimisticCheckError,
+                      "Object Student[1] was updated outside of current transaction. Changes: name (u'John' -> u'Jack')"
+                      if PY2 else
+                      "Object Student[1] was updated outside of current transaction. Changes: name ('John' -> 'Jack')")
+    def test_optimistic_check(self):
+        with db_session:
+            s = Student[1]
+            self.assertEqual(s.name, 'John')
+            db.execute("update Student set name = 'Jack' where id = 1")
+            s.name = 'Johnny'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,13 +4,25 @@ import unittest
 
 from pony.orm.core import *
 from pony.orm.tests.testutils import *
-from pony.orm.tests import setup_database, teardown_database
+from pony.orm.tests import setup_database, teardown_database, only_for
 
 db = Database()
 
 
 class Person(db.Entity):
     name = Required(unicode)
+    notes = Set('Note')
+    orders = Set('Order')
+
+
+class Note(db.Entity):
+    text = Required(unicode)
+    person = Required(Person)
+
+
+class Order(db.Entity):
+    amount = Required(int)
+    person = Optional(Person)
 
 
 class TestFlush(unittest.TestCase):
@@ -42,3 +54,332 @@ class TestFlush(unittest.TestCase):
             self.assertEqual(b.id, b_id)
             self.assertIsNotNone(c.id)
             self.assertEqual(len({a.id, b.id, c.id}), 3)
+
+
+class Item(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    tag = Optional(unicode, nullable=True)
+    code = Optional(unicode, unique=True, nullable=True)
+    parts = Set('Part')
+
+
+class Part(db.Entity):
+    id = PrimaryKey(int)
+    item = Required(Item)
+
+
+class TestBatchedFlush(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(self):
+        teardown_database(db)
+
+    def setUp(self):
+        with db_session:
+            Part.select().delete(bulk=True)
+            Item.select().delete(bulk=True)
+            Note.select().delete(bulk=True)
+            Order.select().delete(bulk=True)
+            Person.select().delete(bulk=True)
+        db.merge_local_stats()
+
+    def get_insert_counts(self):
+        return sorted(stat.db_count for sql, stat in db.local_stats.items()
+                      if sql is not None and sql.startswith('INSERT'))
+
+    def test_same_shape(self):
+        with db_session:
+            for i in range(1, 6):
+                Item(id=i, name='Item %d' % i)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [1])
+        with db_session:
+            self.assertEqual(select(i.id for i in Item)[:], [1, 2, 3, 4, 5])
+
+    def test_different_shapes(self):
+        with db_session:
+            for i in range(1, 7):
+                Item(id=i, name='Item %d' % i, tag='T' if i <= 3 else None)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [1, 1])
+        with db_session:
+            self.assertEqual(Item.select(lambda i: i.tag == 'T').count(), 3)
+
+    def test_interleaved_shapes(self):
+        # only consecutive objects with the same shape are batched
+        with db_session:
+            for i in range(1, 7):
+                Item(id=i, name='Item %d' % i, tag='T' if i % 2 else None)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [3, 3])
+        with db_session:
+            self.assertEqual(Item.select(lambda i: i.tag == 'T').count(), 3)
+
+    def test_insert_order(self):
+        with db_session:
+            p1 = Person(name='A')
+            p2 = Person(name='B')
+            Order(amount=1, person=p1)
+            Order(amount=2, person=p2)
+            Order(amount=3)
+            Order(amount=4, person=p1)
+        with db_session:
+            self.assertEqual([ amount for id, amount in select((o.id, o.amount) for o in Order).order_by(1) ], [1, 2, 3, 4])
+            self.assertEqual([ name for id, name in select((p.id, p.name) for p in Person).order_by(1) ], ['A', 'B'])
+
+    def test_dependent_objects(self):
+        with db_session:
+            items = [ Item(id=i, name='Item %d' % i) for i in range(1, 4) ]
+            for item in items:
+                Part(id=item.id, item=item)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [1, 1])
+        with db_session:
+            self.assertEqual(select((p.id, p.item.id) for p in Part)[:], [(1, 1), (2, 2), (3, 3)])
+
+    def test_interleaved_dependent_objects(self):
+        with db_session:
+            for i in range(1, 4):
+                item = Item(id=i, name='Item %d' % i)
+                Part(id=i, item=item)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [3, 3])
+        with db_session:
+            self.assertEqual(select((p.id, p.item.id) for p in Part)[:], [(1, 1), (2, 2), (3, 3)])
+
+    def test_dependent_object_of_same_shape(self):
+        with db_session:
+            n1 = Order(amount=1, person=Person(name='A'))
+            p2 = Person(name='B')
+            p3 = Person(name='C')
+            self.assertEqual(n1.person.name, 'A')
+            flush()
+        with db_session:
+            self.assertEqual([ name for id, name in select((p.id, p.name) for p in Person).order_by(1) ], ['A', 'B', 'C'])
+
+    def test_order_with_delete(self):
+        with db_session:
+            Item(id=1, name='A', code='X')
+        with db_session:
+            Item[1].delete()
+            Item(id=2, name='B', code='X')
+            Item(id=3, name='C', code='Y')
+        with db_session:
+            self.assertEqual(Item.get(code='X').id, 2)
+            self.assertEqual(Item.get(code='Y').id, 3)
+
+    def test_integrity_error(self):
+        with db_session:
+            Item(id=1, name='A')
+        with self.assertRaises(TransactionIntegrityError):
+            with db_session:
+                Item(id=1, name='B')
+                Item(id=2, name='C')
+                Item(id=3, name='D')
+                Item.select().delete(bulk=True)  # force flush without loading Item[1] into the cache
+
+    def test_auto_pk(self):
+        # objects with auto-generated ids are inserted one by one to match ids reliably
+        with db_session:
+            persons = [ Person(name='P%d' % i) for i in range(5) ]
+            flush()
+            self.assertEqual(self.get_insert_counts(), [5])
+            ids = [ p.id for p in persons ]
+            self.assertEqual(ids, sorted(set(ids)))
+            for p in persons:
+                self.assertIs(Person[p.id], p)
+        with db_session:
+            self.assertEqual([ Person[id].name for id in ids ], [ 'P%d' % i for i in range(5) ])
+
+    def test_auto_pk_dependent_objects(self):
+        with db_session:
+            persons = [ Person(name='P%d' % i) for i in range(3) ]
+            for i, p in enumerate(persons):
+                Note(text='N%d' % i, person=p)
+            flush()
+            self.assertEqual(self.get_insert_counts(), [3, 3])
+        with db_session:
+            self.assertEqual(select((n.text, n.person.name) for n in Note).order_by(1)[:],
+                             [('N0', 'P0'), ('N1', 'P1'), ('N2', 'P2')])
+
+    def get_update_counts(self):
+        return sorted(stat.db_count for sql, stat in db.local_stats.items()
+                      if sql is not None and sql.startswith('UPDATE'))
+
+    def test_grouped_update(self):
+        with db_session:
+            for i in range(1, 6):
+                Item(id=i, name='Item %d' % i)
+        db.merge_local_stats()
+        with db_session:
+            for item in Item.select().order_by(Item.id):
+                item.name += '!'
+                if item.id <= 3: item.tag = 'T'
+            flush()
+            self.assertEqual(self.get_update_counts(), [1, 1])
+        with db_session:
+            self.assertEqual(select(i.name for i in Item if i.tag == 'T')[:], ['Item 1!', 'Item 2!', 'Item 3!'])
+            self.assertEqual(count(i for i in Item if i.name.endswith('!')), 5)
+
+    @only_for('sqlite')
+    def test_interleaved_update_order(self):
+        with db_session:
+            for i in range(1, 5):
+                Item(id=i, name='Item %d' % i)
+        with db_session:
+            db.execute('create temp table update_log (item_id integer)')
+            db.execute('create temp trigger log_update after update on "Item" '
+                       'begin insert into update_log values (new.id); end')
+            db.merge_local_stats()
+            items = Item.select().order_by(Item.id)[:]
+            items[0].name = 'A'
+            items[1].tag = 'T'
+            items[2].name = 'C'
+            items[3].tag = 'T'
+            flush()
+            self.assertEqual(self.get_update_counts(), [2, 2])
+            self.assertEqual(db.select('item_id from update_log'), [1, 2, 3, 4])
+            rollback()
+
+    def test_unique_update_order(self):
+        with db_session:
+            Item(id=1, name='A', code='X')
+            Item(id=2, name='B', code='Y')
+        with db_session:
+            Item[1].code = 'Z'
+            Item[2].code = 'X'
+        with db_session:
+            self.assertEqual(Item.get(code='X').id, 2)
+            self.assertEqual(Item.get(code='Z').id, 1)
+
+    def test_grouped_update_optimistic_check(self):
+        with db_session:
+            for i in range(1, 4):
+                Item(id=i, name='Item %d' % i)
+        with self.assertRaises(OptimisticCheckError) as cm:
+            with db_session:
+                items = Item.select().order_by(Item.id)[:]
+                db.execute("update Item set name = 'changed' where id = 2")
+                for item in items:
+                    item.tag = item.name
+        self.assertIn('Item[2]', str(cm.exception))
+        self.assertIn('changed', str(cm.exception))
+        with db_session:
+            self.assertEqual(count(i for i in Item if i.tag is not None), 0)
+
+    def test_grouped_update_of_deleted_object(self):
+        with db_session:
+            for i in range(1, 4):
+                Item(id=i, name='Item %d' % i)
+        with self.assertRaises(OptimisticCheckError) as cm:
+            with db_session:
+                items = Item.select().order_by(Item.id)[:]
+                db.execute("delete from Item where id = 3")
+                for item in items:
+                    item.tag = 'T'
+        self.assertIn('Item[3] was deleted', str(cm.exception))
+
+    def get_delete_counts(self):
+        return sorted(stat.db_count for sql, stat in db.local_stats.items()
+                      if sql is not None and sql.startswith('DELETE'))
+
+    def test_grouped_delete(self):
+        with db_session:
+            for i in range(1, 6):
+                Item(id=i, name='Item %d' % i)
+        db.merge_local_stats()
+        with db_session(optimistic=False):
+            for item in Item.select():
+                item.delete()
+            flush()
+            self.assertEqual(self.get_delete_counts(), [1])
+            self.assertIn(' IN ', db.last_sql)
+        with db_session:
+            self.assertEqual(Item.select().count(), 0)
+
+    def test_grouped_delete_for_update(self):
+        with db_session:
+            for i in range(1, 6):
+                Item(id=i, name='Item %d' % i)
+        db.merge_local_stats()
+        with db_session:
+            for item in Item.select(lambda i: i.id < 4).for_update():
+                item.delete()
+            Item[4].delete()
+            flush()
+            self.assertEqual(self.get_delete_counts(), [1, 1])
+        with db_session:
+            self.assertEqual(select(i.id for i in Item)[:], [5])
+
+    def test_grouped_delete_cascade(self):
+        with db_session:
+            for i in range(1, 4):
+                item = Item(id=i, name='Item %d' % i)
+                Part(id=i * 10, item=item)
+                Part(id=i * 10 + 1, item=item)
+        db.merge_local_stats()
+        with db_session(optimistic=False):
+            for item in Item.select():
+                item.delete()
+            flush()
+            # parts of each item are deleted right before the item
+            self.assertEqual(self.get_delete_counts(), [3, 3])
+        with db_session:
+            self.assertEqual(Part.select().count(), 0)
+            self.assertEqual(Item.select().count(), 0)
+
+    def test_grouped_delete_dependent_first(self):
+        with db_session:
+            for i in range(1, 4):
+                item = Item(id=i, name='Item %d' % i)
+                Part(id=i * 10, item=item)
+                Part(id=i * 10 + 1, item=item)
+        db.merge_local_stats()
+        with db_session(optimistic=False):
+            for part in Part.select():
+                part.delete()
+            for item in Item.select():
+                item.delete()
+            flush()
+            self.assertEqual(self.get_delete_counts(), [1, 1])
+        with db_session:
+            self.assertEqual(Part.select().count(), 0)
+            self.assertEqual(Item.select().count(), 0)
+
+    @only_for('sqlite')
+    def test_interleaved_delete_order(self):
+        with db_session:
+            p = Person(name='P')
+            for i in range(1, 4):
+                Item(id=i, name='Item %d' % i)
+                Note(text='Note %d' % i, person=p)
+        with db_session(optimistic=False):
+            db.execute('create temp table delete_log (name text)')
+            db.execute('create temp trigger log_item_delete after delete on "Item" '
+                       'begin insert into delete_log values (old.name); end')
+            db.execute('create temp trigger log_note_delete after delete on "Note" '
+                       'begin insert into delete_log values (old.text); end')
+            items = Item.select().order_by(Item.id)[:]
+            notes = Note.select().order_by(Note.id)[:]
+            items[0].delete()
+            items[1].delete()
+            notes[0].delete()
+            items[2].delete()
+            flush()
+            self.assertEqual(db.select('name from delete_log'), ['Item 1', 'Item 2', 'Note 1', 'Item 3'])
+            rollback()
+
+    def test_optimistic_delete(self):
+        with db_session:
+            for i in range(1, 4):
+                Item(id=i, name='Item %d' % i)
+        db.merge_local_stats()
+        with db_session:
+            for item in Item.select():
+                item.delete()
+            flush()
+            self.assertEqual(self.get_delete_counts(), [3])
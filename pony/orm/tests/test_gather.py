@@ -0,0 +1,115 @@
+from __future__ import absolute_import, print_function, division
+
+import os, shutil, tempfile, threading, unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import only_for
+
+try: import concurrent.futures
+except ImportError: futures_available = False
+else: futures_available = True
+
+db = Database()
+
+
+class Customer(db.Entity):
+    name = Required(unicode)
+    orders = Set('Order')
+
+
+class Order(db.Entity):
+    customer = Required(Customer)
+    total = Required(int)
+
+
+@only_for('sqlite')
+@unittest.skipIf(not futures_available, 'gather() requires concurrent.futures module')
+class TestGather(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # in-memory sqlite database is not shared between threads
+        cls.dirname = tempfile.mkdtemp()
+        db.bind('sqlite', os.path.join(cls.dirname, 'test_gather.sqlite'), create_db=True)
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            c1 = Customer(id=1, name='John')
+            c2 = Customer(id=2, name='Mary')
+            Order(id=1, customer=c1, total=100)
+            Order(id=2, customer=c1, total=200)
+            Order(id=3, customer=c2, total=300)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.disconnect()
+        shutil.rmtree(cls.dirname)
+
+    @db_session
+    def test_results(self):
+        count, orders, total = gather(Customer.select().count, Order.select().order_by(Order.id).fetch,
+                                      lambda: sum(o.total for o in Order))
+        self.assertEqual(count, 2)
+        self.assertEqual([o.id for o in orders], [1, 2, 3])
+        self.assertEqual(total, 600)
+
+    @db_session
+    def test_merge_into_identity_map(self):
+        c1 = Customer[1]
+        customers, orders = gather(lambda: Customer.select().order_by(Customer.id)[:],
+                                   lambda: Order.select().order_by(Order.id)[:])
+        self.assertIs(customers[0], c1)
+        cache = db._get_cache()
+        for obj in list(customers) + list(orders):
+            self.assertIs(obj._session_cache_, cache)
+        db._dblocal.last_sql = None
+        self.assertEqual(customers[1].name, 'Mary')
+        self.assertEqual([o.total for o in orders], [100, 200, 300])
+        self.assertIs(orders[0].customer, c1)
+        self.assertIs(orders[2].customer, customers[1])
+        self.assertEqual(db.last_sql, None)  # all values were loaded by workers
+
+    @db_session
+    def test_containers(self):
+        result, = gather(lambda: {'customer': Customer[2], 'orders': (Order[1], Order[3])})
+        self.assertEqual(result['customer'].name, 'Mary')
+        self.assertEqual([o.total for o in result['orders']], [100, 300])
+
+    @db_session
+    def test_separate_threads(self):
+        threads = []
+        event = threading.Event()
+        def wait_for_each_other():
+            threads.append(threading.current_thread())
+            if len(threads) == 2: event.set()
+            return event.wait(5)
+        self.assertEqual(gather(wait_for_each_other, wait_for_each_other), [True, True])
+        self.assertNotEqual(threads[0], threads[1])
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @raises_exception(TransactionError, 'gather() can be called inside db_session only')
+    def test_outside_db_session(self):
+        gather(Customer.select().count)
+
+    @db_session
+    @raises_exception(TransactionError, 'gather() cannot be called when db_session has unsaved changes, '
+                                        'because they are not visible to queries executed on other connections. '
+                                        'Call commit() before gather()')
+    def test_unsaved_changes(self):
+        Customer[1].name = 'Johnny'
+        gather(Customer.select().count)
+
+    @db_session
+    @raises_exception(TransactionError, 'Changes cannot be saved in readonly db_session')
+    def test_readonly_workers(self):
+        def update():
+            Customer[1].name = 'Johnny'
+        gather(update)
+
+    @db_session
+    @raises_exception(ObjectNotFound)
+    def test_exception(self):
+        gather(Customer.select().count, lambda: Customer[100])
+
+
+if __name__ == '__main__':
+    unittest.main()
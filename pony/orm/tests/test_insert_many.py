@@ -0,0 +1,246 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+
+db = Database()
+
+
+class Category(db.Entity):
+    name = Required(unicode, unique=True)
+    products = Set('Product')
+
+
+class Product(db.Entity):
+    name = Required(unicode)
+    price = Required(Decimal)
+    category = Optional(Category)
+    comment = Optional(unicode)
+    stocks = Set('Stock')
+
+
+class Tag(db.Entity):
+    code = PrimaryKey(unicode)
+    description = Optional(unicode)
+
+
+class Stock(db.Entity):
+    product = Required(Product)
+    warehouse = Required(unicode)
+    qty = Required(int)
+    composite_key(product, warehouse)
+
+
+class TestInsertMany(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def setUp(self):
+        with db_session:
+            Stock.select().delete(bulk=True)
+            Product.select().delete(bulk=True)
+            Category.select().delete(bulk=True)
+            Tag.select().delete(bulk=True)
+            Category(id=1, name='Books')
+        db.merge_local_stats()
+
+    def test_dicts(self):
+        with db_session:
+            count = Product.insert_many([ dict(name='P%d' % i, price=i) for i in range(10) ], batch_size=4)
+            self.assertEqual(count, 10)
+            self.assertEqual(Product._database_._get_cache().objects_to_save, [])
+        insert_stats = [ stat for sql, stat in db.local_stats.items() if sql and sql.startswith('INSERT') ]
+        self.assertEqual(sorted(stat.db_count for stat in insert_stats), [3])
+        with db_session:
+            self.assertEqual(sum(p.price for p in Product), 45)
+
+    def test_tuples(self):
+        with db_session:
+            Product.insert_many([ ('P1', 10, 1, 'first'), ('P2', '20.5', None, '') ])
+        with db_session:
+            self.assertEqual(select((p.name, p.price, p.category, p.comment) for p in Product).order_by(1)[:],
+                             [('P1', Decimal(10), Category[1], 'first'), ('P2', Decimal('20.5'), None, '')])
+
+    def test_reference_by_object(self):
+        with db_session:
+            c = Category[1]
+            Product.insert_many([ dict(name='P1', price=1, category=c) ])
+            self.assertEqual(c.products.count(), 1)
+
+    def test_loaded_collections(self):
+        with db_session:
+            c1 = Category[1]
+            c2 = Category(id=2, name='Music')
+            self.assertEqual(set(c1.products), set())
+            self.assertEqual(set(c2.products), set())
+            Product.insert_many([ dict(name='P1', price=1, category=1) ])
+            self.assertFalse(c1._vals_[Category.products].is_fully_loaded)
+            self.assertTrue(c2._vals_[Category.products].is_fully_loaded)  # not referenced by inserted rows
+            self.assertEqual([ p.name for p in c1.products ], ['P1'])
+
+    def test_reference_to_new_object(self):
+        with db_session:
+            c = Category(name='Music')
+            Product.insert_many([ dict(name='P1', price=1, category=c) ])
+        with db_session:
+            self.assertEqual(select(p.category.name for p in Product)[:], ['Music'])
+
+    def test_return_pks(self):
+        with db_session:
+            ids = Product.insert_many([ dict(name='P%d' % i, price=i) for i in range(5) ], batch_size=2,
+                                      return_pks=True)
+            self.assertEqual(len(set(ids)), 5)
+            self.assertEqual([ Product[id].name for id in ids ], [ 'P%d' % i for i in range(5) ])
+
+    def test_return_pks_different_shapes(self):
+        with db_session:
+            c = Category(name='Games')
+            rows = [ dict(name='A', price=1, category=c), dict(name='B', price=2), dict(name='C', price=3, category=c) ]
+            ids = Product.insert_many(rows, return_pks=True)
+            self.assertEqual([ (Product[id].name, Product[id].category) for id in ids ], [('A', c), ('B', None), ('C', c)])
+
+    def test_explicit_pk(self):
+        with db_session:
+            pks = Tag.insert_many([ ('a', 'A'), ('b', ''), dict(code='c') ], return_pks=True)
+            self.assertEqual(pks, ['a', 'b', 'c'])
+        with db_session:
+            self.assertEqual(select(t.code for t in Tag if t.description)[:], ['a'])
+
+    def test_query_cache_cleared(self):
+        with db_session:
+            self.assertEqual(Product.select().count(), 0)
+            Product.insert_many([ dict(name='P1', price=1) ])
+            self.assertEqual(Product.select().count(), 1)
+
+    @raises_exception(TypeError, "Unknown attribute 'foo'")
+    def test_unknown_attribute(self):
+        with db_session:
+            Product.insert_many([ dict(name='P1', price=1, foo=2) ])
+
+    @raises_exception(TypeError, 'Row for Product should contain 4 values. Got: 2')
+    def test_tuple_length(self):
+        with db_session:
+            Product.insert_many([ ('P1', 1) ])
+
+    @raises_exception(ValueError, 'Attribute Product.price is required')
+    def test_required(self):
+        with db_session:
+            Product.insert_many([ dict(name='P1') ])
+
+    def test_integrity_error(self):
+        with self.assertRaises(TransactionIntegrityError):
+            with db_session:
+                Category.insert_many([ dict(name='Books') ])
+
+    def test_copy_into(self):
+        with db_session:
+            count = db.copy_into(Product, [ ('P1', 1, 1, 'tab\there'), dict(name='P2', price='2.5') ])
+            self.assertEqual(count, 2)
+        with db_session:
+            self.assertEqual(select((p.name, p.price, p.category, p.comment) for p in Product).order_by(1)[:],
+                             [('P1', Decimal(1), Category[1], 'tab\there'), ('P2', Decimal('2.5'), None, '')])
+
+    @raises_exception(TypeError, 'Entity of this database expected. Got: 1')
+    def test_copy_into_wrong_entity(self):
+        with db_session:
+            db.copy_into(1, [])
+
+
+class TestUpsert(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def setUp(self):
+        with db_session:
+            Stock.select().delete(bulk=True)
+            Product.select().delete(bulk=True)
+            Category.select().delete(bulk=True)
+            Tag.select().delete(bulk=True)
+            Category(id=1, name='Books')
+            Product(id=1, name='P1', price=1)
+
+    def test_pk(self):
+        with db_session:
+            Tag(code='a', description='A')
+        with db_session:
+            Tag.upsert([ dict(code='a', description='A2'), dict(code='b', description='B') ])
+        with db_session:
+            self.assertEqual(select((t.code, t.description) for t in Tag).order_by(1)[:], [('a', 'A2'), ('b', 'B')])
+
+    def test_unique_key(self):
+        with db_session:
+            Category.upsert([ dict(id=5, name='Books'), dict(id=6, name='Music') ], conflict='name', update=())
+        with db_session:
+            self.assertEqual(select((c.id, c.name) for c in Category).order_by(1)[:], [(1, 'Books'), (6, 'Music')])
+
+    def test_composite_key(self):
+        with db_session:
+            Stock(product=1, warehouse='W1', qty=1)
+        with db_session:
+            Stock.upsert([ dict(product=1, warehouse='W1', qty=5), dict(product=1, warehouse='W2', qty=7),
+                           dict(product=1, warehouse='W1', qty=10) ],
+                         conflict=(Stock.warehouse, Stock.product))
+        with db_session:
+            self.assertEqual(select((s.warehouse, s.qty) for s in Stock).order_by(1)[:], [('W1', 10), ('W2', 7)])
+
+    def test_update_list(self):
+        with db_session:
+            Product.upsert([ dict(id=1, name='New', price=2) ], update=['price'])
+        with db_session:
+            self.assertEqual((Product[1].name, Product[1].price), ('P1', 2))
+
+    def test_identity_map(self):
+        with db_session:
+            p = Product[1]
+            c = Category[1]
+            self.assertEqual(p.price, 1)
+            self.assertEqual(c.products.count(), 0)
+            Product.upsert([ dict(id=1, name='P1', price=3, category=1), dict(id=2, name='P2', price=4, category=1) ])
+            self.assertEqual(p.price, 3)
+            self.assertEqual(p.category, c)
+            self.assertEqual(set(c.products), {p, Product[2]})
+
+    def test_identity_map_composite_key(self):
+        with db_session:
+            Stock(product=1, warehouse='W1', qty=1)
+            Stock(product=1, warehouse='W2', qty=2)
+        with db_session:
+            s1, s2 = Stock.select().order_by(Stock.warehouse)[:]
+            Stock.upsert([ dict(product=1, warehouse='W2', qty=20) ], conflict=(Stock.product, Stock.warehouse))
+            self.assertEqual((s1.qty, s2.qty), (1, 20))
+
+    def test_set_null(self):
+        with db_session:
+            Product[1].category = 1
+        with db_session:
+            Product.upsert([ dict(id=1, name='P1', price=1, category=None) ])
+        with db_session:
+            self.assertEqual(Product[1].category, None)
+
+    @raises_exception(TypeError, 'Attributes comment are not a primary key or a unique key of Product')
+    def test_wrong_key(self):
+        with db_session:
+            Product.upsert([ dict(id=1, name='P1', price=1) ], conflict='comment')
+
+    @raises_exception(TypeError, 'Value of key attribute Product.id must be specified for upsert')
+    def test_missing_key(self):
+        with db_session:
+            Product.upsert([ dict(name='P1', price=1) ])
+
+
+if __name__ == '__main__':
+    unittest.main()
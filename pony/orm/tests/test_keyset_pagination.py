@@ -0,0 +1,195 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+
+db = Database()
+
+
+class Product(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    price = Required(Decimal)
+    created = Required(datetime)
+
+
+class Item(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    price = Required(int)
+    rank = Optional(int)
+    tags = Set('Tag')
+
+
+class Tag(db.Entity):
+    name = PrimaryKey(unicode)
+    items = Set(Item)
+
+
+class TestKeysetPagination(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            for i in range(1, 11):
+                Product(id=i, name='P%d' % i, price=i % 4, created=datetime(2020, 1, 1, 12, i))
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    @db_session
+    def test_first_page(self):
+        page = Product.select().order_by(Product.id).page_after(pagesize=3)
+        self.assertEqual([ p.id for p in page ], [1, 2, 3])
+        self.assertEqual(page.cursor_values, (3,))
+        self.assertIsNotNone(page.next_token)
+        self.assertNotIn('OFFSET', db.last_sql.upper())
+
+    @db_session
+    def test_token(self):
+        query = Product.select().order_by(Product.id)
+        page = query.page_after(pagesize=4)
+        page = query.page_after(page.next_token, 4)
+        self.assertEqual([ p.id for p in page ], [5, 6, 7, 8])
+        page = query.page_after(page.next_token, 4)
+        self.assertEqual([ p.id for p in page ], [9, 10])
+        self.assertIsNone(page.next_token)
+
+    @db_session
+    def test_paginate(self):
+        query = Product.select().order_by(desc(Product.price), Product.name)
+        pages = list(query.paginate(pagesize=3))
+        self.assertEqual([ len(page) for page in pages ], [3, 3, 3, 1])
+        self.assertEqual([ p for page in pages for p in page ], query[:])
+
+    @db_session
+    def test_order_by_expression(self):
+        query = select(p for p in Product).order_by(lambda p: (p.price, desc(p.created)))
+        self.assertEqual([ p for page in query.paginate(pagesize=4) for p in page ], query[:])
+
+    @db_session
+    def test_tuples(self):
+        query = select((p.price, p.name) for p in Product).order_by(1)
+        result = [ row for page in query.paginate(pagesize=4) for row in page ]
+        self.assertEqual(sorted(result), sorted(query[:]))
+        self.assertEqual([ price for price, name in result ], sorted(price for price, name in result))
+
+    @db_session
+    def test_filtered_query(self):
+        query = Product.select(lambda p: p.price > 1).order_by(Product.created)
+        self.assertEqual([ p.id for page in query.paginate(pagesize=2) for p in page ], [2, 3, 6, 7, 10])
+
+    @db_session
+    def test_cursor_values(self):
+        page = Product.select().order_by(Product.price, Product.id).page_after((Decimal(2), 6), 10)
+        self.assertEqual([ p.id for p in page ], [10, 3, 7])
+
+    @db_session
+    def test_empty_page(self):
+        page = Product.select(lambda p: p.price > 100).page_after()
+        self.assertEqual(page, [])
+        self.assertIsNone(page.cursor_values)
+        self.assertIsNone(page.next_token)
+
+    @raises_exception(ValueError, "Invalid keyset pagination token: 'abc'")
+    @db_session
+    def test_invalid_token(self):
+        Product.select().page_after('abc')
+
+    @raises_exception(TypeError, 'Keyset pagination of this query requires 2 cursor values. Got: 1')
+    @db_session
+    def test_wrong_number_of_values(self):
+        Product.select().order_by(Product.price).page_after(1)
+
+    @raises_exception(TranslationError, 'Keyset pagination cannot be used with aggregated queries')
+    @db_session
+    def test_aggregated(self):
+        select((p.price, count(p)) for p in Product).page_after()
+
+
+class TestKeysetPaginationUniqueness(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            tags = [ Tag(name='T%d' % i) for i in range(3) ]
+            for i in range(1, 24):
+                item = Item(id=i, name='I%d' % (i % 5), price=i % 3, rank=i % 4 or None)
+                item.tags = tags[:i % 4]
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def check_pages(self, query, pagesize=3):
+        result = [ row for page in query.paginate(pagesize) for row in page ]
+        expected = query[:]
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(sorted(result, key=repr), sorted(expected, key=repr))
+        return result
+
+    @db_session
+    def test_duplicate_rows(self):
+        query = select((i.name, i.price) for i in Item).order_by(1)
+        self.assertEqual(len(set(query[:])), 15)
+        result = self.check_pages(query)
+        self.assertEqual(len(result), 23)
+        self.assertEqual([ name for name, price in result ], sorted(name for name, price in result))
+
+    @db_session
+    def test_single_column_duplicates(self):
+        self.check_pages(select(i.price for i in Item).order_by(1), pagesize=4)
+
+    @db_session
+    def test_distinct(self):
+        query = select((i.name, i.price) for i in Item).order_by(1).distinct()
+        result = self.check_pages(query)
+        self.assertEqual(len(result), 15)
+
+    @db_session
+    def test_nulls_in_result(self):
+        query = select((i.price, i.rank) for i in Item).order_by(1)
+        self.assertIn(None, [ rank for price, rank in query[:] ])
+        result = self.check_pages(query)
+        self.assertEqual(len(result), 23)
+
+    @db_session
+    def test_collection_join(self):
+        query = select((i.price, t.name) for i in Item for t in i.tags).order_by(1)
+        result = self.check_pages(query, pagesize=4)
+        self.assertEqual(len(result), 36)
+
+    @db_session
+    def test_entities(self):
+        query = Item.select().order_by(Item.price)
+        self.assertEqual(len(self.check_pages(query, pagesize=5)), 23)
+
+    @raises_exception(TranslationError, 'Keyset pagination cannot be used with order expressions which can be NULL')
+    @db_session
+    def test_nullable_attribute(self):
+        Item.select().order_by(Item.rank).page_after()
+
+    @raises_exception(TranslationError, 'Keyset pagination cannot be used with order expressions which can be NULL')
+    @db_session
+    def test_nullable_lambda(self):
+        Item.select().order_by(lambda i: (i.price, i.rank)).page_after()
+
+    @raises_exception(TranslationError, 'Keyset pagination cannot be used with order expressions which can be NULL')
+    @db_session
+    def test_nullable_column_number(self):
+        select((i.rank, i.name) for i in Item).order_by(1).page_after()
+
+    @raises_exception(TranslationError, 'Keyset pagination cannot be used with queries which use LEFT JOIN')
+    @db_session
+    def test_left_join(self):
+        left_join((i.price, t.name) for i in Item for t in i.tags).order_by(1).page_after()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -67,3 +67,46 @@ class TestLazy(unittest.TestCase):
         for x in result:
             self.assertFalse(X._bits_[X.b] & x._rbits_)
             self.assertTrue(X.b not in x._vals_)
+
+    @db_session
+    def test_lazy_batch_1(self):
+        X = self.X
+        x1, x2, x3 = X.select().order_by(X.id)[:]
+        self.assertEqual(x1.b, 'first')
+        self.assertTrue(X.b not in x2._vals_)
+        self.assertEqual(x2.b, 'second')  # the second load of the attribute loads it for all objects of the session
+        self.assertTrue(X.b in x3._vals_)
+        self.assertIn(' IN ', self.db.last_sql)
+        self.db._dblocal.last_sql = None
+        self.assertEqual(x3.b, 'third')
+        self.assertEqual(self.db.last_sql, None)
+
+    @db_session
+    def test_lazy_batch_2(self):
+        X = self.X
+        x1, x2, x3 = X.select().order_by(X.id)[:]
+        x3.b = 'new'
+        x1.b
+        self.assertEqual(x2.b, 'second')
+        self.assertEqual(x3.b, 'new')
+
+    @db_session
+    def test_lazy_batch_3(self):
+        X = self.X
+        X.b.nplus1_threshold = None
+        x1, x2, x3 = X.select().order_by(X.id)[:]
+        x1.b
+        x2.b
+        self.assertTrue(X.b not in x3._vals_)
+
+    def test_lazy_batch_4(self):
+        X = self.X
+        with db_session:
+            X(id=4, a=4, b='fourth')
+        with db_session:
+            x1, x2 = X.select(lambda x: x.id <= 2).order_by(X.id)[:]
+            x1.b
+            x2.b
+            x3, x4 = X.select(lambda x: x.id > 2).order_by(X.id)[:]
+            self.assertEqual(x3.b, 'third')
+            self.assertTrue(X.b in x4._vals_)  # objects loaded after the previous batch are batched too
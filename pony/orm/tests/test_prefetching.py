@@ -141,9 +141,9 @@ LIMIT 1''' % table_name
             q = select(g for g in Group)
             for g in q: # 1 query
                 for s in g.students:  # 2 query
-                    b = s.biography  # 5 queries
+                    b = s.biography  # 1 query for the first student, then 2 batches for other loaded students
             query_count = db.local_stats[None].db_count
-            self.assertEqual(query_count, 8)
+            self.assertEqual(query_count, 6)
 
     def test_14(self):
         db.merge_local_stats()
@@ -151,9 +151,9 @@ LIMIT 1''' % table_name
             q = select(g for g in Group).prefetch(Group.students)
             for g in q:   # 1 query
                 for s in g.students:  # 1 query
-                    b = s.biography  # 5 queries
+                    b = s.biography  # 1 query for the first student, 1 batch for all other students
             query_count = db.local_stats[None].db_count
-            self.assertEqual(query_count, 7)
+            self.assertEqual(query_count, 4)
 
     def test_15(self):
         with db_session:
@@ -219,6 +219,55 @@ LIMIT 1''' % table_name
             query_count = db.local_stats[None].db_count
             self.assertEqual(query_count, 3)
 
+    def test_20(self):
+        db.merge_local_stats()
+        with db_session:
+            q = Student.select().prefetch(Student.group, strategy='join').prefetch(Group.major)
+            for s in q:  # 1 query
+                major = s.group.major  # 0 queries
+            query_count = db.local_stats[None].db_count
+            self.assertEqual(query_count, 1)
+            self.assertIn('LEFT JOIN', db.last_sql)
+
+    def test_21(self):
+        db.merge_local_stats()
+        with db_session:
+            q = Student.select().order_by(Student.id).prefetch(Student.mentor, strategy='join').prefetch(Student.courses)
+            students = q[:]  # 3 queries: students with mentors, student-course pairs, courses
+            mentors = [ s.mentor and s.mentor.name for s in students ]  # 0 queries
+            courses = [ len(s.courses) for s in students ]  # 0 queries
+            query_count = db.local_stats[None].db_count
+            self.assertEqual(query_count, 3)
+            self.assertEqual(mentors, ['T1', None, None, 'T2', None])
+            self.assertEqual(courses, [2, 0, 2, 2, 2])
+
+    def test_22(self):
+        with db_session:
+            q = Student.select().prefetch(Student.group, strategy='join').prefetch(Student.group, strategy='select')
+            q[:]
+            self.assertNotIn('JOIN', db.last_sql)
+
+    @raises_exception(TypeError, "Prefetch strategy 'join' can be used with to-one relation attribute only. "
+                                 "Got: Group.students")
+    def test_23(self):
+        with db_session:
+            Group.select().prefetch(Group.students, strategy='join')
+
+    @raises_exception(ValueError, "Prefetch strategy should be 'select' or 'join'. Got: 'subquery'")
+    def test_24(self):
+        with db_session:
+            Student.select().prefetch(Student.group, strategy='subquery')
+
+    def test_25(self):
+        db.merge_local_stats()
+        with db_session:
+            q = Student.select().prefetch(Student.group, strategy='join').prefetch(Group.major)
+            self.assertIn('major', q.get_sql())  # get_sql() caches the sql outside of the prefetch context
+            for s in q:
+                major = s.group.major
+            query_count = db.local_stats[None].db_count
+            self.assertEqual(query_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,183 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony import options
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database, only_for, db_params
+
+try: from pony.orm.dbproviders import postgres
+except ImportError: postgres = None
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+
+
+pg_db = Database()
+
+
+class Customer(pg_db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+@only_for('sqlite')
+class TestSQLiteCachedStatements(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def test_cached_statements_size(self):
+        pool = db.provider.pool
+        self.assertEqual(pool.get_cached_statements_size(), options.SQLITE_CACHED_STATEMENTS)
+
+    def test_cached_statements_option(self):
+        size = options.SQLITE_CACHED_STATEMENTS
+        options.SQLITE_CACHED_STATEMENTS = 10
+        try: self.assertEqual(db.provider.pool.get_cached_statements_size(), 10)
+        finally: options.SQLITE_CACHED_STATEMENTS = size
+
+    def test_cached_statements_bind_argument(self):
+        db2 = Database('sqlite', ':memory:', cached_statements=10)
+        self.assertEqual(db2.provider.pool.get_cached_statements_size(), 10)
+        with db_session:
+            self.assertEqual(db2.select('select 1'), [1])
+        db2.disconnect()
+
+    @raises_exception(TypeError, 'Server-side prepared statements are not supported by SQLite provider')
+    def test_prepared_statements_not_supported(self):
+        Database('sqlite', ':memory:', prepared_statements=100)
+
+
+@unittest.skipIf(postgres is None, 'PostgreSQL provider requires psycopg2 module')
+class TestPreparedSql(unittest.TestCase):
+    def test_params(self):
+        sql, param_names = postgres.convert_to_prepared_sql(
+            'SELECT "id" FROM "t" WHERE "a" = %(p1)s AND "b" > %(p2)s')
+        self.assertEqual(sql, 'SELECT "id" FROM "t" WHERE "a" = $1 AND "b" > $2')
+        self.assertEqual(param_names, ['p1', 'p2'])
+
+    def test_repeated_params(self):
+        sql, param_names = postgres.convert_to_prepared_sql(
+            'SELECT "id" FROM "t" WHERE "a" = %(p2)s OR "b" = %(p1)s OR "c" = %(p2)s')
+        self.assertEqual(sql, 'SELECT "id" FROM "t" WHERE "a" = $1 OR "b" = $2 OR "c" = $1')
+        self.assertEqual(param_names, ['p2', 'p1'])
+
+    def test_percent(self):
+        sql, param_names = postgres.convert_to_prepared_sql(
+            'SELECT "id" FROM "t" WHERE "a" LIKE \'A%%\' AND "b" = %(p1)s %% 2')
+        self.assertEqual(sql, 'SELECT "id" FROM "t" WHERE "a" LIKE \'A%\' AND "b" = $1 % 2')
+        self.assertEqual(param_names, ['p1'])
+
+    def test_quoted_literals(self):
+        sql, param_names = postgres.convert_to_prepared_sql(
+            'SELECT \'%%(p1)s\', \'it\'\'s 100%%\', \'$1\' FROM "t" WHERE "a" = %(p1)s')
+        self.assertEqual(sql, 'SELECT \'%(p1)s\', \'it\'\'s 100%\', \'$1\' FROM "t" WHERE "a" = $1')
+        self.assertEqual(param_names, ['p1'])
+
+    def test_no_params(self):
+        self.assertEqual(postgres.convert_to_prepared_sql('SELECT 1'), ('SELECT 1', []))
+
+    def test_execute_sql(self):
+        statement = postgres.PreparedStatement('pony_ps_1', ['p2', 'p1'])
+        self.assertEqual(statement.execute_sql, 'EXECUTE pony_ps_1(%(p2)s, %(p1)s)')
+        statement = postgres.PreparedStatement('pony_ps_2', [])
+        self.assertEqual(statement.execute_sql, 'EXECUTE pony_ps_2')
+
+    def test_deallocated_on_eviction(self):
+        statements = postgres.PreparedStatementCache(2)
+        for i in range(3):
+            statements['sql%d' % i] = postgres.PreparedStatement('pony_ps_%d' % i, [])
+        self.assertEqual(statements.deallocated, ['pony_ps_0'])
+        self.assertNotIn('sql0', statements)
+
+
+@only_for('postgres')
+class TestPGPreparedStatements(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pg_db.bind(prepared_statements=2, **db_params)
+        setup_database(pg_db)
+        with db_session:
+            Customer(name='John', age=20)
+            Customer(name='Mary', age=30)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(pg_db)
+
+    def setUp(self):
+        pg_db.disconnect()
+        pg_db.provider.unpreparable_sql.clear()
+
+    def server_statements(self):
+        return set(pg_db.select('name from pg_prepared_statements'))
+
+    def statement_names(self):
+        statements = pg_db.provider.pool.prepared_statements
+        return {statement.name for statement in statements._data.values()}
+
+    def test_prepare_and_reuse(self):
+        with db_session:
+            x = 25
+            self.assertEqual(select(c.name for c in Customer if c.age > x)[:], ['Mary'])
+            names = self.statement_names()
+            self.assertEqual(len(names), 1)
+            self.assertEqual(self.server_statements(), names)
+        with db_session:
+            x = 10
+            self.assertEqual(set(select(c.name for c in Customer if c.age > x)[:]), {'John', 'Mary'})
+            self.assertEqual(self.statement_names(), names)
+            self.assertEqual(self.server_statements(), names)
+        stats = pg_db.provider.pool.prepared_statements.stats()
+        self.assertEqual(stats['hits'], 1)
+
+    def test_eviction(self):
+        with db_session:
+            select(c for c in Customer if c.age > 25)[:]
+            first = self.statement_names()
+            select(c for c in Customer if c.name == 'John')[:]
+            select(c for c in Customer if c.age < 25)[:]
+            names = self.statement_names()
+            self.assertEqual(len(names), 2)
+            self.assertFalse(names & first)
+            self.assertEqual(self.server_statements(), names)
+
+    def test_disconnect(self):
+        with db_session:
+            select(c for c in Customer if c.age > 25)[:]
+            names = self.statement_names()
+        pg_db.disconnect()
+        self.assertIsNone(pg_db.provider.pool.prepared_statements)
+        with db_session:
+            select(c for c in Customer if c.age > 25)[:]
+            new_names = self.statement_names()
+            self.assertEqual(len(new_names), 1)
+            self.assertNotEqual(new_names, names)
+            self.assertEqual(self.server_statements(), new_names)
+
+    def test_unpreparable_in_transaction(self):
+        with db_session:
+            Customer(name='Kate', age=40)
+            flush()
+            # the type of parameter cannot be inferred by PREPARE, but literal value has type unknown
+            x = 'Kate'
+            self.assertEqual(pg_db.select('SELECT pg_typeof($x)::text'), ['unknown'])
+            self.assertEqual(len(pg_db.provider.unpreparable_sql), 1)
+            self.assertEqual(count(c for c in Customer), 3)
+            self.assertEqual(pg_db.select('SELECT pg_typeof($x)::text'), ['unknown'])
+            rollback()
+        with db_session:
+            self.assertEqual(count(c for c in Customer), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
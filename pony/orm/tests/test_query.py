@@ -201,6 +201,68 @@ class TestQuery(unittest.TestCase):
         rollback()
         students1 = Student.select(lambda s: s.id > 1).order_by(Student.id)[:]
         self.assertEqual([s.id for s in students1], [2, 3])
+    def test_bulk_update(self):
+        count = Student.select(lambda s: s.scholarship is None).update(scholarship=50)
+        self.assertEqual(count, 1)
+        self.assertTrue(db.last_sql.startswith('UPDATE'))
+        self.assertEqual(select((s.id, s.scholarship) for s in Student).order_by(1)[:],
+                         [(1, 50), (2, 100), (3, 200)])
+    def test_bulk_update_identity_map(self):
+        s1, s2, s3 = Student.select().order_by(Student.id)[:]
+        self.assertEqual(s2.gpa, Decimal('3.2'))
+        Student.select(lambda s: s.id >= 2).update(gpa=Decimal('4.0'), dob=None)
+        self.assertEqual(s1.gpa, Decimal('3.1'))
+        self.assertEqual(s2.gpa, Decimal('4.0'))
+        self.assertEqual(s3.gpa, Decimal('4.0'))
+        self.assertEqual(s3.dob, None)
+        self.assertEqual(s1.dob, None)
+        s1.name = 'S1 changed'
+        flush()
+        self.assertEqual(select(s.name for s in Student if s.gpa == Decimal('4.0')).order_by(1)[:], ['S2', 'S3'])
+    def test_bulk_update_without_conditions(self):
+        students = Student.select().order_by(Student.id)[:]
+        db.merge_local_stats()
+        Student.select().update(scholarship=7)
+        self.assertEqual(db.local_stats[None].db_count, 1)  # objects in the identity map are not selected again
+        self.assertEqual([s.scholarship for s in students], [7, 7, 7])
+    def test_bulk_update_loaded_objects_only(self):
+        s1 = Student[1]
+        db.merge_local_stats()
+        Student.select(lambda s: s.id >= 1).update(scholarship=8)
+        self.assertEqual(db.local_stats[None].db_count, 2)  # UPDATE and SELECT of the single loaded object
+        self.assertEqual(s1.scholarship, 8)
+    def test_bulk_update_flushes_changes(self):
+        Student[2].scholarship = 300
+        Student.select(lambda s: s.scholarship > 250).update(gpa=Decimal('3.9'))
+        self.assertEqual(Student[2].gpa, Decimal('3.9'))
+        self.assertEqual(Student[3].gpa, Decimal('3.3'))
+    def test_bulk_update_reverse_attr(self):
+        g1 = Group[1]
+        g2 = Group(number=2)
+        self.assertEqual(len(g1.students), 3)
+        Student.select(lambda s: s.id > 1).update(group=g2)
+        self.assertEqual(set(s.id for s in g1.students), {1})
+        self.assertEqual(set(s.id for s in g2.students), {2, 3})
+        self.assertEqual(Student[2].group, g2)
+    def test_bulk_update_with_join(self):
+        select(s for s in Student for s2 in Student if s2.group == s.group and s2.gpa < s.gpa).update(scholarship=10)
+        self.assertIn(' IN ', db.last_sql)
+        self.assertEqual(select(s.id for s in Student if s.scholarship == 10).order_by(1)[:], [2, 3])
+    def test_bulk_update_clear_query_cache(self):
+        students1 = Student.select(lambda s: s.scholarship is None)[:]
+        self.assertEqual([s.id for s in students1], [1])
+        Student.select(lambda s: s.id == 1).update(scholarship=1)
+        students2 = Student.select(lambda s: s.scholarship is None)[:]
+        self.assertEqual(students2, [])
+    @raises_exception(TypeError, "Unknown attribute 'foo'")
+    def test_bulk_update_unknown_attr(self):
+        Student.select().update(foo=1)
+    @raises_exception(TypeError, 'Primary key attribute Student.id cannot be updated by query')
+    def test_bulk_update_pk(self):
+        Student.select().update(id=10)
+    @raises_exception(TypeError, 'Update query should be applied to a single entity. Got: s.name')
+    def test_bulk_update_non_entity(self):
+        select(s.name for s in Student).update(name='X')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database, only_for
+
+db = Database()
+
+
+class Group(db.Entity):
+    id = PrimaryKey(int)
+    students = Set('Student')
+
+
+class Student(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    group = Required(Group)
+    bio = Optional(LongStr, lazy=True)
+
+
+class TestQueryIter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            g1 = Group(id=1)
+            g2 = Group(id=2)
+            for i in range(1, 11):
+                Student(id=i, name='S%d' % i, group=g1 if i <= 5 else g2, bio='Bio %d' % i)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    @db_session
+    def test_objects(self):
+        students = list(Student.select().order_by(Student.id).iter(batch_size=3))
+        self.assertEqual([ s.id for s in students ], list(range(1, 11)))
+        self.assertIs(students[0], Student[1])
+
+    @db_session
+    def test_tuples(self):
+        result = list(select((s.name, s.group) for s in Student if s.id < 4).order_by(1).iter(batch_size=2))
+        self.assertEqual(result, [('S1', Group[1]), ('S2', Group[1]), ('S3', Group[1])])
+
+    @db_session
+    def test_release(self):
+        cache = db._get_cache()
+        counts = []
+        for s in Student.select().order_by(Student.id).iter(batch_size=4, release=True):
+            counts.append(len([ obj for obj in cache.objects if isinstance(obj, Student) ]))
+            if s.id == 1: first = s
+        self.assertEqual(counts, [4, 4, 4, 4, 4, 4, 4, 4, 2, 2])
+        self.assertEqual(len([ obj for obj in cache.objects if isinstance(obj, Student) ]), 0)
+        self.assertIsNone(first._session_cache_)
+        self.assertIsNot(Student[1], first)
+
+    @raises_exception(DatabaseSessionIsOver, 'Cannot load attribute Student[1].bio: the database session is over')
+    @db_session
+    def test_release_lazy_attr(self):
+        students = list(Student.select().order_by(Student.id).iter(batch_size=4, release=True))
+        students[0].bio
+
+    @db_session
+    def test_release_modified(self):
+        for s in Student.select().order_by(Student.id).iter(batch_size=4, release=True):
+            if s.id == 1: first = s
+            if s.id == 2:
+                s.name = 'Changed'
+                changed = s
+        self.assertIs(Student[2], changed)
+        self.assertEqual(changed.name, 'Changed')
+        self.assertIsNot(Student[1], first)
+        rollback()
+
+    @db_session
+    def test_release_collection(self):
+        g1 = Group[1]
+        self.assertEqual(len(g1.students), 5)
+        for s in Student.select().iter(batch_size=3, release=True): pass
+        self.assertEqual(g1.students.count(), 5)
+        self.assertEqual(set(s.id for s in g1.students), {1, 2, 3, 4, 5})
+
+    @db_session
+    def test_prefetch(self):
+        students = list(Student.select().order_by(Student.id).prefetch(Student.bio).iter(batch_size=3))
+        self.assertEqual(students[9]._vals_[Student.bio], 'Bio 10')
+
+    @only_for('postgres')
+    def test_server_side_cursor_autocommit(self):
+        # named cursor is opened inside a transaction, so the result is not materialized at commit
+        with db_session:
+            cursors = []
+            for s in Student.select().order_by(Student.id).iter(batch_size=3):
+                cursors.append(db.select('select name, is_holdable from pg_cursors'))
+                self.assertEqual(Group[2].id, 2)
+            self.assertEqual(len(cursors), 10)
+            self.assertEqual(len(cursors[0]), 1)
+            name, is_holdable = cursors[0][0]
+            self.assertTrue(name.startswith('pony_cursor_'))
+            self.assertFalse(is_holdable)
+            self.assertEqual(cursors[9], cursors[0])
+            self.assertEqual(db.select('select name from pg_cursors'), [])
+
+    @only_for('postgres')
+    def test_server_side_cursor_withhold(self):
+        with db_session:
+            cursors = []
+            for s in Student.select().order_by(Student.id).iter(batch_size=3, withhold=True):
+                cursors.append(db.select('select name, is_holdable from pg_cursors'))
+                if s.id == 2: commit()
+            self.assertEqual(len(cursors), 10)
+            name, is_holdable = cursors[0][0]
+            self.assertTrue(name.startswith('pony_cursor_'))
+            self.assertTrue(is_holdable)
+            self.assertEqual(cursors[9], cursors[0])
+            self.assertEqual(db.select('select name from pg_cursors'), [])
+
+    @only_for('postgres')
+    def test_server_side_cursor_in_transaction(self):
+        with db_session:
+            Student[1].name = 'Changed'
+            flush()
+            cursors = []
+            names = []
+            for s in Student.select().order_by(Student.id).iter(batch_size=3):
+                cursors.append(db.select('select name, is_holdable from pg_cursors'))
+                names.append(s.name)
+            self.assertEqual(names[:2], ['Changed', 'S2'])
+            self.assertEqual(len(names), 10)
+            self.assertEqual(len(cursors[0]), 1)
+            name, is_holdable = cursors[0][0]
+            self.assertTrue(name.startswith('pony_cursor_'))
+            self.assertFalse(is_holdable)
+            self.assertEqual(db.select('select name from pg_cursors'), [])
+            rollback()
+
+    @raises_exception(ValueError, 'batch_size must be positive. Got: 0')
+    @db_session
+    def test_batch_size(self):
+        Student.select().iter(batch_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
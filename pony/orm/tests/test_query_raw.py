@@ -0,0 +1,195 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from array import array
+from datetime import date
+
+from pony.orm.core import *
+from pony.orm.core import raw_array_typecodes
+from pony.orm.tests.testutils import *
+from pony.orm.tests import db_params, setup_database, teardown_database
+
+db = Database()
+
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    major = Required(unicode)
+    students = Set('Student')
+
+
+class Student(db.Entity):
+    id = PrimaryKey(int)
+    name = Required(unicode)
+    dob = Optional(date)
+    group = Optional(Group)
+    bio = Optional(LongStr, lazy=True)
+    marks = Set('Mark')
+
+
+class Course(db.Entity):
+    name = Required(unicode)
+    semester = Required(int)
+    PrimaryKey(name, semester)
+    marks = Set('Mark')
+
+
+class Mark(db.Entity):
+    student = Required(Student)
+    course = Required(Course)
+    value = Required(int)
+    PrimaryKey(student, course)
+
+
+class TestQueryRaw(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            g1 = Group(number=101, major='Math')
+            s1 = Student(id=1, name='John', dob=date(2000, 1, 2), group=g1, bio='...')
+            s2 = Student(id=2, name='Mary')
+            c1 = Course(name='Algebra', semester=1)
+            Mark(student=s1, course=c1, value=5)
+            Mark(student=s2, course=c1, value=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    @db_session
+    def test_entity_rows(self):
+        rows = Student.select().order_by(Student.id).raw()
+        self.assertEqual(rows, [(1, 'John', date(2000, 1, 2), 101), (2, 'Mary', None, None)])
+        self.assertFalse(db._get_cache().objects)  # nothing is tracked
+
+    @db_session
+    def test_entity_values(self):
+        result = Student.select(lambda s: s.id == 1).values()
+        self.assertEqual(result, [{'id': 1, 'name': 'John', 'dob': date(2000, 1, 2), 'group': 101}])
+
+    @db_session
+    def test_composite_reference(self):
+        result = Mark.select().order_by(lambda m: m.value).values()
+        self.assertEqual(result, [{'student': 2, 'course': ('Algebra', 1), 'value': 4},
+                                  {'student': 1, 'course': ('Algebra', 1), 'value': 5}])
+
+    @db_session
+    def test_tuple_rows(self):
+        rows = select((s.name, s.group, s.dob) for s in Student).order_by(1).raw()
+        self.assertEqual(rows, [('John', 101, date(2000, 1, 2)), ('Mary', None, None)])
+        self.assertFalse(db._get_cache().objects)
+
+    @db_session
+    def test_tuple_values(self):
+        result = select((m.course, count()) for m in Mark).values()
+        self.assertEqual(result, [{'m.course': ('Algebra', 1), 'count()': 2}])
+
+    @db_session
+    def test_single_expression(self):
+        self.assertEqual(select(s.name for s in Student).order_by(1).raw(limit=1), [('John',)])
+
+    @db_session
+    def test_one_element_tuple(self):
+        self.assertEqual(select((s.group,) for s in Student if s.id == 1).raw(), [(101,)])
+        columns = select((s.id,) for s in Student).to_columns()
+        self.assertIsInstance(columns['s.id'], array)
+
+    @db_session
+    def test_unsaved_changes(self):
+        Student[2].name = 'Maria'
+        self.assertEqual(select(s.name for s in Student if s.id == 2).raw(), [('Maria',)])
+        rollback()
+
+    @db_session
+    def test_to_columns(self):
+        columns = select((m.student, m.value, m.course) for m in Mark).order_by(2).to_columns(batch_size=1)
+        self.assertEqual(sorted(columns), ['m.course', 'm.student', 'm.value'])
+        self.assertIsInstance(columns['m.value'], array)
+        self.assertEqual(list(columns['m.value']), [4, 5])
+        self.assertEqual(list(columns['m.student']), [2, 1])
+        self.assertEqual(columns['m.course'], [('Algebra', 1), ('Algebra', 1)])
+        self.assertFalse(db._get_cache().objects)
+
+    @db_session
+    def test_to_columns_nulls(self):
+        columns = Student.select().order_by(Student.id).to_columns()
+        self.assertEqual(list(columns['id']), [1, 2])
+        self.assertEqual(columns['name'], ['John', 'Mary'])
+        self.assertEqual(columns['dob'], [date(2000, 1, 2), None])
+        self.assertEqual(columns['group'], [101, None])
+
+    @db_session
+    def test_to_columns_float(self):
+        columns = select((m.value * 0.5,) for m in Mark).order_by(1).to_columns()
+        self.assertEqual(list(columns.values()), [array('d', [2.0, 2.5])])
+
+    @db_session
+    def test_to_columns_converted(self):
+        provider = db.provider
+        provider.native_number_values = False
+        try: columns = select((m.value, m.student) for m in Mark).order_by(1).to_columns(batch_size=1)
+        finally: del provider.native_number_values
+        self.assertEqual(columns, {'m.value': array(raw_array_typecodes[int], [4, 5]),
+                                   'm.student': array(raw_array_typecodes[int], [2, 1])})
+
+    @db_session
+    def test_to_columns_empty(self):
+        columns = select((s.id, s.name) for s in Student if s.id > 100).to_columns()
+        self.assertEqual(columns, {'s.id': array(raw_array_typecodes[int]), 's.name': []})
+
+    @db_session
+    def test_to_numpy(self):
+        try: import numpy
+        except ImportError: raise unittest.SkipTest('numpy is not installed')
+        columns = select((m.value, m.course) for m in Mark).order_by(1).to_numpy()
+        self.assertEqual(columns['m.value'].dtype, numpy.int64)
+        self.assertEqual(columns['m.value'].tolist(), [4, 5])
+
+
+db2 = Database()
+
+
+class Document(db2.Entity):
+    id = PrimaryKey(int)
+    data = Optional(Json)
+    tags = Optional(IntArray)
+
+
+class TestQueryRawJson(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if db_params['provider'] not in ('sqlite', 'postgres'):
+            raise unittest.SkipTest('Arrays are only available for SQLite and PostgreSQL')
+        setup_database(db2)
+        with db_session:
+            Document(id=1, data={'a': [1, 2]}, tags=[1, 2, 3])
+            Document(id=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db2)
+
+    @db_session
+    def test_entity_rows(self):
+        rows = Document.select().order_by(Document.id).raw()
+        self.assertEqual(rows, [(1, {'a': [1, 2]}, [1, 2, 3]), (2, {}, [])])
+
+    @db_session
+    def test_values(self):
+        result = Document.select(lambda d: d.id == 1).values()
+        self.assertEqual(result, [{'id': 1, 'data': {'a': [1, 2]}, 'tags': [1, 2, 3]}])
+        self.assertFalse(db2._get_cache().objects)
+
+    @db_session
+    def test_tuple_rows(self):
+        self.assertEqual(select((d.data, d.tags) for d in Document if d.id == 1).raw(), [({'a': [1, 2]}, [1, 2, 3])])
+
+    @db_session
+    def test_to_columns(self):
+        columns = Document.select().order_by(Document.id).to_columns()
+        self.assertEqual(columns['data'], [{'a': [1, 2]}, {}])
+
+
+if __name__ == '__main__':
+    unittest.main()
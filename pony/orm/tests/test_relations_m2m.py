@@ -290,5 +290,12 @@ class TestManyToManyNonComposite(unittest.TestCase):
         self.assertEqual(db.last_sql, None)
 
 
+    def test_18(self):
+        with db_session:
+            subjects = Subject.select().order_by(Subject.name)[:]
+            self.assertEqual([ s.groups.count() for s in subjects ], [1, 1, 0, 0])
+            self.assertIn('GROUP BY', db.last_sql)  # the last three counts are loaded by a single query
+            self.assertEqual(db.local_stats[db.last_sql].db_count, 1)
+
 if __name__ == "__main__":
     unittest.main()
@@ -188,6 +188,40 @@ class TestOneToManyRequired(unittest.TestCase):
         self.assertTrue(s5 in g.students)
         self.assertEqual(s5._rbits_, None)
 
+    def test_13(self):
+        db, Group = self.db, self.Group
+        g101, g102, g103 = Group.select().order_by(Group.number)[:]
+        self.assertEqual(g101.students.count(), 2)
+        self.assertEqual(g102.students.count(), 2)  # counts of other groups are loaded by the same query
+        self.assertIn('GROUP BY', db.last_sql)
+        db._dblocal.last_sql = None
+        self.assertEqual(g103.students.count(), 0)
+        self.assertTrue(g103.students.is_empty())
+        self.assertEqual(db.last_sql, None)
+
+    def test_14(self):
+        db, Group, Student = self.db, self.Group, self.Student
+        g101, g102, g103 = Group.select().order_by(Group.number)[:]
+        g102.students.add(Student(id=5, name='Student5', group=g102))
+        self.assertFalse(g101.students.is_empty())
+        self.assertTrue(g103.students.is_empty())
+        self.assertIn('GROUP BY', db.last_sql)
+        db._dblocal.last_sql = None
+        self.assertEqual(g102.students.count(), 3)
+        self.assertEqual(db.last_sql, None)
+
+    def test_15(self):
+        db, Group = self.db, self.Group
+        Group.insert_many([ dict(number=104) ])
+        g101, g102 = Group.select(lambda g: g.number <= 102).order_by(Group.number)[:]
+        self.assertEqual(g101.students.count(), 2)
+        self.assertEqual(g102.students.count(), 2)
+        g103, g104 = Group.select(lambda g: g.number > 102).order_by(Group.number)[:]
+        self.assertEqual(g103.students.count(), 0)  # objects loaded after the previous batch are batched too
+        db._dblocal.last_sql = None
+        self.assertTrue(g104.students.is_empty())
+        self.assertEqual(db.last_sql, None)
+
 class TestOneToManyOptional(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,104 @@
+from __future__ import absolute_import, print_function, division
+
+import os, shutil, sqlite3, tempfile, unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import only_for
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+@only_for('sqlite')
+class TestReplicas(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = tempfile.mkdtemp()
+        primary = os.path.join(cls.dirname, 'primary.sqlite')
+        db.bind('sqlite', primary, create_db=True)
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            Person(id=1, name='John', age=20)
+        db.disconnect()
+        for name in 'replica1', 'replica2':
+            filename = os.path.join(cls.dirname, name + '.sqlite')
+            shutil.copy(primary, filename)
+            con = sqlite3.connect(filename)
+            con.execute('update Person set name = ?', [name])  # marks the source of data
+            con.commit()
+            con.close()
+            db.bind_replica('sqlite', filename)
+        cls.replica1, cls.replica2 = db.replicas
+
+    @classmethod
+    def tearDownClass(cls):
+        db.disconnect()
+        shutil.rmtree(cls.dirname)
+
+    def setUp(self):
+        db.replica_routing = 'round_robin'
+        db.replica_autocommit_reads = False
+
+    def test_round_robin(self):
+        names = set()
+        for i in range(4):
+            with db_session(readonly=True):
+                names.add(Person[1].name)
+        self.assertEqual(names, {'replica1', 'replica2'})
+
+    def test_least_connections(self):
+        db.replica_routing = 'least_connections'
+        with db_session(readonly=True):
+            self.assertEqual(Person[1].name, 'replica1')
+            self.assertEqual(db._replica_connections[self.replica1], 1)
+        self.assertEqual(db._replica_connections[self.replica1], 0)
+
+    def test_for_update(self):
+        with db_session(readonly=True):
+            self.assertEqual(Person.get_for_update(id=1).name, 'John')
+
+    def test_write(self):
+        db.replica_autocommit_reads = True
+        with db_session:
+            p = Person[1]
+            self.assertTrue(p.name.startswith('replica'))
+            Person(id=2, name='Mike', age=30)
+            flush()
+            self.assertEqual(select(p.name for p in Person if p.id == 2)[:], ['Mike'])
+        with db_session:
+            self.assertRaises(ObjectNotFound, Person.__getitem__, 2)  # replicas are not updated in this test
+            db.execute('delete from Person where id = 2')
+        self.assertEqual(db._replica_connections, {self.replica1: 0, self.replica2: 0})
+
+    def test_read_write_session(self):
+        # by default only readonly sessions use replicas, so a new session sees previously committed changes
+        with db_session:
+            self.assertEqual(Person[1].name, 'John')
+            Person(id=2, name='Mike', age=30)
+        with db_session:
+            self.assertEqual(Person[2].name, 'Mike')
+            Person[2].delete()
+        self.assertEqual(db._replica_connections, {self.replica1: 0, self.replica2: 0})
+
+    @raises_exception(TransactionError, 'Changes cannot be saved in readonly db_session')
+    def test_readonly_write(self):
+        with db_session(readonly=True):
+            Person[1].age += 1
+
+    @raises_exception(TypeError, "'readonly' parameter of db_session cannot be used together with "
+                                 "'immediate', 'ddl', 'serializable' or 'optimistic=False'")
+    def test_readonly_immediate(self):
+        db_session(readonly=True, immediate=True)
+
+    @raises_exception(TypeError, 'Replica should use the same provider as the primary database: sqlite')
+    def test_other_provider(self):
+        db.bind_replica(provider='postgres', database='test')
+
+
+if __name__ == '__main__':
+    unittest.main()
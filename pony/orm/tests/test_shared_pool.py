@@ -0,0 +1,133 @@
+from __future__ import absolute_import, print_function, division
+
+import os, shutil, tempfile, threading, unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import only_for
+
+
+def make_database(filename, **kwargs):
+    db = Database()
+
+    class Person(db.Entity):
+        name = Required(unicode)
+
+    db.bind('sqlite', filename, create_db=True, **kwargs)
+    db.generate_mapping(create_tables=True)
+    with db_session: db.select('select 1')
+    return db
+
+
+@only_for('sqlite')
+class TestSharedPool(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'test.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def run_in_thread(self, db, started, finish):
+        def func():
+            with db_session:
+                db.select('select 1')
+                started.set()
+                finish.wait(5)
+        thread = threading.Thread(target=func)
+        thread.start()
+        started.wait(5)
+        return thread
+
+    def test_reuse(self):
+        db = make_database(self.filename, pool_size=2)
+        connects = db.pool_stats['connects']
+        for i in range(3):
+            with db_session: db.select('select 1')
+        self.assertEqual(db.pool_stats['connects'], connects)
+        threads = [ threading.Thread(target=db_session(lambda: db.select('select 1'))) for i in range(5) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        stats = db.pool_stats
+        self.assertLessEqual(stats['opened'], 2)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertLessEqual(stats['connects'], connects + 1)
+        db.disconnect()
+        self.assertEqual(db.pool_stats['opened'], 0)
+
+    def test_overflow(self):
+        db = make_database(self.filename, pool_size=1, max_overflow=1)
+        started, finish = threading.Event(), threading.Event()
+        thread = self.run_in_thread(db, started, finish)
+        with db_session:
+            db.select('select 1')
+            self.assertEqual(db.pool_stats['opened'], 2)
+        self.assertEqual(db.pool_stats['idle'], 1)
+        finish.set()
+        thread.join()
+        self.assertEqual(db.pool_stats['opened'], 1)
+        self.assertEqual(db.pool_stats['idle'], 1)
+
+    def test_timeout(self):
+        db = make_database(self.filename, pool_size=1, pool_timeout=0.05)
+        started, finish = threading.Event(), threading.Event()
+        thread = self.run_in_thread(db, started, finish)
+        try:
+            with db_session:
+                with self.assertRaises(PoolTimeoutError): db.select('select 1')
+        finally:
+            finish.set()
+            thread.join()
+        stats = db.pool_stats
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['wait_time'], 0)
+        with db_session: db.select('select 1')
+
+    def test_wait(self):
+        db = make_database(self.filename, pool_size=1, pool_timeout=5)
+        started, finish = threading.Event(), threading.Event()
+        thread = self.run_in_thread(db, started, finish)
+        threading.Timer(0.05, finish.set).start()
+        with db_session: db.select('select 1')
+        thread.join()
+        self.assertEqual(db.pool_stats['waits'], 1)
+        self.assertEqual(db.pool_stats['opened'], 1)
+
+    def test_recycle(self):
+        db = make_database(self.filename, pool_size=1, pool_recycle=0)
+        connects, recycled = db.pool_stats['connects'], db.pool_stats['recycled']
+        with db_session: db.select('select 1')
+        self.assertEqual(db.pool_stats['recycled'], recycled + 1)
+        self.assertEqual(db.pool_stats['connects'], connects + 1)
+
+    def test_pre_ping(self):
+        db = make_database(self.filename, pool_size=1, pool_pre_ping=True)
+        db.provider.pool.shared.idle[0].con.close()
+        with db_session: self.assertEqual(db.select('select 1'), [1])
+        self.assertEqual(db.pool_stats['failed_pings'], 1)
+
+    def test_fork(self):
+        db = make_database(self.filename, pool_size=1)
+        shared = db.provider.pool.shared
+        connects = shared.connects
+        shared.pid = -1  # emulate child process
+        with db_session: db.select('select 1')
+        self.assertEqual(db.pool_stats['opened'], 1)
+        self.assertEqual(db.pool_stats['connects'], connects + 1)
+
+    @raises_exception(TypeError, 'Shared connection pool cannot be used with in-memory SQLite database')
+    def test_memory(self):
+        Database('sqlite', ':memory:', pool_size=5)
+
+    @raises_exception(TypeError, 'pool_size should be specified in order to use shared connection pool')
+    def test_no_pool_size(self):
+        Database('sqlite', self.filename, create_db=True, max_overflow=5)
+
+    def test_thread_local_pool(self):
+        db = make_database(self.filename)
+        self.assertIsNone(db.pool_stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+from __future__ import absolute_import, print_function, division
+
+import os, marshal, shutil, tempfile, unittest
+
+from pony.orm.core import *
+from pony.orm import decompiling
+from pony.orm.tests.testutils import *
+from pony.orm.tests import db_params, teardown_database
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+class TestTranslationCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.dirname, 'translation.cache')
+        db.bind(**db_params)
+        db.generate_mapping(check_tables=False, translation_cache=cls.filename)
+        db.drop_all_tables(with_all_data=True)
+        db.create_tables()
+        with db_session:
+            Person(name='John', age=20)
+            Person(name='Mary', age=30)
+
+    @classmethod
+    def tearDownClass(cls):
+        decompiling.translation_cache = None
+        teardown_database(db)
+        shutil.rmtree(cls.dirname)
+
+    def query(self, x):
+        return select(p.name for p in Person if p.age > x)[:]
+
+    def test_warm_start(self):
+        with db_session:
+            self.assertEqual(self.query(25), ['Mary'])
+        decompiling.save_translation_cache()
+        self.assertTrue(os.path.exists(self.filename))
+
+        # emulate new process
+        code = next(const for const in self.query.__code__.co_consts if hasattr(const, 'co_code'))
+        decompiling.translation_cache = None
+        cache = decompiling.use_translation_cache(self.filename)
+        self.assertIsNotNone(cache.get_ast(code))
+        decompiling.ast_cache.clear()
+        decompiler_cls = decompiling.Decompiler
+        decompiling.Decompiler = None
+        try:
+            with db_session:
+                self.assertEqual(set(self.query(10)), {'John', 'Mary'})
+        finally:
+            decompiling.Decompiler = decompiler_cls
+
+    def test_version_mismatch(self):
+        cache = decompiling.TranslationCache(self.filename)
+        cache.version = 'other'
+        self.assertEqual(cache.load(), {})
+
+    def test_broken_file(self):
+        filename = os.path.join(self.dirname, 'broken.cache')
+        with open(filename, 'wb') as f: f.write(b'garbage')
+        cache = decompiling.TranslationCache(filename)
+        self.assertEqual(cache.entries, {})
+
+    def test_round_trip(self):
+        tree = decompiling.decompile(lambda x: x.a[1:, ...] > {'k': b'v', 'n': None} and -1.5 < x.b)
+        tree = tree[0], tree[1]
+        encoded = decompiling.encode_ast(tree)
+        decoded = decompiling.decode_ast(marshal.loads(marshal.dumps(encoded)))
+        self.assertEqual(repr(decoded), repr(tree))
+        self.assertEqual(decompiling.encode_ast(decoded), encoded)
+
+    def test_unknown_node(self):
+        for encoded in [('node', 'TranslationCache', {}), ('node', 'os', {}), ('object', ()), ('value', [])]:
+            with self.assertRaises(ValueError):
+                decompiling.decode_ast(encoded)
+
+    def test_concurrent_save(self):
+        filename = os.path.join(self.dirname, 'shared.cache')
+        codes = [(lambda x: x.a > 1).__code__, (lambda x: x.b < 2).__code__]
+        caches = []
+        for code in codes:
+            cache = decompiling.TranslationCache(filename)
+            cache.put_ast(code, decompiling.Decompiler(code).ast)
+            caches.append(cache)
+        for cache in caches: cache.save()
+        cache = decompiling.TranslationCache(filename)
+        self.assertEqual(len(cache.entries), 2)
+        self.assertEqual([name for name in os.listdir(self.dirname) if name.endswith('.tmp')], [])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'requires file owners')
+    def test_foreign_owner(self):
+        filename = os.path.join(self.dirname, 'owned.cache')
+        code = (lambda x: x.a > 1).__code__
+        cache = decompiling.TranslationCache(filename)
+        cache.put_ast(code, decompiling.Decompiler(code).ast)
+        cache.save()
+        self.assertNotEqual(cache.load(), {})
+        getuid = os.getuid
+        os.getuid = lambda: getuid() + 1
+        try: self.assertEqual(cache.load(), {})
+        finally: os.getuid = getuid
+
+
+if __name__ == '__main__':
+    unittest.main()
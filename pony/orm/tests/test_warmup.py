@@ -0,0 +1,78 @@
+from __future__ import absolute_import, print_function, division
+
+import gc, types, unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.orm.tests import setup_database, teardown_database
+
+db = Database()
+
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+
+
+class TestWarmup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_database(db)
+        with db_session:
+            Person(id=1, name='John', age=20)
+
+    @classmethod
+    def tearDownClass(cls):
+        teardown_database(db)
+
+    def test_query(self):
+        query = select(p.name for p in Person if p.age > 18)
+        misses = db.cache_stats['sql']['misses']
+        last_sql = db.last_sql
+        sql, = db.warmup(query)
+        self.assertEqual(db.cache_stats['sql']['misses'], misses + 1)
+        self.assertEqual(db.last_sql, last_sql)
+        with db_session:
+            self.assertEqual(query[:], ['John'])
+            self.assertEqual(db.last_sql, sql)
+        self.assertEqual(db.cache_stats['sql']['misses'], misses + 1)
+
+    def test_function(self):
+        sql, = db.warmup(lambda: Person.select(lambda p: p.name.startswith('J')).order_by(Person.age).limit(5))
+        self.assertIn('LIMIT', sql.upper())
+
+    def test_entity(self):
+        sql, = db.warmup(Person)
+        with db_session:
+            Person[1]
+            self.assertEqual(db.last_sql, sql)
+
+    def test_module(self):
+        module = types.ModuleType('queries')
+        module.Person = Person
+        module.adults = select(p for p in Person if p.age >= 18)
+        module.other = 1
+        self.assertEqual(len(db.warmup(module)), 2)
+
+    @raises_exception(TypeError, 'Warmup function should return a query. Got: 1')
+    def test_not_query(self):
+        db.warmup(lambda: 1)
+
+    def test_prepare_for_fork(self):
+        with db_session:
+            self.assertEqual(Person[1].name, 'John')
+        db.prepare_for_fork()
+        if hasattr(gc, 'freeze'):
+            self.assertGreater(gc.get_freeze_count(), 0)
+            gc.unfreeze()
+        with db_session:
+            self.assertEqual(Person[1].name, 'John')
+
+    @raises_exception(TransactionError, 'prepare_for_fork() cannot be called inside of db_session')
+    @db_session
+    def test_prepare_for_fork_in_session(self):
+        db.prepare_for_fork()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ from datetime import datetime
 from itertools import count as _count
 from inspect import isfunction
 from time import strptime
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import update_wrapper, wraps
 from xml.etree import cElementTree
 from copy import deepcopy
@@ -21,6 +21,8 @@ from pony.thirdparty.decorator import decorator as _decorator
 if pony.MODE.startswith('GAE-'): localbase = object
 else: from threading import local as localbase
 
+from threading import Lock
+
 
 class PonyDeprecationWarning(DeprecationWarning):
     pass
@@ -433,6 +435,58 @@ class HashableDict(dict):
     setdefault = _hashable_wrap(dict.setdefault)
     update = _hashable_wrap(dict.update)
 
+class LRUCache(object):
+    # Thread-safe dict-like cache with limited size, the least recently used items are evicted first.
+    # maxsize=None means unlimited size, on_evict(key, value) is called for each evicted item
+    def __init__(cache, maxsize=None, on_evict=None):
+        cache.maxsize = maxsize
+        cache.on_evict = on_evict
+        cache._data = OrderedDict()
+        cache._lock = Lock()
+        cache.hits = cache.misses = cache.evictions = 0
+    def get(cache, key, default=None):
+        with cache._lock:
+            data = cache._data
+            try: value = data.pop(key)
+            except KeyError:
+                cache.misses += 1
+                return default
+            data[key] = value
+            cache.hits += 1
+            return value
+    def __setitem__(cache, key, value):
+        with cache._lock:
+            data = cache._data
+            data.pop(key, None)
+            data[key] = value
+            cache._evict()
+    def _evict(cache):
+        data = cache._data
+        maxsize = cache.maxsize
+        if maxsize is None: return
+        while len(data) > maxsize:
+            key, value = data.popitem(last=False)
+            cache.evictions += 1
+            if cache.on_evict is not None: cache.on_evict(key, value)
+    def resize(cache, maxsize):
+        with cache._lock:
+            cache.maxsize = maxsize
+            cache._evict()
+    def __delitem__(cache, key):
+        with cache._lock: del cache._data[key]
+    def pop(cache, key, default=None):
+        with cache._lock: return cache._data.pop(key, default)
+    def __contains__(cache, key):
+        return key in cache._data
+    def __len__(cache):
+        return len(cache._data)
+    def clear(cache):
+        with cache._lock: cache._data.clear()
+    def stats(cache):
+        with cache._lock:
+            return dict(size=len(cache._data), maxsize=cache.maxsize,
+                        hits=cache.hits, misses=cache.misses, evictions=cache.evictions)
+
 def deref_proxy(value):
     t = type(value)
     if t.__name__ == 'LocalProxy' and '_get_current_object' in t.__dict__: